@@ -1,12 +1,9 @@
 import asyncio
 import math
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from matplotlib.patches import Rectangle
+import json
 from collections import deque
+from contextlib import redirect_stdout
 import numpy as np
-from bleak import BleakClient, BleakScanner
-from struct import pack, unpack
 import time
 from datetime import datetime
 import threading
@@ -14,65 +11,320 @@ import os
 import warnings
 import sys
 
+from jump_analysis import estimate_jump_height, estimate_jump_power
+from mesh_ble import MeshConnection, default_cache, default_discovery
+from mesh_decoder import EVENT_NAMES, decode_frames
+from mesh_journal import JournalReplay, JournalWriter, SimulatedMotionBlock
+from mesh_latency import PipelineStats
+from mesh_recorder import StreamRecorder
+
 # 警告を抑制
 warnings.filterwarnings('ignore')
 os.environ['TK_SILENCE_DEPRECATION'] = '1'
 
-# 日本語フォント設定（japanize_matplotlibを使用）
-try:
-    import japanize_matplotlib
-    print("✅ japanize_matplotlib を使用して日本語フォントを設定しました")
-except ImportError:
-    print("⚠️ japanize_matplotlib がインストールされていません")
-    print("   pip install japanize-matplotlib でインストールしてください")
-    # フォールバック設定
+# matplotlib はグラフ表示時にだけ読み込む（ヘッドレスモードでは読み込まない）
+plt = None
+animation = None
+PolyCollection = None
+to_rgba_array = None
+
+def setup_matplotlib():
+    """matplotlib を読み込み、日本語フォントを設定"""
+    global plt, animation, PolyCollection, to_rgba_array
+    if plt is not None:
+        return
     import matplotlib
-    matplotlib.rcParams['font.family'] = ['DejaVu Sans', 'Hiragino Sans', 'Yu Gothic', 'Meiryo', 'Takao', 'IPAexGothic', 'IPAPGothic', 'VL PGothic', 'Noto Sans CJK JP']
-
-# UUID (MESHブロック共通)
-CORE_INDICATE_UUID = ('72c90005-57a9-4d40-b746-534e22ec9f9e')
-CORE_NOTIFY_UUID = ('72c90003-57a9-4d40-b746-534e22ec9f9e')
-CORE_WRITE_UUID = ('72c90004-57a9-4d40-b746-534e22ec9f9e')
-
-# 定数値
-MESSAGE_TYPE_ID = 0x01
-EVENT_TYPE_TAP = 0x00
-EVENT_TYPE_SHAKE = 0x01
-EVENT_TYPE_FLIP = 0x02
-EVENT_TYPE_ORIENTATION = 0x03
-
-class DataVisualizer:
-    def __init__(self, max_points=300):
+    import matplotlib.pyplot as plt
+    import matplotlib.animation as animation
+    from matplotlib.collections import PolyCollection
+    from matplotlib.colors import to_rgba_array
+    
+    # 日本語フォント設定（japanize_matplotlibを使用）
+    try:
+        import japanize_matplotlib
+        print("✅ japanize_matplotlib を使用して日本語フォントを設定しました")
+    except ImportError:
+        print("⚠️ japanize_matplotlib がインストールされていません")
+        print("   pip install japanize-matplotlib でインストールしてください")
+        # フォールバック設定
+        matplotlib.rcParams['font.family'] = ['DejaVu Sans', 'Hiragino Sans', 'Yu Gothic', 'Meiryo', 'Takao', 'IPAexGothic', 'IPAPGothic', 'VL PGothic', 'Noto Sans CJK JP']
+
+# ジャンプ段階ごとの表示色（0:待機, 1:離陸, 2:空中, 3:着地）
+PHASE_COLORS = ['lightgray', 'lightcoral', 'lightblue', 'lightgreen']
+
+def phase_segments(times, phases):
+    """連続する同じジャンプ段階をランレングス圧縮し (開始時刻, 終了時刻, 段階) の配列を返す
+
+    サンプル i の段階は区間 [times[i-1], times[i]] に対応する。
+    """
+    if len(times) < 2:
+        empty = np.empty(0)
+        return empty, empty, np.empty(0, dtype=int)
+    segment_phases = np.asarray(phases[1:], dtype=int)
+    changes = np.flatnonzero(np.diff(segment_phases)) + 1
+    starts = np.concatenate(([0], changes))
+    ends = np.concatenate((changes, [len(segment_phases)]))
+    return times[:-1][starts], times[1:][ends - 1], segment_phases[starts]
+
+class SampleRingBuffer:
+    """全チャンネルを1つの float64 配列にまとめて保持するリングバッファ
+
+    時刻の列は float32 では長時間の計測で精度が落ちるため、全列を float64 で持つ。
+
+    各サンプルを位置 i と i + capacity の2か所に書き込むことで、
+    直近のサンプル列を常に連続したスライス（コピーなしのビュー）として取り出せる。
+    """
+    COLUMNS = ('time', 'x', 'y', 'z', 'total', 'phase', 'state')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._index = {name: i for i, name in enumerate(self.COLUMNS)}
+        self._buf = np.zeros((len(self.COLUMNS), capacity * 2), dtype=np.float64)
+        self._pos = 0    # 次に書き込む位置 (0 <= _pos < capacity)
+        self._count = 0  # 有効なサンプル数
+
+    def __len__(self):
+        return self._count
+
+    def append(self, row):
+        """1サンプル（COLUMNS の順の値）を追加"""
+        i = self._pos
+        self._buf[:, i] = row
+        self._buf[:, i + self.capacity] = row
+        self._pos = (i + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+
+    def _window(self):
+        end = self._pos + self.capacity
+        return end - self._count, end
+
+    def view(self, name=None):
+        """古い順に並んだビューを返す（name 指定時は1チャンネル、省略時は全チャンネル）
+
+        返り値はバッファのビューなので、次の追加で内容が変わる点に注意。
+        """
+        start, end = self._window()
+        if name is None:
+            return self._buf[:, start:end]
+        return self._buf[self._index[name], start:end]
+
+
+class PacketHandoff:
+    """BLE スレッドから描画スレッドへ通知パケットを渡すキュー（単一生産者・単一消費者）
+
+    collections.deque の append / popleft は CPython ではアトミックなのでロックを取らない。
+    BLE 側は受信時刻とバイト列を積むだけで、デコードやジャンプ検出は消費側がまとめて行う。
+    """
+    def __init__(self):
+        self._packets = deque()
+    
+    def put(self, data, timestamp=None):
+        """受信した通知を積む（BLE コールバックから呼ぶ）"""
+        if timestamp is None:
+            timestamp = time.time()
+        self._packets.append((timestamp, bytes(data)))
+    
+    def drain(self):
+        """現時点で溜まっているパケットをすべて取り出す"""
+        packets = self._packets
+        return [packets.popleft() for _ in range(len(packets))]
+    
+    def __len__(self):
+        return len(self._packets)
+
+
+def format_jump_event_row(event):
+    """ジャンプイベントを jump_events CSV の1行に整形"""
+    if event['type'] == 'complete':
+        details = event['details']
+        return (f"complete,{event['time']:.3f},{details.get('duration', 0):.3f},"
+                f"{details.get('height', 0):.1f},{details.get('power', 0):.1f},"
+                f"{details.get('max_acc', 0):.3f},{details.get('min_acc', 0):.3f}")
+    return f"{event['type']},{event['time']:.3f},,,,"
+
+
+def default_save_root():
+    """データ保存先のルートディレクトリを返す（作成できなければカレントディレクトリ）"""
+    # 保存場所を指定
+    base_dir = "C:/Briefcase/__python/mesh"
+    
+    # ディレクトリが存在しない場合は作成
+    try:
+        os.makedirs(base_dir, exist_ok=True)
+    except Exception as e:
+        print(f"⚠️ 指定ディレクトリの作成に失敗: {e}")
+        print("   カレントディレクトリに保存します")
+        base_dir = os.getcwd()
+    return base_dir
+
+
+class SensorSession:
+    """動きブロック1台分の計測データ（リングバッファ・ジャンプイベント・逐次記録）"""
+    def __init__(self, max_points=300, binary_log=False, name=None, save_dir=None, start_time=None,
+                 record_raw=False):
         self.max_points = max_points
-        self.times = deque(maxlen=max_points)
-        self.x_data = deque(maxlen=max_points)
-        self.y_data = deque(maxlen=max_points)
-        self.z_data = deque(maxlen=max_points)
-        self.total_data = deque(maxlen=max_points)
+        self.name = name
+        # 時刻・3軸・合成加速度・ジャンプ段階・ジャンプ状態を1つのリングバッファで保持
+        self.samples = SampleRingBuffer(max_points)
         
         # ジャンプ検出状態の記録
         self.jump_events = []
-        self.jump_phases = deque(maxlen=max_points)
-        self.jump_states = deque(maxlen=max_points)
+        self.completed_jumps = 0
+        self.best_height = 0.0
         
         # 自動保存用の設定
         self.session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        if save_dir is None:
+            save_dir = os.path.join(default_save_root(), f"mesh_data_{self.session_id}")
+        self.save_dir = save_dir
+        os.makedirs(self.save_dir, exist_ok=True)
+        
+        # 計測データとジャンプイベントを追記専用ファイルへ逐次記録（書き込みは別スレッド）
+        self.recorder = StreamRecorder(
+            self.save_dir, 'acceleration_data',
+            header=['Time', 'X_G', 'Y_G', 'Z_G', 'Total_G', 'Jump_Phase', 'Jump_State'],
+            fmt=['%.3f'] * 5 + ['%d', '%d'],
+            binary=binary_log)
+        self.event_recorder = StreamRecorder(
+            self.save_dir, 'jump_events',
+            header=['Event_Type', 'Time', 'Duration', 'Height', 'Power', 'Max_Acc', 'Min_Acc'],
+            formatter=format_jump_event_row)
+        # 受信した生パケットのジャーナル（再生・回帰テスト用）
+        self.journal = None
+        if record_raw:
+            self.journal = JournalWriter(os.path.join(self.save_dir, 'raw_packets.mjl'))
+        
+        # 開始時刻
+        self.start_time = time.time() if start_time is None else start_time
+        
+        # データロック
+        self.data_lock = threading.Lock()
+        
+        # BLE スレッドからの受信パケット（消費側で process_pending_packets を呼んで処理する）
+        self.packets = PacketHandoff()
+        self.detector = None
+        self.verbose = True  # False なら受信データを1件ずつ表示しない
+        
+        # ジャンプイベント発生時に listener(session, event) を呼ぶ
+        self.event_listeners = []
         
-        # 保存場所を指定
-        base_dir = "C:/Briefcase/__python/mesh"
+        # 段階ごとの所要時間（デコード・ジャンプ検出・ロック待ち・描画など）
+        self.stats = PipelineStats()
         
-        # ディレクトリが存在しない場合は作成
+        print(f"📊 データ保存ディレクトリ: {self.save_dir}")
+        
+    def receive(self, data, timestamp=None):
+        """BLE 通知を受け取る（受け渡しキューに積み、ジャーナルがあれば記録する）"""
+        if timestamp is None:
+            timestamp = time.time()
+        self.packets.put(data, timestamp)
+        if self.journal:
+            self.journal.write(timestamp, bytes(data))
+    
+    def process_pending_packets(self, label=None):
+        """受け渡しキューに溜まった通知をまとめてデコードし、ジャンプ検出に回す"""
+        packets = self.packets.drain()
+        if packets:
+            timestamps, frames = zip(*packets)
+            process_motion_frames(self.detector, timestamps, frames, label, self.verbose, self.stats)
+    
+    def add_data(self, x_g, y_g, z_g, jump_detector, timestamp=None):
+        """新しいデータを追加"""
+        if timestamp is None:
+            timestamp = time.time()
+        wait_start = time.perf_counter()
+        with self.data_lock:
+            self.stats.record('lock_wait_add_data', time.perf_counter() - wait_start)
+            current_time = timestamp - self.start_time
+            total_g = math.sqrt(x_g**2 + y_g**2 + z_g**2)
+            
+            # ジャンプ状態を記録
+            if jump_detector.is_jumping:
+                if jump_detector.jump_phase == 'takeoff':
+                    phase_num = 1
+                elif jump_detector.jump_phase == 'airborne':
+                    phase_num = 2
+                elif jump_detector.jump_phase == 'landing':
+                    phase_num = 3
+                else:
+                    phase_num = 1
+            else:
+                phase_num = 0
+                
+            row = (current_time, x_g, y_g, z_g, total_g,
+                   phase_num, 1 if jump_detector.is_jumping else 0)
+            self.samples.append(row)
+        
+        # ファイルへの書き込みは記録スレッドに任せる（ここではキューに積むだけ）
+        self.recorder.write(row)
+    
+    def add_jump_event(self, event_type, timestamp, details):
+        """ジャンプイベントを記録"""
+        relative_time = timestamp - self.start_time
+        event = {
+            'type': event_type,
+            'time': relative_time,
+            'details': details
+        }
+        self.jump_events.append(event)
+        if event_type == 'complete':
+            self.completed_jumps += 1
+            self.best_height = max(self.best_height, details['height'])
+        self.event_recorder.write(event)
+        for listener in self.event_listeners:
+            listener(self, event)
+    
+    def close_recorders(self):
+        """記録キューに残っているデータを書き出してファイルを閉じる"""
+        self.recorder.close()
+        self.event_recorder.close()
+        if self.journal:
+            self.journal.close()
+    
+    def finish(self):
+        """記録を終了し、セッションサマリーを保存"""
         try:
-            os.makedirs(base_dir, exist_ok=True)
+            # 最終データ保存（未書き込み分を書き出して記録を終了）
+            self.close_recorders()
+            
+            # サマリー情報保存
+            summary_file = os.path.join(self.save_dir, f"session_summary_{self.session_id}.txt")
+            with open(summary_file, 'w', encoding='utf-8') as f:
+                f.write(f"MESH加速度測定セッション サマリー\n")
+                f.write(f"セッションID: {self.session_id}\n")
+                if self.name:
+                    f.write(f"デバイス: {self.name}\n")
+                f.write(f"測定開始時刻: {datetime.fromtimestamp(self.start_time).strftime('%Y-%m-%d %H:%M:%S')}\n")
+                f.write(f"測定終了時刻: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+                f.write(f"総測定時間: {(time.time() - self.start_time):.1f}秒\n")
+                f.write(f"データポイント数: {self.recorder.rows_written}\n")
+                f.write(f"ジャンプイベント数: {len([e for e in self.jump_events if e['type'] == 'complete'])}\n")
+                
+                if self.jump_events:
+                    completed_jumps = [e for e in self.jump_events if e['type'] == 'complete']
+                    if completed_jumps:
+                        heights = [e['details']['height'] for e in completed_jumps]
+                        powers = [e['details']['power'] for e in completed_jumps]
+                        f.write(f"最大ジャンプ高: {max(heights):.1f}cm\n")
+                        f.write(f"平均ジャンプ高: {sum(heights)/len(heights):.1f}cm\n")
+                        f.write(f"最大ジャンプ力: {max(powers):.1f}点\n")
+                        f.write(f"平均ジャンプ力: {sum(powers)/len(powers):.1f}点\n")
+            
+            print(f"📋 セッションサマリーを保存しました: {summary_file}")
+            
+            # 段階ごとの所要時間
+            latency_file = os.path.join(self.save_dir, f"latency_{self.session_id}.txt")
+            self.stats.dump(latency_file)
+            print(f"⏱ 処理時間の統計を保存しました: {latency_file}")
         except Exception as e:
-            print(f"⚠️ 指定ディレクトリの作成に失敗: {e}")
-            print("   カレントディレクトリに保存します")
-            base_dir = os.getcwd()
-        
-        self.save_dir = os.path.join(base_dir, f"mesh_data_{self.session_id}")
-        os.makedirs(self.save_dir, exist_ok=True)
-        self.last_save_time = time.time()
-        self.save_interval = 30  # 30秒ごとに自動保存
+            print(f"⚠️ サマリー保存エラー: {e}")
+
+
+class DataVisualizer(SensorSession):
+    def __init__(self, max_points=300, binary_log=False, record_raw=False):
+        super().__init__(max_points, binary_log, record_raw=record_raw)
+        setup_matplotlib()
         
         # グラフ設定
         plt.style.use('default')  # デフォルトスタイルを使用
@@ -115,86 +367,28 @@ class DataVisualizer:
         self.ax3.set_yticklabels(['待機', '離陸', '空中', '着地'], fontsize=9)
         self.ax3.grid(True, alpha=0.3)
         
-        # 開始時刻
-        self.start_time = time.time()
+        # ジャンプ状態の帯: 同じ段階が続く区間を1つの矩形にまとめ、1つのコレクションで描画
+        self.phase_rgba = to_rgba_array(PHASE_COLORS)
+        self.phase_collection = PolyCollection([], alpha=0.7, linewidths=0)
+        self.ax3.add_collection(self.phase_collection)
         
-        # データロック
-        self.data_lock = threading.Lock()
+        # ジャンプイベントマーカー: 固定数のアーティストを使い回す（表示範囲外のものは非表示）
+        self.max_event_markers = 20
+        self.event_markers = []
+        for _ in range(self.max_event_markers):
+            line = self.ax2.axvline(x=0, linestyle='-', linewidth=2, alpha=0.8, visible=False)
+            text = self.ax2.text(0, 2.5, '', rotation=90, fontsize=8, visible=False)
+            self.event_markers.append((line, text))
         
-        print(f"📊 データ保存ディレクトリ: {self.save_dir}")
+        # 表示範囲（秒）と、横スクロールの刻み（秒）
+        # ブリッティングでは軸目盛りが再描画されないため、x軸は刻み単位でまとめてずらす
+        self.window_seconds = 30
+        self.scroll_step = 5
+        self.view_end = None
+        self.frame_interval = 0.05  # 描画間隔（秒）
+        for artist in self._animated_artists():
+            artist.set_animated(True)
         
-    def add_data(self, x_g, y_g, z_g, jump_detector):
-        """新しいデータを追加"""
-        with self.data_lock:
-            current_time = time.time() - self.start_time
-            
-            self.times.append(current_time)
-            self.x_data.append(x_g)
-            self.y_data.append(y_g)
-            self.z_data.append(z_g)
-            
-            total_g = math.sqrt(x_g**2 + y_g**2 + z_g**2)
-            self.total_data.append(total_g)
-            
-            # ジャンプ状態を記録
-            if jump_detector.is_jumping:
-                if jump_detector.jump_phase == 'takeoff':
-                    phase_num = 1
-                elif jump_detector.jump_phase == 'airborne':
-                    phase_num = 2
-                elif jump_detector.jump_phase == 'landing':
-                    phase_num = 3
-                else:
-                    phase_num = 1
-            else:
-                phase_num = 0
-                
-            self.jump_phases.append(phase_num)
-            self.jump_states.append(1 if jump_detector.is_jumping else 0)
-            
-            # 定期的な自動保存
-            if time.time() - self.last_save_time > self.save_interval:
-                self.auto_save_data()
-                self.last_save_time = time.time()
-    
-    def add_jump_event(self, event_type, timestamp, details):
-        """ジャンプイベントを記録"""
-        relative_time = timestamp - self.start_time
-        self.jump_events.append({
-            'type': event_type,
-            'time': relative_time,
-            'details': details
-        })
-    
-    def auto_save_data(self):
-        """データの自動保存"""
-        try:
-            # CSVデータ保存
-            if len(self.times) > 0:
-                data_file = os.path.join(self.save_dir, f"acceleration_data_{datetime.now().strftime('%H%M%S')}.csv")
-                with open(data_file, 'w', encoding='utf-8') as f:
-                    f.write("Time,X_G,Y_G,Z_G,Total_G,Jump_Phase,Jump_State\n")
-                    for i in range(len(self.times)):
-                        f.write(f"{self.times[i]:.3f},{self.x_data[i]:.3f},{self.y_data[i]:.3f},"
-                               f"{self.z_data[i]:.3f},{self.total_data[i]:.3f},"
-                               f"{self.jump_phases[i]},{self.jump_states[i]}\n")
-            
-            # ジャンプイベント保存
-            if self.jump_events:
-                events_file = os.path.join(self.save_dir, f"jump_events_{datetime.now().strftime('%H%M%S')}.csv")
-                with open(events_file, 'w', encoding='utf-8') as f:
-                    f.write("Event_Type,Time,Duration,Height,Power,Max_Acc,Min_Acc\n")
-                    for event in self.jump_events:
-                        if event['type'] == 'complete':
-                            details = event['details']
-                            f.write(f"complete,{event['time']:.3f},{details.get('duration', 0):.3f},"
-                                   f"{details.get('height', 0):.1f},{details.get('power', 0):.1f},"
-                                   f"{details.get('max_acc', 0):.3f},{details.get('min_acc', 0):.3f}\n")
-                        else:
-                            f.write(f"{event['type']},{event['time']:.3f},,,,\n")
-        except Exception as e:
-            print(f"⚠️ 自動保存エラー: {e}")
-    
     def save_final_graph(self):
         """最終グラフ保存"""
         try:
@@ -211,108 +405,111 @@ class DataVisualizer:
             print(f"💾 グラフを保存しました: {graph_file}")
             print(f"💾 PDFも保存しました: {pdf_file}")
             
-            # 最終データ保存
-            self.auto_save_data()
-            
-            # サマリー情報保存
-            summary_file = os.path.join(self.save_dir, f"session_summary_{self.session_id}.txt")
-            with open(summary_file, 'w', encoding='utf-8') as f:
-                f.write(f"MESH加速度測定セッション サマリー\n")
-                f.write(f"セッションID: {self.session_id}\n")
-                f.write(f"測定開始時刻: {datetime.fromtimestamp(self.start_time).strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"測定終了時刻: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"総測定時間: {(time.time() - self.start_time):.1f}秒\n")
-                f.write(f"データポイント数: {len(self.times)}\n")
-                f.write(f"ジャンプイベント数: {len([e for e in self.jump_events if e['type'] == 'complete'])}\n")
-                
-                if self.jump_events:
-                    completed_jumps = [e for e in self.jump_events if e['type'] == 'complete']
-                    if completed_jumps:
-                        heights = [e['details']['height'] for e in completed_jumps]
-                        powers = [e['details']['power'] for e in completed_jumps]
-                        f.write(f"最大ジャンプ高: {max(heights):.1f}cm\n")
-                        f.write(f"平均ジャンプ高: {sum(heights)/len(heights):.1f}cm\n")
-                        f.write(f"最大ジャンプ力: {max(powers):.1f}点\n")
-                        f.write(f"平均ジャンプ力: {sum(powers)/len(powers):.1f}点\n")
-            
-            print(f"📋 セッションサマリーを保存しました: {summary_file}")
+            # 最終データ・サマリー保存
+            self.finish()
             
         except Exception as e:
             print(f"⚠️ グラフ保存エラー: {e}")
     
+    def _animated_artists(self):
+        artists = [self.line_x, self.line_y, self.line_z, self.line_total, self.phase_collection]
+        for line, text in self.event_markers:
+            artists.extend((line, text))
+        return artists
+    
+    def _update_event_markers(self, start_time):
+        """表示範囲内のジャンプイベントをマーカープールに割り当てる"""
+        visible_events = []
+        # jump_events は時刻順に追記されるので、新しい方から表示範囲外に出るまで走査
+        for event in reversed(self.jump_events):
+            if event['time'] < start_time or len(visible_events) >= self.max_event_markers:
+                break
+            if event['type'] in ('start', 'complete'):
+                visible_events.append(event)
+        
+        for i, (line, text) in enumerate(self.event_markers):
+            if i >= len(visible_events):
+                line.set_visible(False)
+                text.set_visible(False)
+                continue
+            event = visible_events[i]
+            if event['type'] == 'start':
+                color, y, fontsize, label = 'green', 2.5, 8, '🚀開始'
+            else:
+                details = event['details']
+                color, y, fontsize = 'blue', 2.2, 7
+                label = f"🎯完了\n{details['duration']:.1f}s\n{details['height']:.0f}cm"
+            line.set_xdata([event['time'], event['time']])
+            line.set_color(color)
+            line.set_visible(True)
+            text.set_position((event['time'], y))
+            text.set_text(label)
+            text.set_fontsize(fontsize)
+            text.set_color(color)
+            text.set_visible(True)
+    
     def update_plot(self, frame):
         """グラフを更新"""
+        self.stats.record_frame(self.frame_interval)
+        with self.stats.measure('frame_update'):
+            return self._update_plot()
+    
+    def _update_plot(self):
+        # 前フレーム以降に届いた通知をまとめて処理
+        self.process_pending_packets()
+        
+        wait_start = time.perf_counter()
         with self.data_lock:
-            if len(self.times) == 0:
-                return self.line_x, self.line_y, self.line_z, self.line_total
+            self.stats.record('lock_wait_update_plot', time.perf_counter() - wait_start)
+            if len(self.samples) == 0:
+                return self._animated_artists()
             
-            times_array = np.array(self.times)
+            # 表示範囲に入るサンプルだけを切り出す（コピーなしのビュー）
+            all_times = self.samples.view('time')
+            latest_time = float(all_times[-1])
+            start_time = max(0, latest_time - self.window_seconds)
+            first = max(int(np.searchsorted(all_times, start_time)) - 1, 0)
+            times_array = all_times[first:]
             
             # 3軸加速度グラフ更新
-            self.line_x.set_data(times_array, np.array(self.x_data))
-            self.line_y.set_data(times_array, np.array(self.y_data))
-            self.line_z.set_data(times_array, np.array(self.z_data))
+            self.line_x.set_data(times_array, self.samples.view('x')[first:])
+            self.line_y.set_data(times_array, self.samples.view('y')[first:])
+            self.line_z.set_data(times_array, self.samples.view('z')[first:])
             
             # 合成加速度グラフ更新
-            self.line_total.set_data(times_array, np.array(self.total_data))
-            
-            # X軸の範囲を調整（最新30秒間を表示）
-            if len(times_array) > 0:
-                latest_time = times_array[-1]
-                start_time = max(0, latest_time - 30)
-                
-                self.ax1.set_xlim(start_time, latest_time + 1)
-                self.ax2.set_xlim(start_time, latest_time + 1)
-                self.ax3.set_xlim(start_time, latest_time + 1)
-            
-            # ジャンプ状態の背景色を更新
-            self.ax3.clear()
-            self.ax3.set_ylabel('ジャンプ状態', fontsize=10)
-            self.ax3.set_xlabel('時間 (秒)', fontsize=10)
-            self.ax3.set_title('ジャンプ検出状態', fontweight='bold', fontsize=12)
-            self.ax3.set_ylim(-0.5, 3.5)
-            self.ax3.set_yticks([0, 1, 2, 3])
-            self.ax3.set_yticklabels(['待機', '離陸', '空中', '着地'], fontsize=9)
-            self.ax3.grid(True, alpha=0.3)
-            
-            if len(times_array) > 0:
-                latest_time = times_array[-1]
-                start_time = max(0, latest_time - 30)
-                self.ax3.set_xlim(start_time, latest_time + 1)
-                
-                # ジャンプ状態を段階的に色分け表示
-                phases_array = np.array(self.jump_phases)
-                for i in range(len(times_array)):
-                    if i > 0:
-                        phase = phases_array[i]
-                        color = ['lightgray', 'lightcoral', 'lightblue', 'lightgreen'][phase]
-                        self.ax3.axvspan(times_array[i-1], times_array[i], 
-                                       ymin=phase/4, ymax=(phase+1)/4, 
-                                       color=color, alpha=0.7)
+            self.line_total.set_data(times_array, self.samples.view('total')[first:])
             
-            # ジャンプイベントマーカーを追加
-            for event in self.jump_events:
-                if event['time'] >= start_time:
-                    if event['type'] == 'start':
-                        self.ax2.axvline(x=event['time'], color='green', 
-                                       linestyle='-', linewidth=2, alpha=0.8)
-                        self.ax2.text(event['time'], 2.5, '🚀開始', 
-                                    rotation=90, fontsize=8, color='green')
-                    elif event['type'] == 'complete':
-                        self.ax2.axvline(x=event['time'], color='blue', 
-                                       linestyle='-', linewidth=2, alpha=0.8)
-                        details = event['details']
-                        label = f"🎯完了\n{details['duration']:.1f}s\n{details['height']:.0f}cm"
-                        self.ax2.text(event['time'], 2.2, label, 
-                                    rotation=90, fontsize=7, color='blue')
-        
-        return self.line_x, self.line_y, self.line_z, self.line_total
+            # ジャンプ状態の帯を更新（段階が切り替わる回数分の矩形だけを描く）
+            x0, x1, seg_phases = phase_segments(times_array, self.samples.view('phase')[first:])
+            y0 = seg_phases - 0.5
+            y1 = seg_phases + 0.5
+            verts = np.stack([np.column_stack((x0, y0)), np.column_stack((x0, y1)),
+                              np.column_stack((x1, y1)), np.column_stack((x1, y0))], axis=1)
+            self.phase_collection.set_verts(verts)
+            self.phase_collection.set_facecolor(self.phase_rgba[seg_phases])
+        
+        # X軸の範囲を調整（最新30秒間を表示）
+        # 刻みを越えたときだけ軸を動かして全体を再描画し、ブリッティング用の背景を作り直す
+        view_end = (int(latest_time // self.scroll_step) + 1) * self.scroll_step
+        if view_end != self.view_end:
+            self.view_end = view_end
+            view_start = max(0, view_end - self.window_seconds)
+            for ax in (self.ax1, self.ax2, self.ax3):
+                ax.set_xlim(view_start, view_end)
+            with self.stats.measure('full_redraw'):
+                self.fig.canvas.draw()
+        
+        # ジャンプイベントマーカーを更新
+        self._update_event_markers(max(0, self.view_end - self.window_seconds))
+        
+        return self._animated_artists()
     
     def start_animation(self):
         """アニメーション開始"""
         try:
             self.ani = animation.FuncAnimation(self.fig, self.update_plot, 
-                                             interval=50, blit=False, cache_frame_data=False)
+                                             interval=int(self.frame_interval * 1000),
+                                             blit=True, cache_frame_data=False)
             plt.tight_layout()
             
             # 終了時の処理を設定
@@ -345,13 +542,16 @@ class EnhancedJumpDetector:
         self.stable_threshold = 0.15
         self.max_jump_duration = 3.0
         
-    def process_acceleration(self, x_g, y_g, z_g):
-        """加速度処理（可視化機能付き）"""
+    def process_acceleration(self, x_g, y_g, z_g, timestamp=None):
+        """加速度処理（可視化機能付き）
+
+        timestamp: 受信時刻（省略時は現在時刻）。まとめて処理する場合は受信時の時刻を渡す
+        """
         total_acceleration = math.sqrt(x_g**2 + y_g**2 + z_g**2)
-        current_time = time.time()
+        current_time = time.time() if timestamp is None else timestamp
         
         # 可視化データを追加
-        self.visualizer.add_data(x_g, y_g, z_g, self)
+        self.visualizer.add_data(x_g, y_g, z_g, self, current_time)
         
         # 履歴に追加
         self.acceleration_history.append((current_time, total_acceleration, x_g, y_g, z_g))
@@ -483,36 +683,11 @@ class EnhancedJumpDetector:
     
     def calculate_jump_height(self):
         """ジャンプ高さ計算"""
-        if self.max_acceleration <= 1.0:
-            return 0
-            
-        excess_acceleration = (self.max_acceleration - 1.0) * 9.81
-        
-        airborne_factor = 1.0
-        if self.min_acceleration < 0.5:
-            airborne_factor = 1.3
-            
-        estimated_velocity = excess_acceleration * 0.1 * airborne_factor
-        height_m = (estimated_velocity ** 2) / (2 * 9.81)
-        height_cm = height_m * 100
-        
-        return min(max(height_cm, 0), 150)
+        return estimate_jump_height(self.max_acceleration, self.min_acceleration)
     
     def calculate_jump_power(self):
         """ジャンプ力計算"""
-        height_score = min(self.calculate_jump_height() * 0.6, 50)
-        acceleration_score = min((self.max_acceleration - 1.0) * 20, 30)
-        
-        airborne_bonus = 0
-        if self.min_acceleration < 0.6:
-            airborne_bonus = 15
-            
-        phase_bonus = 0
-        if self.jump_phase in ['landing', 'airborne']:
-            phase_bonus = 5
-            
-        total_score = height_score + acceleration_score + airborne_bonus + phase_bonus
-        return min(max(total_score, 0), 100)
+        return estimate_jump_power(self.max_acceleration, self.min_acceleration, self.jump_phase)
     
     def reset_jump_state(self):
         """ジャンプ状態リセット"""
@@ -524,164 +699,517 @@ class EnhancedJumpDetector:
         self.jump_phase = None
         self.phase_change_time = None
 
-def convert_sensor_value_to_acceleration(sensor_value):
-    """センサー値を加速度（G）に変換"""
-    if sensor_value <= 2047:
-        return sensor_value / 1024.0
-    else:
-        return (sensor_value - 65536) / 1024.0
-
 # グローバル変数
 visualizer = None
 jump_detector = None
+hub = None
+dashboard = None
 
-def on_receive_notify(sender, data: bytearray):
-    """動きブロックからの通知処理"""
-    global jump_detector
-    
+def process_motion_frames(detector, timestamps, frames, label=None, verbose=True, stats=None):
+    """動きブロックの通知フレームをまとめてデコードし、ジャンプ検出器へ渡す
+
+    stats: PipelineStats を渡すとデコード・受信から検出まで・検出の所要時間を記録する
+    """
     try:
-        if len(data) < 10:
-            return
-            
-        if data[0] != MESSAGE_TYPE_ID:
-            return
-        
-        event_type = data[1]
-        
-        # 加速度データを取得
-        x_raw = unpack('<H', data[4:6])[0]
-        y_raw = unpack('<H', data[6:8])[0]
-        z_raw = unpack('<H', data[8:10])[0]
-        
-        # センサー値を加速度（G）に変換
-        x_g = convert_sensor_value_to_acceleration(x_raw)
-        y_g = convert_sensor_value_to_acceleration(y_raw)
-        z_g = convert_sensor_value_to_acceleration(z_raw)
-        
-        total_g = math.sqrt(x_g**2 + y_g**2 + z_g**2)
-        
-        # イベント種別を表示
-        event_names = {
-            EVENT_TYPE_TAP: "タップ",
-            EVENT_TYPE_SHAKE: "シェイク", 
-            EVENT_TYPE_FLIP: "フリップ",
-            EVENT_TYPE_ORIENTATION: "向き変更"
-        }
-        event_name = event_names.get(event_type, f"不明({event_type})")
-        
-        print(f"[{event_name}] X:{x_g:+.3f}G Y:{y_g:+.3f}G Z:{z_g:+.3f}G 合成:{total_g:.3f}G")
-        
-        # ジャンプ検出処理
-        if jump_detector:
-            jump_detector.process_acceleration(x_g, y_g, z_g)
-        
+        decode_start = time.perf_counter()
+        decoded = decode_frames(frames)
+        if stats and len(frames):
+            stats.record('decode_per_packet', (time.perf_counter() - decode_start) / len(frames))
     except Exception as e:
         print(f"データ処理エラー: {e}")
-        print(f"受信データ: {data.hex()}")
+        return
+    
+    prefix = f"{label} " if label else ""
+    for i, event_type, (x_g, y_g, z_g) in zip(decoded.index.tolist(), decoded.event_type.tolist(),
+                                              decoded.accel.tolist()):
+        try:
+            # イベント種別を表示
+            if verbose:
+                total_g = math.sqrt(x_g**2 + y_g**2 + z_g**2)
+                event_name = EVENT_NAMES.get(event_type, f"不明({event_type})")
+                print(f"{prefix}[{event_name}] X:{x_g:+.3f}G Y:{y_g:+.3f}G Z:{z_g:+.3f}G 合成:{total_g:.3f}G")
+            
+            # ジャンプ検出処理
+            if detector:
+                if stats:
+                    detect_start = time.perf_counter()
+                    if timestamps[i] is not None:
+                        stats.record('receive_to_detect', max(time.time() - timestamps[i], 0.0))
+                detector.process_acceleration(x_g, y_g, z_g, timestamps[i])
+                if stats:
+                    stats.record('detect', time.perf_counter() - detect_start)
+        
+        except Exception as e:
+            print(f"データ処理エラー: {e}")
+            print(f"受信データ: {bytes(frames[i]).hex()}")
+
+def on_receive_notify(sender, data: bytearray, timestamp=None):
+    """動きブロックからの通知処理（受け渡しキューに積むだけで、処理は描画側で行う）
+
+    timestamp: 受信時刻。ジャーナル再生や疑似デバイスから呼ぶときに元の時刻を渡す
+    """
+    if visualizer:
+        visualizer.receive(data, timestamp)
 
 def on_receive_indicate(sender, data: bytearray):
     """Indicateメッセージの処理"""
     print(f'[Indicate] {data.hex()}')
 
-async def scan_motion_block():
-    """動きブロック（MESH-100AC）をスキャン"""
-    print("動きブロック（MESH-100AC）をスキャン中...")
-    
-    retry_count = 0
-    max_retries = 10
-    
-    while retry_count < max_retries:
-        try:
-            devices = await BleakScanner.discover(timeout=5.0)
-            for device in devices:
-                if device.name and 'MESH-100AC' in device.name:
-                    print(f"✅ 動きブロックを発見: {device.name}")
-                    return device
-                    
-            retry_count += 1
-            print(f"スキャン {retry_count}/{max_retries} - 動きブロックが見つかりません...")
-            await asyncio.sleep(2)
-            
-        except Exception as e:
-            print(f"スキャンエラー: {e}")
-            retry_count += 1
-            await asyncio.sleep(2)
-    
-    raise Exception("動きブロックが見つかりませんでした。電源とペアリング状態を確認してください。")
+# 動きブロックが見つからないときに諦めるまでの時間（秒）
+MOTION_BLOCK_WAIT = 70.0
+
+async def bluetooth_main(headless=False):
+    """Bluetooth接続とデータ取得のメイン処理
 
-async def bluetooth_main():
-    """Bluetooth接続とデータ取得のメイン処理"""
-    global jump_detector
+    前回接続した動きブロックのアドレスを覚えていれば、スキャンせずに直接接続する。
+    接続後に切断されても自動で再接続する。
+    headless: True ならグラフを使わず、受信パケットの処理もこのループで行う
+    """
     
+    print("動きブロック（MESH-100AC）に接続中...")
+    connection = MeshConnection('MESH-100AC', on_notify=on_receive_notify,
+                                on_indicate=on_receive_indicate, connect_timeout=30.0)
     try:
-        # 動きブロックをスキャン
-        device = await scan_motion_block()
-        
-        # デバイスに接続
-        print(f"\n📱 接続中: {device.name} ({device.address})")
-        
-        async with BleakClient(device, timeout=30.0) as client:
-            print("✅ 接続成功!")
-            
-            # 通知を開始
-            await client.start_notify(CORE_NOTIFY_UUID, on_receive_notify)
-            await client.start_notify(CORE_INDICATE_UUID, on_receive_indicate)
-            
-            # 動きブロックの初期化
-            init_command = pack('<BBBB', 0, 2, 1, 3)
-            await client.write_gatt_char(CORE_WRITE_UUID, init_command, response=True)
-            
-            print("\n🎯 動きブロック準備完了!")
+        await connection.start().wait_ready(timeout=MOTION_BLOCK_WAIT)
+        print(f"\n✅ 接続成功: {connection.name} ({connection.address})")
+        if headless:
+            print("💡 ヘッドレスモードで記録中（グラフは表示しません）")
+            print("   - データは自動的に保存されます")
+            print("   - Ctrl+C で終了")
+        else:
             print("💡 リアルタイムグラフが表示されます")
             print("   - 3軸加速度、合成加速度、ジャンプ状態が可視化されます")
             print("   - ジャンプするとグラフ上にマーカーが表示されます")
             print("   - データは自動的に保存されます")
             print("   - グラフウィンドウを閉じるか Ctrl+C で終了")
-            print("─" * 50)
-            
-            # データ受信を継続
-            try:
-                while True:
-                    await asyncio.sleep(0.1)
-                    
-            except KeyboardInterrupt:
-                print("\n\n👋 プログラムを終了します...")
+        print("─" * 50)
+        
+        # データ受信を継続
+        try:
+            while True:
+                await asyncio.sleep(0.1)
+                if headless:
+                    visualizer.process_pending_packets()
                 
+        except KeyboardInterrupt:
+            print("\n\n👋 プログラムを終了します...")
+            
     except Exception as e:
+        if isinstance(e, asyncio.TimeoutError):
+            e = "動きブロックが見つかりませんでした。"
         print(f"❌ エラー: {e}")
         print("\n🔧 トラブルシューティング:")
         print("1. 動きブロックの電源が入っているか確認")
         print("2. スマートフォンアプリでペアリングを解除") 
         print("3. Bluetoothが有効になっているか確認")
+    finally:
+        await connection.close()
+
+async def replay_main(source, speed=1.0, headless=False):
+    """実機の代わりに、ジャーナル再生や疑似デバイスから on_receive_notify へ通知を流し込む"""
+    task = asyncio.create_task(source.play(on_receive_notify, speed))
+    while not task.done():
+        await asyncio.sleep(0.1)
+        if headless:
+            visualizer.process_pending_packets()
+    if headless:
+        visualizer.process_pending_packets()
+    try:
+        await task
+        print("⏹ 再生が終了しました")
+    except Exception as e:
+        print(f"❌ 再生エラー: {e}")
+
+def make_packet_source(args):
+    """コマンドライン引数から実機以外の入力元を作る（実機なら None）"""
+    if args.replay:
+        return JournalReplay(args.replay)
+    if args.simulate is not None:
+        return SimulatedMotionBlock(duration=args.simulate)
+    return None
+
+async def scan_motion_blocks(max_devices=None, max_retries=10):
+    """周囲の動きブロック（MESH-100AC）を1回のスキャンでまとめて探す
+
+    台数が指定されていて、前回までに見つけた動きブロックをその台数分覚えていれば、スキャンせずにそれを使う。
+    """
+    cache = default_cache()
+    cached = cache.lookup('MESH-100AC')
+    if max_devices is not None and len(cached) >= max_devices:
+        for device in cached[:max_devices]:
+            print(f"✅ 前回の動きブロックに接続します: {device.name} ({device.address})")
+        return cached[:max_devices]
+    
+    print("動きブロック（MESH-100AC）をまとめてスキャン中...")
+    
+    # スキャンは止めずに続け、見つかった時点で数える（台数がそろえば5秒を待たずに終わる）
+    discovery = default_discovery()
+    found = {}
+    for retry_count in range(1, max_retries + 1):
+        remaining = None if max_devices is None else max_devices - len(found)
+        try:
+            for device in await discovery.find_all('MESH-100AC', timeout=5.0, limit=remaining, exclude=found):
+                found[device.address] = device
+        except Exception as e:
+            print(f"スキャンエラー: {e}")
+            await asyncio.sleep(2)
+        
+        if found and (max_devices is None or len(found) >= max_devices):
+            break
+        print(f"スキャン {retry_count}/{max_retries} - 見つかった動きブロック: {len(found)}台")
+    
+    if not found:
+        raise Exception("動きブロックが見つかりませんでした。電源とペアリング状態を確認してください。")
+    
+    devices = sorted(found.values(), key=lambda d: d.name or '')[:max_devices]
+    for device in devices:
+        print(f"✅ 動きブロックを発見: {device.name} ({device.address})")
+    return devices
+
+class MotionBlockChannel:
+    """ハブに接続する動きブロック1台分（デバイス・計測データ・ジャンプ検出器）"""
+    def __init__(self, device, session):
+        self.device = device
+        self.name = device.name
+        self.session = session
+        self.detector = EnhancedJumpDetector(session)
+        session.detector = self.detector
+        self.connection = None
+    
+    @property
+    def connected(self):
+        return self.connection is not None and self.connection.connected
+    
+    def on_notify(self, sender, data: bytearray):
+        self.session.receive(data)
+
+class MotionBlockHub:
+    """複数の動きブロックを1つの asyncio ループで同時に扱うハブ
+
+    ブロックごとに接続タスクを持ち、asyncio.gather で並行に動かす。
+    1台の接続失敗や切断は、そのタスク内で再接続を繰り返すだけで他のブロックには影響しない。
+    """
+    def __init__(self, devices, max_points=300, binary_log=False, record_raw=False):
+        self.session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.save_dir = os.path.join(default_save_root(), f"mesh_hub_{self.session_id}")
+        self.start_time = time.time()
+        self.channels = []
+        for device in devices:
+            dir_name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in device.name)
+            session = SensorSession(max_points, binary_log, name=device.name,
+                                    save_dir=os.path.join(self.save_dir, dir_name),
+                                    start_time=self.start_time, record_raw=record_raw)
+            self.channels.append(MotionBlockChannel(device, session))
+        self.connect_timeout = 15.0
+        self.max_reconnect_delay = 30.0
+    
+    async def run(self, drain_interval=None):
+        """全ブロックへ並行して接続し、受信を続ける
+
+        drain_interval: 指定するとダッシュボードの代わりにこのループで受信パケットを処理する（秒）
+        """
+        tasks = [self._serve(channel) for channel in self.channels]
+        if drain_interval:
+            tasks.append(self._drain(drain_interval))
+        await asyncio.gather(*tasks)
+    
+    async def _drain(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            for channel in self.channels:
+                channel.session.process_pending_packets(label=channel.name)
+    
+    async def _serve(self, channel):
+        """1台分の接続・初期化・切断時の再接続（指数バックオフ）
+
+        前回の記録から使うブロックはアドレスが変わっていることがあるので、
+        つながらなければ同じ名前のブロックをスキャンして探し直す。
+        """
+        channel.connection = MeshConnection(prefix=channel.name, device=channel.device,
+                                            on_notify=channel.on_notify,
+                                            on_indicate=on_receive_indicate,
+                                            connect_timeout=self.connect_timeout,
+                                            max_reconnect_delay=self.max_reconnect_delay)
+        await channel.connection.run()
+    
+    def finish(self):
+        """全ブロックの記録を終了してサマリーを保存"""
+        for channel in self.channels:
+            channel.session.finish()
+
+class HubDashboard:
+    """ハブに接続した全ブロックの合成加速度とジャンプ状態を1画面に並べて表示"""
+    def __init__(self, hub):
+        self.hub = hub
+        rows = len(hub.channels)
+        setup_matplotlib()
+        plt.style.use('default')
+        self.fig, axes = plt.subplots(rows, 1, figsize=(14, 2.5 * rows + 1), sharex=True, squeeze=False)
+        self.fig.suptitle(f'MESH動きブロック {rows}台 同時表示', fontsize=14, fontweight='bold')
+        
+        # 待機中は帯を描かず、ジャンプ中の段階だけ半透明で塗る
+        self.phase_rgba = to_rgba_array(PHASE_COLORS)
+        self.phase_rgba[:, 3] = 0.5
+        
+        self.rows = []
+        for ax, channel in zip(axes[:, 0], hub.channels):
+            line, = ax.plot([], [], 'purple', linewidth=1.5)
+            collection = PolyCollection([], linewidths=0)
+            ax.add_collection(collection)
+            ax.axhline(y=1.3, color='red', linestyle='--', alpha=0.7)
+            ax.axhline(y=0.7, color='orange', linestyle='--', alpha=0.7)
+            ax.set_ylim(0, 3)
+            ax.set_ylabel('合成加速度 (G)', fontsize=9)
+            ax.grid(True, alpha=0.3)
+            status = ax.text(0.01, 0.95, '', transform=ax.transAxes, va='top', fontsize=10)
+            for artist in (line, collection, status):
+                artist.set_animated(True)
+            self.rows.append((channel, line, collection, status))
+        axes[-1, 0].set_xlabel('時間 (秒)', fontsize=10)
+        self.axes = axes[:, 0]
+        
+        self.window_seconds = 30
+        self.scroll_step = 5
+        self.view_end = None
+        self.frame_interval = 0.05
+        self.stats = PipelineStats()
+    
+    def update_plot(self, frame):
+        """全ブロックのグラフを更新"""
+        self.stats.record_frame(self.frame_interval)
+        with self.stats.measure('frame_update'):
+            return self._update_plot()
+    
+    def _update_plot(self):
+        latest_time = 0.0
+        artists = []
+        for channel, line, collection, status in self.rows:
+            session = channel.session
+            session.process_pending_packets(label=channel.name)
+            wait_start = time.perf_counter()
+            with session.data_lock:
+                self.stats.record('lock_wait_update_plot', time.perf_counter() - wait_start)
+                if len(session.samples) > 0:
+                    all_times = session.samples.view('time')
+                    latest_time = max(latest_time, float(all_times[-1]))
+                    start_time = max(0, float(all_times[-1]) - self.window_seconds)
+                    first = max(int(np.searchsorted(all_times, start_time)) - 1, 0)
+                    times_array = all_times[first:]
+                    line.set_data(times_array, session.samples.view('total')[first:])
+                    
+                    x0, x1, seg_phases = phase_segments(times_array, session.samples.view('phase')[first:])
+                    jumping = seg_phases > 0
+                    x0, x1, seg_phases = x0[jumping], x1[jumping], seg_phases[jumping]
+                    verts = np.stack([np.column_stack((x0, np.zeros_like(x0))), np.column_stack((x0, np.full_like(x0, 3))),
+                                      np.column_stack((x1, np.full_like(x1, 3))), np.column_stack((x1, np.zeros_like(x1)))], axis=1)
+                    collection.set_verts(verts)
+                    collection.set_facecolor(self.phase_rgba[seg_phases])
+            
+            state = '🟢 接続中' if channel.connected else '🔴 未接続'
+            status.set_text(f"{channel.name}  {state}  ジャンプ {session.completed_jumps}回  "
+                            f"最高 {session.best_height:.1f}cm")
+            artists.extend((line, collection, status))
+        
+        # 刻みを越えたときだけ軸を動かして全体を再描画（DataVisualizer.update_plot と同じ方式）
+        view_end = (int(latest_time // self.scroll_step) + 1) * self.scroll_step
+        if view_end != self.view_end:
+            self.view_end = view_end
+            for ax in self.axes:
+                ax.set_xlim(max(0, view_end - self.window_seconds), view_end)
+            with self.stats.measure('full_redraw'):
+                self.fig.canvas.draw()
+        
+        return artists
+    
+    def save_final_graph(self):
+        """最終グラフ保存"""
+        try:
+            graph_file = os.path.join(self.hub.save_dir, f"final_graph_{self.hub.session_id}.png")
+            self.fig.savefig(graph_file, dpi=300, bbox_inches='tight',
+                             facecolor='white', edgecolor='none')
+            print(f"💾 グラフを保存しました: {graph_file}")
+            latency_file = os.path.join(self.hub.save_dir, f"latency_dashboard_{self.hub.session_id}.txt")
+            self.stats.dump(latency_file)
+            print(f"⏱ 描画時間の統計を保存しました: {latency_file}")
+        except Exception as e:
+            print(f"⚠️ グラフ保存エラー: {e}")
+    
+    def start_animation(self):
+        """アニメーション開始"""
+        self.ani = animation.FuncAnimation(self.fig, self.update_plot,
+                                           interval=int(self.frame_interval * 1000),
+                                           blit=True, cache_frame_data=False)
+        plt.tight_layout()
+        plt.show()
 
 def signal_handler(signum, frame):
     """シグナルハンドラー（Ctrl+C対応）"""
     global visualizer
     print("\n\n💾 終了処理中...")
-    if visualizer:
+    if isinstance(visualizer, DataVisualizer):
         visualizer.save_final_graph()
+    elif visualizer:
+        visualizer.finish()
+    if dashboard:
+        dashboard.save_final_graph()
+    if hub:
+        hub.finish()
     print("👋 プログラムを終了しました")
     sys.exit(0)
 
+def run_hub(max_devices=None, binary_log=False, record_raw=False):
+    """複数の動きブロックに同時接続し、1つのダッシュボードに表示"""
+    global hub, dashboard
+    
+    try:
+        devices = asyncio.run(scan_motion_blocks(max_devices))
+    except Exception as e:
+        print(f"❌ エラー: {e}")
+        return
+    
+    hub = MotionBlockHub(devices, binary_log=binary_log, record_raw=record_raw)
+    dashboard = HubDashboard(hub)
+    
+    # 全ブロックの接続を1つの asyncio ループ（別スレッド）で扱う
+    def run_bluetooth():
+        try:
+            asyncio.run(hub.run())
+        except Exception as e:
+            print(f"Bluetoothスレッドエラー: {e}")
+    
+    bluetooth_thread = threading.Thread(target=run_bluetooth, daemon=True)
+    bluetooth_thread.start()
+    
+    try:
+        print("📊 グラフウィンドウを初期化中...")
+        dashboard.start_animation()
+    except KeyboardInterrupt:
+        print('\n👋 プログラムを終了しました')
+    except Exception as e:
+        print(f"グラフ表示エラー: {e}")
+    finally:
+        dashboard.save_final_graph()
+        hub.finish()
+
+def print_jump_event_json(session, event, file=None):
+    """ジャンプイベントを JSON Lines 形式で1行出力"""
+    record = {'device': session.name, 'type': event['type'],
+              'time': round(event['time'], 3),
+              'timestamp': round(session.start_time + event['time'], 3)}
+    record.update(event['details'])
+    print(json.dumps(record, ensure_ascii=False), file=file or sys.stdout, flush=True)
+
+def run_headless(multi=False, max_devices=None, jsonl=False, binary_log=False, on_jump_event=None,
+                 record_raw=False, source=None, speed=1.0):
+    """グラフを使わずに受信・ジャンプ検出・記録だけを行う
+
+    jsonl: True ならジャンプイベントを標準出力へ JSON Lines で流す（他のログは標準エラーへ）
+    on_jump_event: ジャンプイベントごとに呼ぶ関数 listener(session, event)
+    source: 実機の代わりに使う入力元（JournalReplay / SimulatedMotionBlock）
+    """
+    global visualizer, jump_detector, hub
+    
+    listeners = []
+    if on_jump_event:
+        listeners.append(on_jump_event)
+    log_stream = sys.stdout
+    if jsonl:
+        json_out = sys.stdout
+        listeners.append(lambda session, event: print_jump_event_json(session, event, json_out))
+        log_stream = sys.stderr
+    
+    with redirect_stdout(log_stream):
+        if multi:
+            try:
+                devices = asyncio.run(scan_motion_blocks(max_devices))
+            except Exception as e:
+                print(f"❌ エラー: {e}")
+                return
+            hub = MotionBlockHub(devices, binary_log=binary_log, record_raw=record_raw)
+            sessions = [channel.session for channel in hub.channels]
+        else:
+            visualizer = SensorSession(binary_log=binary_log, record_raw=record_raw)
+            jump_detector = EnhancedJumpDetector(visualizer)
+            visualizer.detector = jump_detector
+            sessions = [visualizer]
+        
+        for session in sessions:
+            session.verbose = False
+            session.event_listeners.extend(listeners)
+        
+        try:
+            if multi:
+                asyncio.run(hub.run(drain_interval=0.1))
+            elif source:
+                asyncio.run(replay_main(source, speed, headless=True))
+            else:
+                asyncio.run(bluetooth_main(headless=True))
+        except KeyboardInterrupt:
+            print('\n👋 プログラムを終了しました')
+        finally:
+            for session in sessions:
+                session.finish()
+
 def main():
     """メイン関数"""
     global visualizer, jump_detector
     
+    import argparse
+    parser = argparse.ArgumentParser(description='MESH動きブロック ジャンプ検出・可視化システム')
+    parser.add_argument('--multi', action='store_true',
+                        help='見つかった動きブロックすべてに同時接続する')
+    parser.add_argument('--max-devices', type=int, default=None,
+                        help='--multi で接続する最大台数')
+    parser.add_argument('--headless', action='store_true',
+                        help='グラフを表示せず、受信・ジャンプ検出・記録だけを行う')
+    parser.add_argument('--jsonl', action='store_true',
+                        help='ジャンプイベントを標準出力へ JSON Lines で出力する（ログは標準エラーへ）')
+    parser.add_argument('--binary-log', action='store_true',
+                        help='CSVに加えて列ごとのバイナリファイル（時刻は float64, 他は float32）も記録する')
+    parser.add_argument('--record-raw', action='store_true',
+                        help='受信した生パケットをジャーナル (raw_packets.mjl) に記録する')
+    parser.add_argument('--replay', metavar='PATH',
+                        help='実機の代わりにジャーナルファイルを再生する')
+    parser.add_argument('--simulate', type=float, metavar='SECONDS',
+                        help='実機の代わりに疑似動きブロックを指定秒数だけ動かす')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='再生速度の倍率（0 なら待ち時間なしで全速）')
+    args = parser.parse_args()
+    if args.multi and (args.replay or args.simulate is not None):
+        # 複数台モードは実機ごとに接続するので、1台分の再生・疑似入力は流し込めない
+        parser.error('--replay / --simulate は --multi と同時に指定できません')
+    source = make_packet_source(args)
+    
     # シグナルハンドラーを設定
     import signal
     signal.signal(signal.SIGINT, signal_handler)
     
-    print("🚀 MESH動きブロック ジャンプ検出・可視化システム v2.0")
-    print("=" * 60)
+    # --jsonl のときは標準出力を JSON Lines 専用にする
+    log_stream = sys.stderr if args.jsonl else sys.stdout
+    print("🚀 MESH動きブロック ジャンプ検出・可視化システム v2.0", file=log_stream)
+    print("=" * 60, file=log_stream)
+    
+    if args.headless:
+        run_headless(args.multi, args.max_devices, args.jsonl, args.binary_log,
+                     record_raw=args.record_raw, source=source, speed=args.speed)
+        return
+    
+    if args.multi:
+        run_hub(args.max_devices, args.binary_log, args.record_raw)
+        return
     
     # 可視化システムを初期化
-    visualizer = DataVisualizer()
+    visualizer = DataVisualizer(binary_log=args.binary_log, record_raw=args.record_raw)
     jump_detector = EnhancedJumpDetector(visualizer)
+    visualizer.detector = jump_detector
     
     # Bluetoothタスクを別スレッドで実行
     def run_bluetooth():
         try:
-            asyncio.run(bluetooth_main())
+            if source:
+                asyncio.run(replay_main(source, args.speed))
+            else:
+                asyncio.run(bluetooth_main())
         except KeyboardInterrupt:
             pass
         except Exception as e:
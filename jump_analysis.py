@@ -0,0 +1,232 @@
+"""記録済みセッションに対するジャンプ検出（オフライン一括処理）
+
+improved_mesh_visualizer.py の EnhancedJumpDetector と同じ
+離陸→空中→着地の状態遷移を、NumPy のスライディングウィンドウで求めた特徴量を使って
+記録データ全体に一括で適用する。ジャンプ中でない区間はサンプルごとに走査せず、
+次の開始候補まで読み飛ばす。
+
+使い方:
+    python jump_analysis.py <セッションディレクトリ or CSV> [...] [--high 1.3] [--low 0.7]
+"""
+import argparse
+import glob
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# EnhancedJumpDetector と共通の固定パラメータ
+START_RANGE_MIN = 0.3      # 開始判定: 直近3サンプルの変動幅
+LANDING_PHASE_ACC = 1.1    # 空中→着地段階への遷移
+STABLE_RANGE = (0.8, 1.2)  # 着地判定: 直近5サンプル平均の範囲
+LOOSE_RANGE = (0.7, 1.3)   # 着地判定（1.5秒経過後）の範囲
+MIN_JUMP_TIME = 0.3
+MIN_TIME_BEFORE_LANDING_PHASE = 1.0
+LOOSE_LANDING_TIME = 1.5
+
+PHASE_NAMES = {1: 'takeoff', 2: 'airborne', 3: 'landing'}
+
+
+def estimate_jump_height(max_acceleration, min_acceleration):
+    """最大・最小加速度からジャンプ高さ（cm）を推定"""
+    if max_acceleration <= 1.0:
+        return 0
+
+    excess_acceleration = (max_acceleration - 1.0) * 9.81
+
+    airborne_factor = 1.0
+    if min_acceleration < 0.5:
+        airborne_factor = 1.3
+
+    estimated_velocity = excess_acceleration * 0.1 * airborne_factor
+    height_m = (estimated_velocity ** 2) / (2 * 9.81)
+    height_cm = height_m * 100
+
+    return min(max(height_cm, 0), 150)
+
+
+def estimate_jump_power(max_acceleration, min_acceleration, jump_phase):
+    """ジャンプ力（0〜100点）を計算"""
+    height_score = min(estimate_jump_height(max_acceleration, min_acceleration) * 0.6, 50)
+    acceleration_score = min((max_acceleration - 1.0) * 20, 30)
+
+    airborne_bonus = 0
+    if min_acceleration < 0.6:
+        airborne_bonus = 15
+
+    phase_bonus = 0
+    if jump_phase in ['landing', 'airborne']:
+        phase_bonus = 5
+
+    total_score = height_score + acceleration_score + airborne_bonus + phase_bonus
+    return min(max(total_score, 0), 100)
+
+
+class BatchJumpDetector:
+    """記録データ全体に対して EnhancedJumpDetector と同じ判定を行う検出器
+
+    閾値の属性名は EnhancedJumpDetector と同じなので、チューニングした値をそのまま使える。
+    """
+
+    def __init__(self, jump_threshold_high=1.3, jump_threshold_low=0.7,
+                 stable_threshold=0.15, max_jump_duration=3.0):
+        self.jump_threshold_high = jump_threshold_high
+        self.jump_threshold_low = jump_threshold_low
+        self.stable_threshold = stable_threshold
+        self.max_jump_duration = max_jump_duration
+
+    def _features(self, total):
+        """開始候補・安定着地・緩い着地の判定をまとめて計算"""
+        n = len(total)
+        range3 = np.zeros(n)
+        if n >= 3:
+            w3 = sliding_window_view(total, 3)
+            range3[2:] = w3.max(axis=1) - w3.min(axis=1)
+        start_ok = (total > self.jump_threshold_high) & (range3 > START_RANGE_MIN)
+
+        stable = np.zeros(n, dtype=bool)
+        if n >= 5:
+            w5 = sliding_window_view(total, 5)
+            # ライブ版の sum() と同じ順序で足し合わせる
+            mean5 = w5[:, 0] + w5[:, 1] + w5[:, 2] + w5[:, 3] + w5[:, 4]
+            mean5 /= 5
+            max_dev = np.abs(w5 - mean5[:, None]).max(axis=1)
+            stable[4:] = ((mean5 >= STABLE_RANGE[0]) & (mean5 <= STABLE_RANGE[1])
+                          & (max_dev < self.stable_threshold))
+
+        loose = (total >= LOOSE_RANGE[0]) & (total <= LOOSE_RANGE[1])
+        return np.flatnonzero(start_ok), stable, loose
+
+    def detect(self, times, x, y, z):
+        """時刻と3軸加速度（G）の配列からジャンプイベントのリストを返す
+
+        返り値の各要素は DataVisualizer.jump_events と同じ形式
+        ({'type': 'start' | 'complete', 'time': 時刻, 'details': {...}})。
+        """
+        times = np.asarray(times, dtype=np.float64)
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        z = np.asarray(z, dtype=np.float64)
+        total = np.sqrt(x * x + y * y + z * z)
+        n = len(total)
+        events = []
+        if n == 0:
+            return events
+
+        start_candidates, stable, loose = self._features(total)
+
+        k = 0
+        while True:
+            i = np.searchsorted(start_candidates, k)
+            if i == len(start_candidates):
+                break
+            s = int(start_candidates[i])
+            t0 = times[s]
+            events.append({'type': 'start', 'time': float(t0),
+                           'details': {'acceleration': float(total[s])}})
+
+            # タイムアウトするサンプル（経過時間が max_jump_duration を超える最初のサンプル）
+            hi = int(np.searchsorted(times, t0 + self.max_jump_duration, side='right'))
+            while hi < n and times[hi] - t0 <= self.max_jump_duration:
+                hi += 1
+            dt = times[s + 1:hi] - t0
+            over = np.flatnonzero(dt > self.max_jump_duration)
+            end = s + 1 + int(over[0]) if len(over) else hi
+            dt = dt[:end - s - 1]
+            seg_total = total[s + 1:end]
+
+            # 段階遷移: 離陸 → 空中（閾値未満）→ 着地（1.1G超）
+            phases = np.ones(len(seg_total), dtype=int)
+            below = np.flatnonzero(seg_total < self.jump_threshold_low)
+            if len(below):
+                a = int(below[0])
+                phases[a:] = 2
+                above = np.flatnonzero(seg_total[a + 1:] > LANDING_PHASE_ACC)
+                if len(above):
+                    phases[a + 1 + int(above[0]):] = 3
+
+            landing_ok = ((dt >= MIN_JUMP_TIME)
+                          & ((phases == 3) | (dt >= MIN_TIME_BEFORE_LANDING_PHASE))
+                          & (stable[s + 1:end] | ((dt > LOOSE_LANDING_TIME) & loose[s + 1:end])))
+            hit = np.flatnonzero(landing_ok)
+            if len(hit):
+                # 着地検出: そのサンプルまでを指標に含める
+                c = s + 1 + int(hit[0])
+                window = total[s:c + 1]
+                phase = PHASE_NAMES[phases[hit[0]]]
+            elif end < n:
+                # タイムアウトによる強制終了: そのサンプルは指標に含めない
+                c = end
+                window = total[s:end]
+                phase = PHASE_NAMES[phases[-1]] if len(phases) else 'takeoff'
+            else:
+                # 記録がジャンプ中に終わっている
+                break
+
+            max_acc = float(window.max())
+            min_acc = float(window.min())
+            height = estimate_jump_height(max_acc, min_acc)
+            events.append({'type': 'complete', 'time': float(times[c]), 'details': {
+                'duration': float(times[c] - t0),
+                'height': height,
+                'power': estimate_jump_power(max_acc, min_acc, phase),
+                'max_acc': max_acc,
+                'min_acc': min_acc,
+            }})
+            k = c + 1
+
+        return events
+
+    def detect_session(self, path):
+        """セッションディレクトリまたはCSVファイルを読み込んでジャンプイベントを返す"""
+        data = load_session(path)
+        return self.detect(data[:, 0], data[:, 1], data[:, 2], data[:, 3])
+
+
+def load_session(path):
+    """acceleration_data CSV を読み込み (Time, X_G, Y_G, Z_G) の配列を返す
+
+    ディレクトリを渡した場合は中の acceleration_data_*.csv をファイル名順に連結する。
+    時刻が巻き戻るサンプル（重複して保存された区間）は除外する。
+    """
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, 'acceleration_data_*.csv')))
+    else:
+        files = [path]
+
+    parts = []
+    last_time = -np.inf
+    for file in files:
+        data = np.loadtxt(file, delimiter=',', skiprows=1, usecols=(0, 1, 2, 3), ndmin=2)
+        data = data[data[:, 0] > last_time]
+        if len(data):
+            last_time = data[-1, 0]
+            parts.append(data)
+    if not parts:
+        return np.empty((0, 4))
+    return np.concatenate(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='記録済みセッションのジャンプを一括検出')
+    parser.add_argument('paths', nargs='+', help='セッションディレクトリまたは acceleration_data CSV')
+    parser.add_argument('--high', type=float, default=1.3, help='ジャンプ開始閾値 (G)')
+    parser.add_argument('--low', type=float, default=0.7, help='自由落下閾値 (G)')
+    parser.add_argument('--stable', type=float, default=0.15, help='着地安定判定の変動幅 (G)')
+    parser.add_argument('--max-duration', type=float, default=3.0, help='ジャンプのタイムアウト (秒)')
+    args = parser.parse_args()
+
+    detector = BatchJumpDetector(args.high, args.low, args.stable, args.max_duration)
+    for path in args.paths:
+        events = detector.detect_session(path)
+        completed = [e['details'] for e in events if e['type'] == 'complete']
+        if completed:
+            heights = [d['height'] for d in completed]
+            print(f"{path}: ジャンプ {len(completed)}回, "
+                  f"最大 {max(heights):.1f}cm, 平均 {sum(heights) / len(heights):.1f}cm")
+        else:
+            print(f"{path}: ジャンプ 0回")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# mesh_ble.py
+# MESH ブロック共通の BLE 接続管理:
+# スキャン・接続・通知の開始・初期化コマンドの送信をまとめて行います。
+# 一度見つけたブロックの名前とアドレスはファイルに覚えておき、次回からはスキャンせずに
+# アドレスで直接接続します（すぐにつながらなければそのアドレスは忘れ、スキャンし直します）。
+# 接続中は切断を見張り、切れたら待ち時間を延ばしながら（指数バックオフ）自動で再接続します。
+# スキャンは MeshDiscovery が1台のスキャナーでまとめて行うので、
+# 複数種類のブロックを同時に探しても1回分のスキャン時間で見つかります。
+
+import asyncio
+import json
+import os
+import weakref
+from collections import namedtuple
+from struct import pack
+
+# UUID (MESHブロック共通)
+CORE_INDICATE_UUID = '72c90005-57a9-4d40-b746-534e22ec9f9e'
+CORE_NOTIFY_UUID   = '72c90003-57a9-4d40-b746-534e22ec9f9e'
+CORE_WRITE_UUID    = '72c90004-57a9-4d40-b746-534e22ec9f9e'
+
+# 初期化コマンド: 制御モードへ
+INIT_COMMAND = pack('<BBBB', 0, 2, 1, 3)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_PATH = os.path.join(BASE_DIR, "mesh_devices.json")
+
+# 覚えているブロック（スキャン結果の BLEDevice の代わりに接続先として使える）
+CachedDevice = namedtuple('CachedDevice', ['name', 'address'])
+
+
+class DeviceCache:
+    """見つけた MESH ブロックの名前とアドレスを覚えておくファイル"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        self.devices = {}  # アドレス → 名前
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.devices = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def lookup(self, prefix):
+        """名前が prefix で始まる、覚えているブロックの一覧"""
+        return sorted(CachedDevice(name, address) for address, name in self.devices.items()
+                      if name.startswith(prefix))
+
+    def remember(self, name, address):
+        if not name or self.devices.get(address) == name:
+            return
+        self.devices[address] = name
+        self._save()
+
+    def forget(self, address):
+        if self.devices.pop(address, None) is not None:
+            self._save()
+
+    def _save(self):
+        # 書き込み途中のファイルが読まれないよう、一時ファイルに書いてから置き換える
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.devices, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"デバイス情報の保存に失敗: {e}")
+
+
+_cache = None
+
+
+def default_cache():
+    """プロセス内で共有する DeviceCache"""
+    global _cache
+    if _cache is None:
+        _cache = DeviceCache()
+    return _cache
+
+
+def _ignore(sender, data):
+    pass
+
+
+class MeshDiscovery:
+    """1台のスキャナーで、複数種類のブロックの探索依頼をまとめて受け付ける
+
+    find(prefix) は、名前が prefix で始まるブロックが見つかったときに結果が入る Future を返す。
+    スキャナーは探索中の依頼がある間だけ動かし、広告を受信するたびに
+    （discover() のようにスキャン時間の終わりを待たず）その場で依頼と照合する。
+    """
+
+    def __init__(self, linger=1.0):
+        self.linger = linger  # 依頼がなくなってからスキャナーを止めるまでの猶予（続けて来る依頼に備える）
+        self._waiters = []    # [(prefix, 除外するアドレス, Future)]
+        self._seen = {}       # 今回のスキャンで見つけたブロック  アドレス → (名前, BLEDevice)
+        self._changed = asyncio.Event()
+        self._runner = None
+
+    def find(self, prefix, exclude=()):
+        """名前が prefix で始まるブロック（exclude のアドレスは除く）を探す Future を返す"""
+        future = asyncio.get_running_loop().create_future()
+        for name, device in self._seen.values():
+            if name.startswith(prefix) and device.address not in exclude:
+                future.set_result(device)
+                return future
+        self._waiters.append((prefix, frozenset(exclude), future))
+        future.add_done_callback(self._on_done)
+        self._changed.set()
+        if self._runner is None:
+            self._runner = asyncio.create_task(self._run())
+        return future
+
+    async def find_all(self, prefix, timeout, limit=None, exclude=()):
+        """timeout 秒のあいだに見つかった prefix のブロックを返す（limit 台そろえばそこで終わる）"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        found = []
+        while limit is None or len(found) < limit:
+            future = self.find(prefix, exclude=set(exclude) | {d.address for d in found})
+            try:
+                found.append(await asyncio.wait_for(future, max(deadline - loop.time(), 0)))
+            except asyncio.TimeoutError:
+                break
+        return found
+
+    def _on_done(self, future):
+        # 見つかった・取り消された依頼を外し、残りがなければスキャナーを止める
+        self._waiters = [w for w in self._waiters if w[2] is not future]
+        self._changed.set()
+
+    def _on_detect(self, device, advertisement_data):
+        name = device.name or advertisement_data.local_name
+        if not name or not name.startswith('MESH-'):
+            return
+        # DeviceCache に覚えるのは接続できたブロックだけ（MeshConnection._open で行う）
+        self._seen.setdefault(device.address, (name, device))
+        for prefix, exclude, future in list(self._waiters):
+            if not future.done() and name.startswith(prefix) and device.address not in exclude:
+                future.set_result(device)
+
+    async def _run(self):
+        from bleak import BleakScanner
+        try:
+            while self._waiters:
+                scanner = BleakScanner(detection_callback=self._on_detect)
+                await scanner.start()
+                try:
+                    while True:
+                        self._changed.clear()
+                        if self._waiters:
+                            await self._changed.wait()
+                            continue
+                        try:
+                            await asyncio.wait_for(self._changed.wait(), self.linger)
+                        except asyncio.TimeoutError:
+                            break
+                finally:
+                    await scanner.stop()
+                    self._seen.clear()
+        except Exception as e:
+            for _, _, future in self._waiters:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._runner = None
+
+
+_discoveries = weakref.WeakKeyDictionary()
+
+
+def default_discovery():
+    """実行中の asyncio ループで共有する MeshDiscovery"""
+    loop = asyncio.get_running_loop()
+    if loop not in _discoveries:
+        _discoveries[loop] = MeshDiscovery()
+    return _discoveries[loop]
+
+
+async def scan(prefix, timeout=None, discovery=None):
+    """名前が prefix で始まるブロックをスキャンして返す（timeout 秒以内に見つからなければ None）"""
+    discovery = discovery or default_discovery()
+    try:
+        return await asyncio.wait_for(discovery.find(prefix), timeout)
+    except asyncio.TimeoutError:
+        return None
+
+
+class MeshConnection:
+    """MESH ブロック1台との接続を保ち続ける
+
+    prefix:      ブロックの種類（'MESH-100LE' など）。覚えているアドレスへ直接接続し、
+                 つながらなければスキャンして探す
+    device:      接続先（スキャン済みの BLEDevice や CachedDevice）。prefix がなければそこにだけ接続し、
+                 prefix もあればつながらなかったときに prefix でスキャンして探し直す
+    on_notify / on_indicate: 通知を受け取る関数 (sender, data)
+    discovery:   スキャンに使う MeshDiscovery（省略時はループ内で共有するもの）
+    keepalive_interval: この間隔（秒）で接続状態を確かめる。切断の通知が届かない環境への備え
+    direct_attempts / direct_timeout: 覚えているアドレスへ直接接続を試す台数と、1台あたりの待ち時間（秒）。
+                 つながらなかったアドレスは忘れ、すぐにスキャンへ切り替える
+
+    start() で接続を始め、wait_ready() で初期化の完了を待つ。async with でも使える。
+    """
+
+    def __init__(self, prefix=None, device=None, on_notify=None, on_indicate=None, cache=None,
+                 discovery=None, connect_timeout=15.0, scan_timeout=None, max_reconnect_delay=30.0,
+                 keepalive_interval=5.0, direct_attempts=2, direct_timeout=5.0):
+        if prefix is None and device is None:
+            raise ValueError("prefix か device のどちらかを指定してください")
+        self.prefix = prefix
+        self.device = device
+        self.name = getattr(device, 'name', None) or prefix
+        self.address = getattr(device, 'address', None)
+        self.on_notify = on_notify or _ignore
+        self.on_indicate = on_indicate or _ignore
+        self.cache = cache or default_cache()
+        self.discovery = discovery
+        self.connect_timeout = connect_timeout
+        self.scan_timeout = scan_timeout
+        self.max_reconnect_delay = max_reconnect_delay
+        self.keepalive_interval = keepalive_interval
+        self.direct_attempts = direct_attempts
+        self.direct_timeout = direct_timeout
+        self.client = None
+        self.ready = asyncio.Event()
+        self._disconnected = asyncio.Event()
+        self._task = None
+        self._closing = False
+
+    @property
+    def connected(self):
+        return self.ready.is_set()
+
+    def start(self):
+        """接続と再接続を続けるタスクを開始（実行中の asyncio ループから呼ぶ）"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self
+
+    async def wait_ready(self, timeout=None):
+        """初期化まで済んだ接続ができるまで待つ（timeout 秒を過ぎたら asyncio.TimeoutError）"""
+        await asyncio.wait_for(self.ready.wait(), timeout)
+        return self
+
+    async def write(self, payload, response=True):
+        """ブロックにコマンドを書き込む（未接続なら ConnectionError）"""
+        if not self.connected:
+            raise ConnectionError(f"{self.name} は未接続です")
+        await self.client.write_gatt_char(CORE_WRITE_UUID, payload, response=response)
+
+    async def close(self):
+        """再接続をやめて切断する"""
+        self._closing = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._disconnect()
+
+    async def __aenter__(self):
+        return await self.start().wait_ready()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def run(self):
+        """接続し、切れたら再接続し続ける（close() まで戻らない）"""
+        delay = 1.0
+        while not self._closing:
+            try:
+                await self._connect()
+                delay = 1.0
+                self.ready.set()
+                print(f"🎯 {self.name} 準備完了!")
+                await self._watch()
+                print(f"⚠️ {self.name} が切断されました")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ {self.name} 接続エラー: {e}")
+            finally:
+                self.ready.clear()
+            await self._disconnect()
+            if self._closing:
+                break
+            print(f"🔄 {self.name}: {delay:.0f}秒後に再接続します")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _connect(self):
+        """接続先を決めて接続する: 指定されたデバイスか覚えているアドレス → スキャン"""
+        if self.device is not None and self.prefix is None:
+            await self._open(self.device, self.connect_timeout)
+            return
+        if self.device is not None:
+            candidates = [self.device]
+        else:
+            # 再接続では直前までつながっていたアドレスから試す
+            candidates = sorted(self.cache.lookup(self.prefix), key=lambda d: d.address != self.address)
+            candidates = candidates[:self.direct_attempts]
+        for device in candidates:
+            cached = isinstance(device, CachedDevice)
+            try:
+                await self._open(device, self.direct_timeout if cached else self.connect_timeout)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"{device.name} ({device.address}) に直接接続できません: {e}")
+                if cached:
+                    # 電源が切れている・アドレスが変わったブロックで毎回待たないよう忘れる（次に接続できたら覚え直す）
+                    self.cache.forget(device.address)
+                    if device is self.device:
+                        self.device = None
+        print(f"{self.prefix} をスキャン中...")
+        device = await scan(self.prefix, timeout=self.scan_timeout, discovery=self.discovery)
+        if device is None:
+            raise ConnectionError(f"{self.prefix} が見つかりません")
+        await self._open(device, self.connect_timeout)
+
+    async def _open(self, device, timeout):
+        """接続して通知を開始し、初期化コマンドを送る（timeout は接続の待ち時間）"""
+        from bleak import BleakClient
+        print(f"📱 接続中: {device.name} ({device.address})")
+        disconnected = asyncio.Event()
+        # 覚えているブロックはアドレスで接続する（BLEDevice はそのまま渡す）
+        target = device.address if isinstance(device, CachedDevice) else device
+        client = BleakClient(target, timeout=timeout,
+                             disconnected_callback=lambda _: disconnected.set())
+        await client.connect()
+        try:
+            await client.start_notify(CORE_NOTIFY_UUID, self.on_notify)
+            await client.start_notify(CORE_INDICATE_UUID, self.on_indicate)
+            await client.write_gatt_char(CORE_WRITE_UUID, INIT_COMMAND, response=True)
+        except BaseException:
+            await client.disconnect()
+            raise
+        self.client = client
+        self._disconnected = disconnected
+        self.name = device.name or self.name
+        self.address = device.address
+        self.cache.remember(device.name, device.address)
+
+    async def _watch(self):
+        """切断されるまで待つ"""
+        while not self._disconnected.is_set():
+            try:
+                await asyncio.wait_for(self._disconnected.wait(), self.keepalive_interval)
+            except asyncio.TimeoutError:
+                if not self.client.is_connected:
+                    return
+
+    async def _disconnect(self):
+        client, self.client = self.client, None
+        if client is None:
+            return
+        try:
+            await client.disconnect()
+        except Exception:
+            pass
@@ -0,0 +1,72 @@
+"""MESH動きブロック（MESH-100AC）通知フレームの一括デコーダ
+
+通知フレームの形式:
+    [0] メッセージタイプ (0x01)  [1] イベント種別  [2:4] 予約
+    [4:6] X  [6:8] Y  [8:10] Z   （リトルエンディアン, 1/1024 G 単位）
+
+フレームを1件ずつスライスして unpack する代わりに、まとめて NumPy 配列として解釈する。
+ライブ受信とジャーナル再生のどちらも、受け渡しキューから取り出した複数フレームをまとめて渡す。
+"""
+from collections import namedtuple
+
+import numpy as np
+
+MESSAGE_TYPE_ID = 0x01
+EVENT_TYPE_TAP = 0x00
+EVENT_TYPE_SHAKE = 0x01
+EVENT_TYPE_FLIP = 0x02
+EVENT_TYPE_ORIENTATION = 0x03
+
+EVENT_NAMES = {
+    EVENT_TYPE_TAP: "タップ",
+    EVENT_TYPE_SHAKE: "シェイク",
+    EVENT_TYPE_FLIP: "フリップ",
+    EVENT_TYPE_ORIENTATION: "向き変更",
+}
+
+MIN_FRAME_SIZE = 10
+_ACCEL_OFFSETS = np.arange(4, 10)
+
+# index: 入力フレーム中の位置, event_type: イベント種別, accel: (n, 3) の加速度 [G]
+DecodedFrames = namedtuple('DecodedFrames', ['index', 'event_type', 'accel'])
+
+
+def raw_to_g(raw):
+    """センサー値（uint16）の配列を加速度（G）に変換
+
+    2047 を超える値は2の補数の負数として扱い、1024 で割って G に直す。
+    """
+    values = raw.astype(np.float64)
+    values[raw > 2047] -= 65536
+    values /= 1024.0
+    return values
+
+
+def _empty():
+    return DecodedFrames(np.empty(0, dtype=np.intp), np.empty(0, dtype=np.uint8), np.empty((0, 3)))
+
+
+def decode_frames(frames):
+    """長さの異なりうる通知フレームの列をまとめてデコード
+
+    加速度メッセージでないフレームや短すぎるフレームは結果から除かれる。
+    元の順序は DecodedFrames.index で対応付ける。
+    """
+    n = len(frames)
+    if n == 0:
+        return _empty()
+    lengths = np.fromiter(map(len, frames), dtype=np.intp, count=n)
+    buf = np.frombuffer(b''.join(frames), dtype=np.uint8)
+    offsets = np.zeros(n, dtype=np.intp)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+
+    index = np.flatnonzero(lengths >= MIN_FRAME_SIZE)
+    offsets = offsets[index]
+    is_accel = buf[offsets] == MESSAGE_TYPE_ID
+    index = index[is_accel]
+    offsets = offsets[is_accel]
+    if len(index) == 0:
+        return _empty()
+
+    raw = buf[offsets[:, None] + _ACCEL_OFFSETS].view('<u2')
+    return DecodedFrames(index, buf[offsets + 1], raw_to_g(raw))
@@ -0,0 +1,217 @@
+"""MESHブロックの生パケットジャーナル・再生・疑似デバイス
+
+ジャーナル形式（リトルエンディアン）:
+    ヘッダ: b'MESHJRN1'
+    レコード: 受信時刻 float64 (UNIX秒) / データ長 uint16 / データ本体
+
+JournalReplay と SimulatedMotionBlock は同じ play(callback, speed) を持ち、
+実機の代わりに on_receive_notify(sender, data, timestamp) へ通知を流し込む。
+speed=1 で実時間、speed=N で N 倍速、speed=0 で待ち時間なし（全速）。
+流し込む timestamp は元の間隔を保つので、再生速度によらずジャンプ検出結果は変わらない。
+
+使い方（疑似セッションをジャーナルとして書き出す）:
+    python mesh_journal.py out.mjl --duration 600 --rate 50 --jump-interval 4
+"""
+import argparse
+import asyncio
+import math
+import queue
+import random
+import struct
+import threading
+import time
+
+JOURNAL_MAGIC = b'MESHJRN1'
+_RECORD_HEADER = struct.Struct('<dH')
+_STOP = object()
+
+
+class JournalWriter:
+    """受信した通知を生パケットジャーナルへ追記する（書き込みはバックグラウンドスレッド）"""
+
+    def __init__(self, path, batch_interval=0.5):
+        self.path = path
+        self.batch_interval = batch_interval
+        self.packets_written = 0
+        self._file = open(path, 'wb')
+        self._file.write(JOURNAL_MAGIC)
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='journal-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, timestamp, data):
+        """1パケットを記録キューに積む（即座に戻る）"""
+        if not self._closed:
+            self._queue.put((timestamp, data))
+
+    def close(self, timeout=10.0):
+        """残りを書き出してファイルを閉じる（複数回呼んでもよい）"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            try:
+                batch = [self._queue.get(timeout=self.batch_interval)]
+            except queue.Empty:
+                continue
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            # close() と同時に write() されると _STOP の後にも積まれるので、_STOP の位置で切る
+            for i, item in enumerate(batch):
+                if item is _STOP:
+                    del batch[i:]
+                    stop = True
+                    break
+            chunks = []
+            for timestamp, data in batch:
+                chunks.append(_RECORD_HEADER.pack(timestamp, len(data)))
+                chunks.append(bytes(data))
+            try:
+                self._file.write(b''.join(chunks))
+                self._file.flush()
+                self.packets_written += len(batch)
+            except Exception as e:
+                print(f"⚠️ ジャーナル書き込みエラー: {e}")
+        self._file.close()
+
+
+def write_journal(path, packets):
+    """(時刻, データ) の列をジャーナルファイルとして一括で書き出す"""
+    with open(path, 'wb') as f:
+        f.write(JOURNAL_MAGIC)
+        for timestamp, data in packets:
+            f.write(_RECORD_HEADER.pack(timestamp, len(data)))
+            f.write(bytes(data))
+
+
+def read_journal(path):
+    """ジャーナルファイルを読み込み (時刻, データ) のリストを返す"""
+    with open(path, 'rb') as f:
+        buf = f.read()
+    if not buf.startswith(JOURNAL_MAGIC):
+        raise ValueError(f"ジャーナル形式ではありません: {path}")
+    packets = []
+    pos = len(JOURNAL_MAGIC)
+    header_size = _RECORD_HEADER.size
+    while pos + header_size <= len(buf):
+        timestamp, length = _RECORD_HEADER.unpack_from(buf, pos)
+        pos += header_size
+        if pos + length > len(buf):
+            break  # 書き込み途中で終わったレコード
+        packets.append((timestamp, buf[pos:pos + length]))
+        pos += length
+    return packets
+
+
+async def play_packets(packets, callback, speed=1.0):
+    """(時刻, データ) の列を callback(sender, data, timestamp) へ speed 倍速で流す"""
+    if not packets:
+        return
+    t0 = packets[0][0]
+    wall0 = time.perf_counter()
+    base = time.time()
+    for n, (timestamp, data) in enumerate(packets):
+        if speed:
+            delay = (timestamp - t0) / speed - (time.perf_counter() - wall0)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif n % 256 == 0:
+            await asyncio.sleep(0)  # 全速でも他のタスクが動けるようにする
+        callback(None, data, base + (timestamp - t0))
+
+
+class JournalReplay:
+    """ジャーナルファイルを実機の代わりに再生する"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = f"replay:{path}"
+
+    async def play(self, callback, speed=1.0):
+        packets = read_journal(self.path)
+        print(f"▶ ジャーナル再生: {self.path} ({len(packets)}パケット, {speed or '全速'}倍速)")
+        await play_packets(packets, callback, speed)
+
+
+def encode_motion_frame(x_g, y_g, z_g, event_type=0):
+    """加速度（G）から動きブロックの通知フレームを作る（±2G 未満に制限）"""
+    def to_raw(g):
+        g = max(min(g, 1.999), -1.999)
+        return int(round(g * 1024)) & 0xFFFF
+    frame = struct.pack('<BBBBHHH', 1, event_type, 0, 0, to_raw(x_g), to_raw(y_g), to_raw(z_g))
+    return frame + bytes([sum(frame) & 0xFF])
+
+
+class SimulatedMotionBlock:
+    """一定間隔でジャンプする疑似的な動きブロック
+
+    静止時は Z 軸に 1G と小さなノイズ、ジャンプ時は
+    踏み切り（1.4〜1.9G）→ 空中（約0.2G）→ 着地（1.9G→1.0G）の波形を出す。
+    """
+
+    def __init__(self, duration=60.0, rate=50.0, jump_interval=5.0, seed=None):
+        self.duration = duration
+        self.rate = rate
+        self.jump_interval = jump_interval
+        self.name = 'MESH-100AC(simulated)'
+        self._random = random.Random(seed)
+
+    def _jump_profile(self):
+        """1回分のジャンプの合成加速度列"""
+        rnd = self._random
+        flight = max(int(self.rate * rnd.uniform(0.3, 0.5)), 2)
+        return ([1.4, rnd.uniform(1.7, 1.95), 1.6]
+                + [rnd.uniform(0.1, 0.3) for _ in range(flight)]
+                + [1.9, 1.5, 1.2])
+
+    def packets(self, start_time=0.0):
+        """(時刻, フレーム) のリストを生成"""
+        rnd = self._random
+        dt = 1.0 / self.rate
+        n = int(self.duration * self.rate)
+        jump_every = max(int(self.jump_interval * self.rate), 1)
+        profile = []
+        packets = []
+        for i in range(n):
+            if i % jump_every == jump_every - 1:
+                profile = self._jump_profile()
+            total = profile.pop(0) if profile else 1.0 + rnd.gauss(0, 0.02)
+            x_g = rnd.gauss(0, 0.02)
+            y_g = rnd.gauss(0, 0.02)
+            z_g = math.sqrt(max(total ** 2 - x_g ** 2 - y_g ** 2, 0.0))
+            packets.append((start_time + i * dt, encode_motion_frame(x_g, y_g, z_g)))
+        return packets
+
+    async def play(self, callback, speed=1.0):
+        packets = self.packets(time.time())
+        print(f"▶ 疑似動きブロック: {self.duration:.0f}秒, {self.rate:.0f}Hz, "
+              f"{self.jump_interval:.1f}秒ごとにジャンプ")
+        await play_packets(packets, callback, speed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='疑似動きブロックのセッションをジャーナルに書き出す')
+    parser.add_argument('path', help='出力するジャーナルファイル')
+    parser.add_argument('--duration', type=float, default=60.0, help='長さ（秒）')
+    parser.add_argument('--rate', type=float, default=50.0, help='サンプリングレート（Hz）')
+    parser.add_argument('--jump-interval', type=float, default=5.0, help='ジャンプの間隔（秒）')
+    parser.add_argument('--seed', type=int, default=None, help='乱数シード')
+    args = parser.parse_args()
+
+    block = SimulatedMotionBlock(args.duration, args.rate, args.jump_interval, args.seed)
+    packets = block.packets(time.time())
+    write_journal(args.path, packets)
+    print(f"💾 {len(packets)}パケットを書き出しました: {args.path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""センサー受信から画面表示までの各段階の所要時間を集計する
+
+各段階の所要時間を対数間隔ビンのヒストグラムに数え（メモリ一定・記録は O(1)）、
+セッション終了時に p50 / p95 / p99 を含む表を書き出す。
+"""
+import json
+import math
+import os
+import time
+from contextlib import contextmanager
+
+
+class LatencyHistogram:
+    """対数間隔のビンで所要時間（秒）を数えるヒストグラム"""
+    BINS_PER_DECADE = 20
+    MIN_SECONDS = 1e-6  # 1µs
+    DECADES = 7         # 1µs 〜 10s
+
+    def __init__(self):
+        # 先頭は MIN_SECONDS 以下、末尾は上限超え
+        self.counts = [0] * (self.BINS_PER_DECADE * self.DECADES + 2)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, seconds):
+        if seconds <= self.MIN_SECONDS:
+            i = 0
+        else:
+            i = int(math.log10(seconds / self.MIN_SECONDS) * self.BINS_PER_DECADE) + 1
+            i = min(i, len(self.counts) - 1)
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def _upper_edge(self, i):
+        return self.MIN_SECONDS * 10 ** (i / self.BINS_PER_DECADE)
+
+    def percentile(self, p):
+        """p パーセンタイル（秒）。ビンの上端で近似し、最大値を超えないようにする"""
+        if self.count == 0:
+            return 0.0
+        target = self.count * p / 100.0
+        cumulative = 0
+        for i, c in enumerate(self.counts):
+            cumulative += c
+            if cumulative >= target:
+                return max(min(self._upper_edge(i), self.max), self.min)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class PipelineStats:
+    """段階ごとのヒストグラムと、取りこぼしなどのカウンタをまとめて持つ"""
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.started_at = time.time()
+        self._last_frame = None
+
+    def record(self, stage, seconds):
+        """stage の所要時間（秒）を1件記録"""
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def count(self, name, n=1):
+        """カウンタ name を n 増やす"""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def record_frame(self, target_interval):
+        """描画フレームの開始時に呼び、フレーム間隔と遅れ・取りこぼしフレーム数を記録"""
+        now = time.perf_counter()
+        if self._last_frame is not None:
+            interval = now - self._last_frame
+            self.record('frame_interval', interval)
+            if interval > target_interval * 1.5:
+                self.count('late_frames')
+                self.count('dropped_frames', int(round(interval / target_interval)) - 1)
+        self._last_frame = now
+
+    @contextmanager
+    def measure(self, stage):
+        """with ブロックの所要時間を stage として記録"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def to_dict(self):
+        stages = {}
+        for stage, h in self.histograms.items():
+            stages[stage] = {
+                'count': h.count,
+                'mean_ms': h.mean * 1000,
+                'p50_ms': h.percentile(50) * 1000,
+                'p95_ms': h.percentile(95) * 1000,
+                'p99_ms': h.percentile(99) * 1000,
+                'max_ms': h.max * 1000,
+            }
+        return {'stages': stages, 'counters': dict(self.counters)}
+
+    def report(self):
+        """段階ごとの統計を表形式の文字列にする"""
+        lines = [f"{'段階':<24}{'件数':>10}{'平均ms':>10}{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}{'最大ms':>10}"]
+        for stage, s in self.to_dict()['stages'].items():
+            lines.append(f"{stage:<24}{s['count']:>10}{s['mean_ms']:>10.3f}{s['p50_ms']:>10.3f}"
+                         f"{s['p95_ms']:>10.3f}{s['p99_ms']:>10.3f}{s['max_ms']:>10.3f}")
+        for name, value in self.counters.items():
+            lines.append(f"{name}: {value}")
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        """統計を path（.txt）と同名の .json に書き出す"""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.report() + '\n')
+        with open(os.path.splitext(path)[0] + '.json', 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# mesh_led.py
+# MESH LEDブロック（MESH-100LE）の命令の組み立てと送信:
+# 命令のバイト列は事前にコンパイルした struct.Struct で作り、色・点灯パターンのプリセットは
+# 一度作ったバイト列を使い回します。
+# LedSequencer は書き込みを1つずつ行い、書き込み中に届いた命令は最新の1つだけを残すので、
+# BLE の書き込みが命令の頻度に追いつかなくても命令が溜まって遅れることがありません。
+
+import asyncio
+import struct
+from functools import lru_cache
+
+# 命令の形式: メッセージタイプ(1), イベント(0), 赤, 予約, 緑, 予約, 青,
+#             点灯時間[ms], 点灯[ms], 消灯[ms], パターン  の後にチェックサム1バイト
+LED_STRUCT = struct.Struct('<BBBBBBBHHHB')
+MESSAGE_TYPE = 1
+
+PATTERN_BLINK   = 1  # 点滅
+PATTERN_FIREFLY = 2  # ホタル（ゆっくり明滅）
+
+# 色・点灯パターンのプリセット（色は 0〜127）
+PRESETS = {
+    'on':      dict(red=2,  green=8,  blue=32, duration=5000, on_time=1000, off_time=500),
+    'off':     dict(red=0,  green=0,  blue=0,  duration=0,    on_time=0,    off_time=0),
+    'red':     dict(red=32, green=0,  blue=0,  duration=5000, on_time=5000, off_time=0),
+    'green':   dict(red=0,  green=32, blue=0,  duration=5000, on_time=5000, off_time=0),
+    'blue':    dict(red=0,  green=0,  blue=32, duration=5000, on_time=5000, off_time=0),
+    'yellow':  dict(red=32, green=32, blue=0,  duration=5000, on_time=5000, off_time=0),
+    'purple':  dict(red=32, green=0,  blue=32, duration=5000, on_time=5000, off_time=0),
+    'white':   dict(red=32, green=32, blue=32, duration=5000, on_time=5000, off_time=0),
+    'firefly': dict(red=2,  green=8,  blue=32, duration=5000, on_time=1000, off_time=500,
+                    pattern=PATTERN_FIREFLY),
+}
+
+# アニメーション: (プリセット名, 表示する秒数) の並び
+ANIMATIONS = {
+    'rainbow': [('red', 0.3), ('yellow', 0.3), ('green', 0.3), ('blue', 0.3), ('purple', 0.3), ('off', 0)],
+}
+
+
+@lru_cache(maxsize=256)
+def encode(red, green, blue, duration=5000, on_time=1000, off_time=500, pattern=PATTERN_BLINK):
+    """LEDの命令（チェックサム付きのバイト列）を作る"""
+    buffer = bytearray(LED_STRUCT.size + 1)
+    LED_STRUCT.pack_into(buffer, 0, MESSAGE_TYPE, 0, red, 0, green, 0, blue,
+                         duration, on_time, off_time, pattern)
+    buffer[-1] = sum(buffer) & 0xFF
+    return bytes(buffer)
+
+
+@lru_cache(maxsize=None)
+def preset(name):
+    """プリセット名の命令（不明な名前なら KeyError）"""
+    return encode(**PRESETS[name])
+
+
+def animation(name):
+    """アニメーション名の (命令, 秒数) の並び（不明な名前なら KeyError）"""
+    return [(preset(step), hold) for step, hold in ANIMATIONS[name]]
+
+
+def _resolve(future, result):
+    # 待っている側がキャンセルした Future には結果を入れない
+    if not future.done():
+        future.set_result(result)
+
+
+class LedSequencer:
+    """LEDへの書き込みを1つずつ行い、書き込み待ちの命令は最新の1つだけを残す
+
+    connection: async write(payload) を持つ接続（mesh_ble.MeshConnection など）
+    min_interval: 書き込みの最小間隔（秒）。これより速い更新は最後の命令にまとめる
+
+    submit() は asyncio ループ内から呼ぶ（別スレッドからは loop.call_soon_threadsafe 経由で）。
+    """
+
+    def __init__(self, connection, min_interval=0.0):
+        self.connection = connection
+        self.min_interval = min_interval
+        self.sent = 0     # 書き込んだ命令の数
+        self.dropped = 0  # 新しい命令に置き換えられて捨てた命令の数
+        self._pending = None
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._animation = None
+
+    def submit(self, payload):
+        """命令を書き込み待ちにする（待っている古い命令は捨てる）
+
+        書き込めたら True、新しい命令に置き換えられたか書き込みに失敗したら False が入る Future を返す。
+        """
+        future = asyncio.get_running_loop().create_future()
+        if self._pending is not None:
+            self.dropped += 1
+            _resolve(self._pending[1], False)
+        self._pending = (payload, future)
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            # 初回か、書き込みタスクが止まっていたら（キャンセル・想定外の例外）起動し直す
+            self._task = asyncio.create_task(self._run())
+        return future
+
+    def show(self, name):
+        """プリセットかアニメーションを名前で表示する（再生中のアニメーションは止める）
+
+        最初のコマが書き込まれるのを待てる Future を返す。
+        """
+        self.stop_animation()
+        if name not in ANIMATIONS:
+            return self.submit(preset(name))
+        frames = animation(name)
+        first = self.submit(frames[0][0])
+        self._animation = asyncio.create_task(self.play(frames, start=1))
+        return first
+
+    async def play(self, frames, start=0):
+        """アニメーションを再生する。frames は (命令, 秒数) の並び
+
+        書き込みが間に合わないコマは飛ばされ、表示は常に今のコマに追いつく。
+        """
+        for i, (payload, hold) in enumerate(frames):
+            if i >= start:
+                self.submit(payload)
+            await asyncio.sleep(hold)
+
+    def stop_animation(self):
+        if self._animation is not None and not self._animation.done():
+            self._animation.cancel()
+        self._animation = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            pending, self._pending = self._pending, None
+            if pending is None:
+                continue
+            payload, future = pending
+            start = loop.time()
+            try:
+                await self.connection.write(payload)
+                self.sent += 1
+                _resolve(future, True)
+            except asyncio.CancelledError:
+                _resolve(future, False)
+                raise
+            except Exception as e:
+                print("LED制御エラー:", e)
+                _resolve(future, False)
+            wait = self.min_interval - (loop.time() - start)
+            if wait > 0:
+                await asyncio.sleep(wait)
@@ -0,0 +1,144 @@
+"""追記専用のストリーミング記録（MESHブロックの計測データ保存用）
+
+BLE通知処理から呼ばれる write() はキューに積むだけで、ディスクへの書き込みは
+バックグラウンドスレッドがまとめて行う。各サンプルは1度だけ書き出され、
+ファイルはサイズまたは経過時間でローテーションする。
+
+バイナリ形式を有効にすると、CSVと同じ区切りで列ごとの生 float32 ファイル
+（<列名>.f32）も出力する。読み込みは np.fromfile(path, dtype='<f4') で行える。
+時刻の列（既定では Time）は float32 では長時間の計測で精度が落ちるため float64
+（<列名>.f64, dtype='<f8'）で書き出す。列ごとの dtype は schema.json に記録する。
+"""
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+_STOP = object()
+
+
+class StreamRecorder:
+    """行データを追記専用ファイルへ流し込むバックグラウンド書き込み器"""
+
+    def __init__(self, save_dir, basename, header, fmt=None, formatter=None,
+                 binary=False, rotate_bytes=50 * 1024 * 1024, rotate_seconds=3600,
+                 batch_interval=0.5, float64_columns=('Time',)):
+        """
+        header: 列名のリスト
+        fmt: 列ごとの書式（例: ['%.3f', '%d']）。formatter を渡した場合は不要
+        formatter: 1行分のデータを受け取り、改行なしのCSV文字列を返す関数
+        binary: True なら列ごとの float32 ファイルも書き出す（数値列のみ）
+        rotate_bytes / rotate_seconds: この大きさ・時間を超えたら新しいファイルに切り替える
+        batch_interval: まとめ書きの間隔（秒）
+        float64_columns: バイナリ形式で float64 のまま書き出す列（時刻など）
+        """
+        self.save_dir = save_dir
+        self.basename = basename
+        self.header = list(header)
+        if formatter is None:
+            line_format = ','.join(fmt)
+            formatter = lambda row: line_format % tuple(row)
+        self.formatter = formatter
+        self.binary = binary
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.batch_interval = batch_interval
+        self.dtypes = ['<f8' if c in float64_columns else '<f4' for c in self.header]
+
+        self.rows_written = 0
+        self.files = []  # 作成したCSVファイルのパス（作成順）
+
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        self._segment = 0
+        self._csv = None
+        self._columns = None
+        self._opened_at = 0.0
+        self._thread = threading.Thread(target=self._run, name=f"recorder-{basename}", daemon=True)
+        self._thread.start()
+
+    def write(self, row):
+        """1行を記録キューに積む（ディスクI/Oは行わないので即座に戻る）"""
+        if not self._closed:
+            self._queue.put(row)
+
+    def close(self, timeout=10.0):
+        """キューに残っている行をすべて書き出してファイルを閉じる（複数回呼んでもよい）"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            try:
+                batch = [self._queue.get(timeout=self.batch_interval)]
+            except queue.Empty:
+                continue
+            # 溜まっている分をまとめて取り出す
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            # close() と同時に write() されると _STOP の後にも積まれるので、_STOP の位置で切る
+            for i, item in enumerate(batch):
+                if item is _STOP:
+                    del batch[i:]
+                    stop = True
+                    break
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    print(f"⚠️ 記録エラー ({self.basename}): {e}")
+        self._close_segment()
+
+    def _write_batch(self, batch):
+        if self._csv is None or self._needs_rotation():
+            self._open_segment()
+        self._csv.write(''.join(self.formatter(row) + '\n' for row in batch))
+        self._csv.flush()
+        if self._columns is not None:
+            columns = np.asarray(batch, dtype='<f8').T
+            for f, dtype, values in zip(self._columns, self.dtypes, columns):
+                f.write(values.astype(dtype).tobytes())
+                f.flush()
+        self.rows_written += len(batch)
+
+    def _needs_rotation(self):
+        if self._csv.tell() >= self.rotate_bytes:
+            return True
+        return time.time() - self._opened_at >= self.rotate_seconds
+
+    def _open_segment(self):
+        self._close_segment()
+        self._segment += 1
+        name = f"{self.basename}_{self._segment:04d}_{datetime.now().strftime('%H%M%S')}"
+        path = os.path.join(self.save_dir, name + '.csv')
+        self._csv = open(path, 'w', encoding='utf-8')
+        self._csv.write(','.join(self.header) + '\n')
+        self.files.append(path)
+        if self.binary:
+            col_dir = os.path.join(self.save_dir, name + '.cols')
+            os.makedirs(col_dir, exist_ok=True)
+            with open(os.path.join(col_dir, 'schema.json'), 'w', encoding='utf-8') as f:
+                json.dump({'columns': self.header, 'dtypes': self.dtypes}, f)
+            self._columns = [open(os.path.join(col_dir, c + ('.f64' if d == '<f8' else '.f32')), 'wb')
+                             for c, d in zip(self.header, self.dtypes)]
+        self._opened_at = time.time()
+
+    def _close_segment(self):
+        if self._csv is not None:
+            self._csv.close()
+            self._csv = None
+        if self._columns is not None:
+            for f in self._columns:
+                f.close()
+            self._columns = None
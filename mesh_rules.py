@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# mesh_rules.py
+# MESH ブロックの入力と出力をつなぐルールエンジン:
+# ボタンの押し方（1回・長押し・2回）や動きブロックのシェイク・フリップなどの入力イベントを、
+# 宣言的に書いたルールと照合し、優先度つきの非同期ディスパッチャーで出力アクションを実行します。
+# 止めるまで動き続け（Ctrl+C で終了）、ルールごとにイベント受信からアクション完了までの時間を計測します。
+#
+# 使い方:
+#   python mesh_rules.py                    # 既定のルールで起動
+#   python mesh_rules.py --stats rules.txt  # 終了時に所要時間の統計を書き出す
+
+import argparse
+import asyncio
+import itertools
+import time
+from collections import namedtuple
+
+from mesh_ble import MeshConnection
+from mesh_decoder import EVENT_TYPE_FLIP, EVENT_TYPE_SHAKE, MESSAGE_TYPE_ID
+from mesh_latency import PipelineStats
+from mesh_led import LedSequencer
+
+# 入力イベント  source: 入力ブロックの名前, name: イベント名, timestamp: 受信時刻 (perf_counter)
+Event = namedtuple('Event', ['source', 'name', 'timestamp', 'data'])
+
+BUTTON_EVENTS = {1: 'single', 2: 'long', 3: 'double'}
+# 動きブロックは加速度を流し続けるフレームもイベント種別 0（タップと同じ値）で送ってくるため、
+# タップはバイト列から区別できない。加速度のフレームをタップと取り違えないよう、種別 0 はイベントにしない
+MOTION_EVENTS = {EVENT_TYPE_SHAKE: 'shake', EVENT_TYPE_FLIP: 'flip'}
+
+
+def decode_button(data):
+    """ボタンブロック（MESH-100BU）の通知からイベント名を取り出す（押下イベントでなければ None）"""
+    if len(data) < 3 or data[0] != 1 or data[1] != 0:
+        return None
+    return BUTTON_EVENTS.get(data[2])
+
+
+def decode_motion(data):
+    """動きブロック（MESH-100AC）の通知からイベント名を取り出す（シェイク・フリップ以外は None）"""
+    if len(data) < 2 or data[0] != MESSAGE_TYPE_ID:
+        return None
+    return MOTION_EVENTS.get(data[1])
+
+
+# 入力ブロックの種類: 名前 → (名前の先頭, デコーダー)
+INPUTS = {
+    'button': ('MESH-100BU', decode_button),
+    'motion': ('MESH-100AC', decode_motion),
+}
+# 出力ブロックの種類: 名前 → 名前の先頭
+OUTPUTS = {
+    'led': 'MESH-100LE',
+}
+
+# 既定のルール: (入力, イベント, 出力, 表示するプリセット・アニメーション, 優先度)
+# 優先度は小さいほど先に実行する（消灯などの止める操作を優先する）
+DEFAULT_RULES = [
+    ('button', 'single', 'led', 'on',      10),
+    ('button', 'double', 'led', 'rainbow', 10),
+    ('button', 'long',   'led', 'off',     0),
+    ('motion', 'shake',  'led', 'rainbow', 20),
+    ('motion', 'flip',   'led', 'off',     0),
+]
+
+
+class Rule:
+    """入力イベントと出力アクションの対応
+
+    source:   入力ブロックの名前（'button' など）
+    event:    イベント名（'single', 'shake' など。None ならその入力のすべてのイベント）
+    action:   async action(engine, event) を行う関数
+    priority: 小さいほど先に実行する
+    cooldown: 同じルールを続けて実行しない時間（秒）。揺らし続けたときなどに連発しないように
+    output:   アクションの出力先の名前。同じ出力へのアクションは、より新しいイベントのものが
+              実行済みなら古いイベントのものを捨てる（優先度で順番が入れ替わっても最後の状態は最新のイベントに従う）
+    """
+
+    def __init__(self, name, source, event, action, priority=10, cooldown=0.0, output=None):
+        self.name = name
+        self.source = source
+        self.event = event
+        self.action = action
+        self.priority = priority
+        self.cooldown = cooldown
+        self.output = output
+        self.last_fired = float('-inf')
+
+    def matches(self, event):
+        return event.source == self.source and self.event in (None, event.name)
+
+
+def show_action(output, name):
+    """出力 output のLEDにプリセット・アニメーション name を表示するアクション"""
+    async def action(engine, event):
+        return await engine.outputs[output].show(name)
+    return action
+
+
+def make_rules(table):
+    """(入力, イベント, 出力, 表示, 優先度) の表から Rule の一覧を作る"""
+    return [Rule(f"{source}.{event}→{output}.{show}", source, event, show_action(output, show),
+                 priority=priority, cooldown=0.5 if source == 'motion' else 0.0, output=output)
+            for source, event, output, show, priority in table]
+
+
+class RuleEngine:
+    """入力ブロックのイベントをルールと照合し、出力アクションを優先度順に実行する
+
+    イベントは通知コールバック（asyncio ループ内）で照合して優先度つきキューに積むだけにし、
+    アクションは workers 個のディスパッチャータスクが優先度の高い順に取り出して実行する。
+    """
+
+    def __init__(self, rules=(), workers=2):
+        self.rules = list(rules)
+        self.workers = workers
+        self.connections = {}
+        self.outputs = {}
+        self.stats = PipelineStats()
+        self._queue = None
+        self._order = itertools.count()  # 同じ優先度では届いた順に実行する
+        self._applied = {}  # 出力ごとに、最後にアクションを実行したイベントの時刻
+
+    def add_rule(self, rule):
+        self.rules.append(rule)
+
+    def add_input(self, name, prefix, decoder):
+        """入力ブロックを登録（通知を decoder でイベント名に変換する）"""
+        def on_notify(sender, data):
+            event_name = decoder(data)
+            if event_name:
+                self.emit(name, event_name, bytes(data))
+        self.connections[name] = MeshConnection(prefix, on_notify=on_notify)
+
+    def add_output(self, name, prefix):
+        """出力LEDブロックを登録"""
+        connection = MeshConnection(prefix)
+        self.connections[name] = connection
+        self.outputs[name] = LedSequencer(connection)
+
+    def emit(self, source, name, data=None, timestamp=None):
+        """入力イベントを照合し、一致したルールのアクションをキューに積む"""
+        event = Event(source, name, timestamp or time.perf_counter(), data)
+        self.stats.count(f"event {source}.{name}")
+        for rule in self.rules:
+            if not rule.matches(event):
+                continue
+            if event.timestamp - rule.last_fired < rule.cooldown:
+                self.stats.count(f"cooldown {rule.name}")
+                continue
+            rule.last_fired = event.timestamp
+            self._queue.put_nowait((rule.priority, next(self._order), rule, event))
+
+    async def _dispatch(self):
+        while True:
+            _, _, rule, event = await self._queue.get()
+            self.stats.record(f"{rule.name} 待ち", time.perf_counter() - event.timestamp)
+            if rule.output is not None:
+                if event.timestamp < self._applied.get(rule.output, float('-inf')):
+                    self.stats.count(f"stale {rule.name}")
+                    self._queue.task_done()
+                    continue
+                self._applied[rule.output] = event.timestamp
+            try:
+                if await rule.action(self, event) is False:
+                    self.stats.count(f"not written {rule.name}")  # 新しい命令に置き換えられたか書き込み失敗
+                    continue
+                latency = time.perf_counter() - event.timestamp
+                self.stats.record(rule.name, latency)
+                print(f"⚡ {rule.name} ({latency * 1000:.1f} ms)")
+            except Exception as e:
+                print(f"⚠️ {rule.name} の実行エラー: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def run(self):
+        """全ブロックに接続してイベントを処理し続ける（キャンセルされるまで戻らない）"""
+        self._queue = asyncio.PriorityQueue()
+        for connection in self.connections.values():
+            connection.start()
+        dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+        print(f"Ready: ルール {len(self.rules)} 件で待機中（Ctrl+C で終了）")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            for task in dispatchers:
+                task.cancel()
+            await asyncio.gather(*(c.close() for c in self.connections.values()))
+
+
+def build_engine(rules_table=DEFAULT_RULES, workers=2):
+    """ルールの表で使われている入力・出力ブロックを登録したエンジンを作る"""
+    engine = RuleEngine(make_rules(rules_table), workers=workers)
+    for source in sorted({row[0] for row in rules_table}):
+        prefix, decoder = INPUTS[source]
+        engine.add_input(source, prefix, decoder)
+    for output in sorted({row[2] for row in rules_table}):
+        engine.add_output(output, OUTPUTS[output])
+    return engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MESH ブロックの入力と出力をルールでつなぐ')
+    parser.add_argument('--workers', type=int, default=2,
+                        help='アクションを並行して実行するディスパッチャーの数')
+    parser.add_argument('--stats', metavar='PATH',
+                        help='終了時にルールごとの所要時間の統計を書き出すファイル (.txt と .json)')
+    args = parser.parse_args()
+
+    engine = build_engine(workers=args.workers)
+    try:
+        asyncio.run(engine.run())
+    except KeyboardInterrupt:
+        print('\n👋 プログラムを終了しました')
+    finally:
+        print("⏱ ルールごとの所要時間（イベント受信からアクション完了まで）:")
+        print(engine.stats.report())
+        if args.stats:
+            engine.stats.dump(args.stats)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,71 +6,233 @@
 
 import os
 import json
-import tempfile
-
-import sounddevice as sd
-from vosk import Model, KaldiRecognizer
-from google import genai
-from google.genai import types
-from gtts import gTTS
-import httpx
-try:
-    from playsound3 import playsound
-except ImportError:
-    from playsound import playsound  # playsound3 が入っていなければ従来版へフォールバック
+import hashlib
+
+from voice_tts import SpeechPipeline, TTSCache
+from voice_audio import ContinuousListener
+from voice_startup import Startup
+from voice_memory import ConversationMemory
 
 # ── Vosk/SampleRate 設定 ──
 BASE_DIR   = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(BASE_DIR, "vosk-model-small-ja-0.22")
 # Vosk日本語モデルのパス：自分の環境に合わせて書き換え；smallモデルを使っていて、解凍後ファイル名を変えてなければこのままでOK
 
-# デフォルト入力デバイスのサンプルレートを自動取得し、失敗時は16000Hzをフォールバック
-try:
-    default_input_device = sd.default.device[0]
-    device_info = sd.query_devices(default_input_device, 'input')
-    SAMPLE_RATE = int(device_info['default_samplerate'])
-    print(f"使用マイク ({device_info['name']}) のデフォルトサンプルレート: {SAMPLE_RATE} Hz")
-    # AUDIO_DEVICEの設定を修正
-    AUDIO_DEVICE = default_input_device if isinstance(default_input_device, int) and default_input_device >= 0 else None
-except Exception as e:
-    print(f"入力デバイス情報の取得に失敗: {e}")
-    print("16000Hz を使用します。")
-    SAMPLE_RATE = 16000
-    AUDIO_DEVICE = None
+# 応答をストリーミングで受け取り、生成途中から話し始める（False で全文を待ってから話す）
+STREAM_RESPONSE = True
+# 音声合成エンジン: "gtts"（要ネットワーク）または "openjtalk"（オフライン、pyopenjtalk が必要）
+TTS_ENGINE = "gtts"
+# 読み上げ中にユーザーが話し始めたら読み上げを止める（割り込み）
+BARGE_IN = True
+MAX_SILENCE_SECONDS = 12.5  # この時間何も話されなければ録音を打ち切る
+# 会話履歴: 直近この往復数だけをそのまま送り、それより古い会話は要約して送る
+HISTORY_WINDOW_TURNS = 6
+
+# ── PDF要約の設定とキャッシュ ──
+# 要約は (PDFの内容のハッシュ, モデル, プロンプト) をキーに保存し、どれかが変われば作り直す。
+# URL の場合は ETag / Last-Modified による条件付きリクエストで、変わっていなければダウンロードも省く。
+SUMMARY_MODEL  = "gemini-2.0-flash"
+CHAT_MODEL     = "gemini-2.0-flash"
+SUMMARY_PROMPT = "このPDFの内容を詳しく要約してください。特にワークショップの内容、日時、場所、参加方法、参加メリットなどの情報を含めてください。"
+PDF_CACHE_DIR  = os.path.join(BASE_DIR, "pdf_summary_cache")
+
+# 決まり文句（起動時に合成してキャッシュしておく）
+FAREWELL_TEXT = "ありがとうございました。ワークショップでお会いできることを楽しみにしています！"
+ERROR_REPLY   = "申し訳ございません。システムにエラーが発生しました。もう一度お試しください。"
 
 # ── 初期化 ──
-model      = Model(MODEL_PATH)  # Vosk モデルロード
-recognizer = KaldiRecognizer(model, SAMPLE_RATE)
-client     = genai.Client()     # 環境変数から API Key 自動取得
+# Vosk モデル・マイク・API クライアント・PDF要約は import 時には用意せず、
+# main() の start_runtime() でバックグラウンドに並行して読み込む
+SAMPLE_RATE    = None
+AUDIO_DEVICE   = None
+recognizer     = None
+client         = None
+tts_pipeline   = None
+listener       = None
+listener_ready = False
+
+
+def detect_audio_input():
+    """デフォルト入力デバイスのサンプルレートを自動取得し、失敗時は16000Hzをフォールバック
+    (サンプルレート, デバイス番号) を返す"""
+    import sounddevice as sd
+    try:
+        default_input_device = sd.default.device[0]
+        device_info = sd.query_devices(default_input_device, 'input')
+        sample_rate = int(device_info['default_samplerate'])
+        print(f"使用マイク ({device_info['name']}) のデフォルトサンプルレート: {sample_rate} Hz")
+        # AUDIO_DEVICEの設定を修正
+        device = default_input_device if isinstance(default_input_device, int) and default_input_device >= 0 else None
+        return sample_rate, device
+    except Exception as e:
+        print(f"入力デバイス情報の取得に失敗: {e}")
+        print("16000Hz を使用します。")
+        return 16000, None
+
+
+def load_vosk_model():
+    """Vosk モデルロード"""
+    from vosk import Model
+    return Model(MODEL_PATH)
+
+
+def create_client():
+    """Gemini API クライアント（環境変数から API Key 自動取得）"""
+    from google import genai
+    return genai.Client()
+
+
+def create_tts_pipeline():
+    """文単位の並行音声合成・再生（合成済みの文は再利用）。決まり文句は前もって合成しておく"""
+    pipeline = SpeechPipeline(TTS_ENGINE, cache=TTSCache())
+    pipeline.warm([FAREWELL_TEXT, ERROR_REPLY])
+    return pipeline
+
+
+def start_runtime(pdf_source):
+    """重い初期化（PDFの要約を含む）をバックグラウンドで並行して開始し、Startup を返す"""
+    startup = Startup()
+    startup.add("マイク", detect_audio_input)
+    startup.add("Voskモデル", load_vosk_model)
+    startup.add("Gemini", create_client)
+    startup.add("音声合成", create_tts_pipeline)
+
+    def summarize():
+        global client
+        client = startup.get("Gemini")
+        return load_pdf_content(pdf_source)
+    startup.add("PDF要約", summarize)
+    return startup
 
 
-def load_pdf_content(pdf_url_or_path):
+def start_listener(startup):
+    """
+    Vosk モデルの読み込みを待って、マイク入力の常時認識を開始
+    マイクが使えなければキーボード入力に切り替える
+    """
+    global SAMPLE_RATE, AUDIO_DEVICE, recognizer, listener, listener_ready
+    try:
+        from vosk import KaldiRecognizer
+        SAMPLE_RATE, AUDIO_DEVICE = startup.get("マイク")
+        recognizer = KaldiRecognizer(startup.get("Voskモデル"), SAMPLE_RATE)
+        # マイクは常時聞き続け、読み上げ中の発話も受け付ける
+        listener = ContinuousListener(recognizer, SAMPLE_RATE, device=AUDIO_DEVICE,
+                                      on_speech_start=on_user_speech_start if BARGE_IN else None,
+                                      is_speaking=lambda: tts_pipeline.speaking,
+                                      on_partial=lambda text: print(f"認識中: {text}", end='\r'))
+        listener.start()
+        listener_ready = True
+    except Exception as e:
+        print(f"音声入力ストリームの開始に失敗: {e}")
+        print("キーボード入力に切り替えます。")
+
+
+def on_user_speech_start():
+    """ユーザーが話し始めたら、読み上げと残りの応答生成を打ち切る（割り込み）"""
+    if tts_pipeline.speaking:
+        print("\n⏹ 割り込みを検知: 読み上げを中止します")
+        tts_pipeline.cancel()
+
+
+def _cache_file(name):
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    return os.path.join(PDF_CACHE_DIR, name)
+
+
+def _write_atomic(path, text):
+    """書き込み途中のファイルが読まれないよう、一時ファイルに書いてから置き換える"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def summary_cache_path(content_hash):
+    """PDFの内容・要約モデル・プロンプトに対応する要約キャッシュのパス"""
+    key = hashlib.sha256(f"{content_hash}\n{SUMMARY_MODEL}\n{SUMMARY_PROMPT}".encode('utf-8')).hexdigest()
+    return _cache_file(f"summary_{key}.txt")
+
+
+def fetch_pdf(url, conditional=True):
+    """
+    URL からPDFを取得し、(内容のハッシュ, PDFのバイト列) を返す。
+    前回の ETag / Last-Modified で変更がないと分かった場合、バイト列は None になる。
+    """
+    import httpx
+    meta_path = _cache_file(f"source_{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json")
+    meta = {}
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+
+    headers = {}
+    if conditional and meta.get('content_hash'):
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    print(f"PDFをダウンロード中: {url}")
+    response = httpx.get(url, headers=headers, timeout=30, follow_redirects=True)
+    if response.status_code == 304:
+        print("✓ PDFは前回から更新されていません")
+        return meta['content_hash'], None
+    response.raise_for_status()
+
+    doc_data = response.content
+    content_hash = hashlib.sha256(doc_data).hexdigest()
+    _write_atomic(meta_path, json.dumps({
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'content_hash': content_hash,
+    }, ensure_ascii=False, indent=2))
+    return content_hash, doc_data
+
+
+def load_pdf_content(pdf_url_or_path, use_cache=True):
     """
     PDFファイルを読み込んで内容をテキストとして取得する
-    URLまたはローカルパスに対応
+    URLまたはローカルパスに対応。要約はキャッシュし、PDFが変わっていなければ再利用する
     """
+    import httpx
+    from google.genai import types
     try:
-        if pdf_url_or_path.startswith(('http://', 'https://')):
-            # URL からPDFを取得
-            print(f"PDFをダウンロード中: {pdf_url_or_path}")
-            doc_data = httpx.get(pdf_url_or_path, timeout=30).content
+        is_url = pdf_url_or_path.startswith(('http://', 'https://'))
+        if is_url:
+            # URL からPDFを取得（変更がなければ本体はダウンロードしない）
+            content_hash, doc_data = fetch_pdf(pdf_url_or_path, conditional=use_cache)
         else:
             # ローカルファイルから読み込み
             print(f"ローカルPDFを読み込み中: {pdf_url_or_path}")
             with open(pdf_url_or_path, 'rb') as f:
                 doc_data = f.read()
+            content_hash = hashlib.sha256(doc_data).hexdigest()
+
+        cache_path = summary_cache_path(content_hash)
+        if use_cache and os.path.exists(cache_path):
+            print(f"✓ キャッシュ済みの要約を使用します: {cache_path}")
+            with open(cache_path, encoding='utf-8') as f:
+                return f.read()
+
+        if doc_data is None:
+            # PDFは変わっていないが要約がない（モデルやプロンプトを変更した）ので取り直す
+            content_hash, doc_data = fetch_pdf(pdf_url_or_path, conditional=False)
+            cache_path = summary_cache_path(content_hash)
         
         # PDFの内容を要約してテキスト化
         response = client.models.generate_content(
-            model="gemini-2.0-flash",
+            model=SUMMARY_MODEL,
             contents=[
                 types.Part.from_bytes(
                     data=doc_data,
                     mime_type='application/pdf',
                 ),
-                "このPDFの内容を詳しく要約してください。特にワークショップの内容、日時、場所、参加方法、参加メリットなどの情報を含めてください。"
+                SUMMARY_PROMPT
             ]
         )
+        if response.text:
+            _write_atomic(cache_path, response.text)
         return response.text
     except httpx.TimeoutException:
         print("PDF読み込みエラー: タイムアウトしました")
@@ -114,94 +276,46 @@ def create_system_instruction(pdf_content):
     return system_instruction
 
 
+def clean_speech_text(text):
+    """記号や絵文字を除去（音声合成に不適切な文字を除去）"""
+    clean_text = ''.join(char for char in text if char.isprintable() and ord(char) < 127 or char.isspace() or ord(char) > 127)
+    return clean_text.replace('*', '').replace('#', '').replace('✓', '').replace('⚠', '')
+
+
 def speak_gtts(text, lang="ja"):
     """
-    gTTS でテキストを音声合成し、一時ファイル経由で再生、完了を待つ
-    再生完了後にファイルを削除
+    TTS_ENGINE（既定は gTTS）でテキストを文単位に音声合成し、合成できた文から順に再生、完了を待つ
+    （2文目以降の合成は1文目の再生中に並行して進む）
     """
     try:
-        # 記号や絵文字を除去（音声合成に不適切な文字を除去）
-        clean_text = ''.join(char for char in text if char.isprintable() and ord(char) < 127 or char.isspace() or ord(char) > 127)
-        clean_text = clean_text.replace('*', '').replace('#', '').replace('✓', '').replace('⚠', '')
+        clean_text = clean_speech_text(text)
         
         if not clean_text.strip():
             print("⚠ 音声合成対象のテキストが空です")
             return
             
-        tts = gTTS(text=clean_text, lang=lang)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as f:
-            tts.save(f.name)
-            path = f.name
-        playsound(path)
-        os.remove(path)
+        tts_pipeline.say(clean_text, lang)
     except Exception as e:
         print(f"音声合成エラー: {e}")
 
 
 def recognize_until_endpoint():
     """
-    マイク入力を受け取り、発話開始から発話終了まで（Vosk の AcceptWaveform が True を返すまで）
-    ストリーミング認識を継続。発話終了時点で認識結果のテキストを返す。
+    常時録音しているリスナーから、次の発話（Vosk のエンドポイント検知で区切られたもの）の
+    認識結果テキストを返す。読み上げに割り込んだ発話もここで受け取る。
+    マイクが使えない場合はキーボード入力に切り替える。
     """
-    recognizer.Reset()  # 前回のセッションをリセット
-    CHUNK_DURATION = 0.125  # 秒 (125ms)
-    FRAME_SIZE = int(SAMPLE_RATE * CHUNK_DURATION)
-
-    # RawInputStream で PCM 16bit モノラルデータを取得
-    try:
-        stream_params = {
-            'samplerate': SAMPLE_RATE,
-            'blocksize': FRAME_SIZE,
-            'dtype': 'int16',
-            'channels': 1,
-        }
-        
-        # デバイスが指定されている場合のみ追加
-        if AUDIO_DEVICE is not None:
-            stream_params['device'] = AUDIO_DEVICE
-            
-        with sd.RawInputStream(**stream_params) as stream:
-            print("▶ 録音開始…（話し始めてください）")
-            silence_count = 0
-            max_silence = 100  # 無音検出のカウンタ上限
-            
-            while True:
-                try:
-                    data, _ = stream.read(FRAME_SIZE)
-                    # Vosk は bytes が必要 (_cffi_backend.buffer を bytes() で変換)
-                    audio_bytes = data if isinstance(data, (bytes, bytearray)) else bytes(data)
-                    
-                    # エンドポイント検知 (発話終了)
-                    if recognizer.AcceptWaveform(audio_bytes):
-                        result = json.loads(recognizer.Result())
-                        text = result.get("text", "").strip()
-                        if text:
-                            print("■ 発話終了検知 →", text)
-                            return text
-                    
-                    # 部分認識結果の取得（デバッグ用）
-                    partial_result = json.loads(recognizer.PartialResult())
-                    partial_text = partial_result.get("partial", "")
-                    if partial_text:
-                        print(f"認識中: {partial_text}", end='\r')
-                        silence_count = 0
-                    else:
-                        silence_count += 1
-                        if silence_count > max_silence:
-                            print("\n⚠ 長時間無音のため録音を終了します")
-                            return ""
-                            
-                except KeyboardInterrupt:
-                    print("\n録音を中断しました")
-                    return ""
-                except Exception as e:
-                    print(f"\n録音中にエラー: {e}")
-                    return ""
-                    
-    except Exception as e:
-        print(f"音声入力ストリームの開始に失敗: {e}")
-        print("キーボード入力に切り替えます。")
+    if not listener_ready:
         return input("テキストで入力してください: ")
+    print("▶ 録音中…（話し始めてください）")
+    try:
+        text = listener.get_utterance(silence_timeout=MAX_SILENCE_SECONDS)
+    except KeyboardInterrupt:
+        print("\n録音を中断しました")
+        return ""
+    if not text:
+        print("\n⚠ 長時間無音のため録音を終了します")
+    return text
 
 
 def chat_gemini(prompt, chat_session):
@@ -215,7 +329,26 @@ def chat_gemini(prompt, chat_session):
         return response.text
     except Exception as e:
         print(f"Gemini API エラー: {e}")
-        return "申し訳ございません。システムにエラーが発生しました。もう一度お試しください。"
+        return ERROR_REPLY
+
+
+def chat_gemini_stream(prompt, chat_session):
+    """
+    Gemini API のストリーミング応答を受け取りながら、文がそろうたびに
+    音声合成・再生を始める。話し終えたら応答テキストの全文を返す。
+    """
+    print("エージェント: ", end="", flush=True)
+    try:
+        stream = chat_session.send_message_stream(prompt)
+        reply = tts_pipeline.speak_stream((clean_speech_text(chunk.text or "") for chunk in stream),
+                                          on_text=lambda t: print(t, end="", flush=True))
+        print()
+    except Exception as e:
+        print(f"\nGemini API エラー: {e}")
+        reply = ERROR_REPLY
+        tts_pipeline.speak(reply)
+    tts_pipeline.wait()
+    return reply
 
 
 def main():
@@ -223,14 +356,18 @@ def main():
     メインループ: PDFを読み込み、その内容に基づくシステムインストラクションを設定し、
     ワークショップ参加を勧める音声対話を実行
     """
+    global tts_pipeline
     print("=== ワークショップ案内音声エージェント ===")
     
     # PDFファイルのパスまたはURL（必要に応じて変更してください）
     pdf_source = "https://okana2ki.github.io/gai4e-ws.pdf"
     # pdf_source = "workshop_info.pdf"  # ローカルファイルの場合
     
+    # Vosk モデル・音声合成の準備と並行してPDFを読み込む
     print("PDFからワークショップ情報を読み込み中...")
-    pdf_content = load_pdf_content(pdf_source)
+    startup = start_runtime(pdf_source)
+    pdf_content = startup.get("PDF要約")
+    tts_pipeline = startup.get("音声合成")
     
     if pdf_content:
         print("✓ PDFの読み込みが完了しました")
@@ -244,20 +381,26 @@ def main():
     system_instruction = create_system_instruction(pdf_content)
     
     try:
-        # チャット機能（対話履歴を保持したマルチターン会話）の初期設定
-        chat = client.chats.create(
-            model="gemini-2.0-flash",
-            config=types.GenerateContentConfig(
-                system_instruction=system_instruction,
-                max_output_tokens=120,    # ワークショップ案内のため少し長めに設定
-            )
+        # チャット機能（直近の履歴と古い会話の要約を保持したマルチターン会話）の初期設定
+        # 会話が長くなっても1回の問い合わせの入力量が増え続けないようにする
+        chat = ConversationMemory(
+            client, CHAT_MODEL, system_instruction,
+            window_turns=HISTORY_WINDOW_TURNS,
+            max_output_tokens=120,    # ワークショップ案内のため少し長めに設定
         )
         
         # 初回システム発話: 空文字で system_instruction に応じた応答を取得
-        initial_response = chat.send_message("こんにちは")
-        initial_text = initial_response.text
-        print("エージェント:", initial_text)
-        speak_gtts(initial_text)
+        if STREAM_RESPONSE:
+            chat_gemini_stream("こんにちは", chat)
+        else:
+            initial_response = chat.send_message("こんにちは")
+            initial_text = initial_response.text
+            print("エージェント:", initial_text)
+            speak_gtts(initial_text)
+        startup.mark("最初の発話の終了")
+        start_listener(startup)  # 以降はマイク入力を常時認識
+        startup.mark("音声認識の開始")
+        startup.report()
 
         while True:
             # ユーザーの音声を認識 (発話終了まで待機)
@@ -268,14 +411,18 @@ def main():
                 
             # 終了キーワードチェック
             if any(keyword in user_text.lower() for keyword in ("終了", "やめて", "さようなら", "終わり")):
-                farewell = "ありがとうございました。ワークショップでお会いできることを楽しみにしています！"
-                print("エージェント:", farewell)
-                speak_gtts(farewell)
+                print("エージェント:", FAREWELL_TEXT)
+                speak_gtts(FAREWELL_TEXT)
                 print("=== 終了します ===")
+                chat.report()
                 break
 
             print("ユーザー:", user_text)
             # LLM へ問い合わせ
+            if STREAM_RESPONSE:
+                # 生成途中の応答を文ごとに音声合成して再生
+                chat_gemini_stream(user_text, chat)
+                continue
             reply = chat_gemini(user_text, chat)
             print("エージェント:", reply)
             # 応答を音声合成して再生
@@ -1,13 +1,7 @@
 # https://developer.meshprj.com/hc/ja/articles/9164308204313-Python
 import asyncio
-# from bleak import BleakClient, discover
-from bleak import BleakClient, BleakScanner
-from struct import pack
 
-# UUID
-CORE_INDICATE_UUID = ('72c90005-57a9-4d40-b746-534e22ec9f9e')
-CORE_NOTIFY_UUID = ('72c90003-57a9-4d40-b746-534e22ec9f9e')
-CORE_WRITE_UUID = ('72c90004-57a9-4d40-b746-534e22ec9f9e')
+from mesh_ble import MeshConnection
 
 # Constant values
 MESSAGE_TYPE_INDEX = 0
@@ -34,27 +28,11 @@ def on_receive_indicate(sender, data: bytearray):
     data = bytes(data)
     print('[indicate] ',data)
 
-async def scan(prefix='MESH-100'):
-    while True:
-        print('scan...')
-        try:
-            # return next(d for d in await discover() if d.name and d.name.startswith(prefix))
-            return next(d for d in await BleakScanner.discover() if d.name and d.name.startswith(prefix))
-        except StopIteration:
-            continue
-
 async def main():
-    # Scan device
-    device = await scan('MESH-100BU')
-    print('found', device.name, device.address)
-
-    # Connect device
-    async with BleakClient(device, timeout=None) as client:
-        # Initialize
-        await client.start_notify(CORE_NOTIFY_UUID, on_receive_notify)
-        await client.start_notify(CORE_INDICATE_UUID, on_receive_indicate)
-        await client.write_gatt_char(CORE_WRITE_UUID, pack('<BBBB', 0, 2, 1, 3), response=True)
-        print('connected')
+    # Connect device (scan only when the address is not cached yet) and initialize
+    async with MeshConnection('MESH-100BU', on_notify=on_receive_notify,
+                              on_indicate=on_receive_indicate) as button:
+        print('connected', button.name, button.address)
 
         await asyncio.sleep(30)
 
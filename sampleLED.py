@@ -1,59 +1,33 @@
 # https://developer.meshprj.com/hc/ja/articles/9164308204313-Python
 import asyncio
-# from bleak import BleakClient, discover
-from bleak import BleakClient, BleakScanner
-from struct import pack
 
-CORE_INDICATE_UUID = ('72c90005-57a9-4d40-b746-534e22ec9f9e')
-CORE_NOTIFY_UUID = ('72c90003-57a9-4d40-b746-534e22ec9f9e')
-CORE_WRITE_UUID = ('72c90004-57a9-4d40-b746-534e22ec9f9e')
+from mesh_ble import MeshConnection
+from mesh_led import PATTERN_BLINK, encode
 
 # Callback
 def on_receive(sender, data: bytearray):
     data = bytes(data)
     print(data)
 
-async def scan(prefix = 'MESH-100'):
-    while True:
-        print('scan...')
-        try:            
-            # return next(d for d in await discover() if d.name and d.name.startswith(prefix))
-            return next(d for d in await BleakScanner.discover() if d.name and d.name.startswith(prefix))
-        except StopIteration:
-            continue
-
 async def main():
-    # Scan device
-    device = await scan('MESH-100LE')
-    print('found', device.name, device.address)
-    
-    # Connect device
-    async with BleakClient(device, timeout=None) as client:
-        # Initialize
-        await client.start_notify(CORE_NOTIFY_UUID, on_receive)
-        await client.start_notify(CORE_INDICATE_UUID, on_receive)
-        await client.write_gatt_char(CORE_WRITE_UUID, pack('<BBBB', 0, 2, 1, 3), response=True)
-        print('connected')
+    # Connect device (scan only when the address is not cached yet) and initialize
+    async with MeshConnection('MESH-100LE', on_notify=on_receive, on_indicate=on_receive) as led:
+        print('connected', led.name, led.address)
 
-        # Generate command
-        messagetype = 1
+        # Generate command (message type, color, timing, pattern and check sum)
         red = 2
         green = 8
         blue = 32
         duration = 5 * 1000 # 5,000[ms]
         on = 1 * 1000 # 1,000[ms]
         off = 500 # 500[ms]
-        pattern = 1 # 1:blink, 2:firefly
-        command = pack('<BBBBBBBHHHB', messagetype, 0, red, 0, green, 0, blue, duration, on, off, pattern)
-        checksum = 0
-        for x in command:
-            checksum += x
-        command = command + pack('B', checksum & 0xFF) # Add check sum to byte array
+        pattern = PATTERN_BLINK # 1:blink, 2:firefly
+        command = encode(red, green, blue, duration, on, off, pattern)
         print('command ',command)
         
         try:
             # Write command
-            await client.write_gatt_char(CORE_WRITE_UUID, command, response=True)
+            await led.write(command)
         except Exception as e:
             print('error', e)
             return
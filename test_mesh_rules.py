@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# test_mesh_rules.py
+# mesh_rules のデコーダーの確認: python -m pytest test_mesh_rules.py
+
+from mesh_decoder import EVENT_TYPE_FLIP, EVENT_TYPE_SHAKE
+from mesh_journal import SimulatedMotionBlock, encode_motion_frame
+from mesh_rules import decode_button, decode_motion
+
+
+def test_simulated_stream_has_no_motion_events():
+    """加速度を流し続けるフレーム（ジャンプを含む）からはイベントが出ない"""
+    packets = SimulatedMotionBlock(duration=20.0, seed=1).packets()
+    assert packets
+    assert [decode_motion(frame) for _, frame in packets if decode_motion(frame)] == []
+
+
+def test_motion_events():
+    assert decode_motion(encode_motion_frame(0, 0, 1, EVENT_TYPE_SHAKE)) == 'shake'
+    assert decode_motion(encode_motion_frame(0, 0, 1, EVENT_TYPE_FLIP)) == 'flip'
+    assert decode_motion(b'') is None
+
+
+def test_button_events():
+    assert decode_button(bytes([1, 0, 1])) == 'single'
+    assert decode_button(bytes([1, 0, 2])) == 'long'
+    assert decode_button(bytes([1, 0, 3])) == 'double'
+    assert decode_button(bytes([1, 1, 1])) is None
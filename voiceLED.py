@@ -2,19 +2,25 @@
 # -*- coding: utf-8 -*-
 # voice_agent.py
 # 音声対話エージェント: Voskで発話のエンドポイント検知を行い、
-# Gemini API（チャット機能）に転送し、gTTS+playsoundで合成音声を再生しつつ、
+# Gemini API（チャット機能）に転送し、gTTS+playsoundで合成音声を文単位に並行合成・再生しつつ、
 # LED制御を行います。LEDデバイスが見つからない場合は警告し、対話は継続します。
+# BLE の処理は専用スレッドで回し続けるイベントループが受け持ち、LED命令はキュー経由で渡すので、
+# LED の書き込みは読み上げを待たずに並行して進みます。
 
 import os
 import sys
 import json
-import tempfile
 import asyncio
 import ctypes
+import threading
 import time
 
 # ── 設定: スキャンタイムアウト（秒） ──
 DEVICE_SCAN_TIMEOUT = 15
+# 音声合成エンジン: "gtts"（要ネットワーク）または "openjtalk"（オフライン、pyopenjtalk が必要）
+TTS_ENGINE = "gtts"
+# 読み上げ中にユーザーが話し始めたら読み上げを止める（割り込み）
+BARGE_IN = True
 
 # ── Windows: COMをMTAモードで初期化し、ProactorEventLoopを設定（WinRT対策） ──
 if os.name == 'nt':
@@ -27,114 +33,162 @@ if os.name == 'nt':
     except AttributeError:
         pass
 
-# ── イベントループを1回生成 ──
+# ── BLE用イベントループを1回生成（start_ble_loop() で専用スレッドにて回し続ける） ──
 LOOP = asyncio.new_event_loop()
-asyncio.set_event_loop(LOOP)
-
-import sounddevice as sd
-from vosk import Model, KaldiRecognizer
-from google import genai
-from google.genai import types
-from google.genai.errors import ServerError
-from gtts import gTTS
-try:
-    from playsound3 import playsound
-except ImportError:
-    from playsound import playsound
-
-from bleak import BleakClient, BleakScanner
-from struct import pack
-
-# ── LED制御用UUID ──
-CORE_INDICATE_UUID = '72c90005-57a9-4d40-b746-534e22ec9f9e'
-CORE_NOTIFY_UUID   = '72c90003-57a9-4d40-b746-534e22ec9f9e'
-CORE_WRITE_UUID    = '72c90004-57a9-4d40-b746-534e22ec9f9e'
-
-# グローバルLEDクライアント
-LED_CLIENT = None
-
-async def scan_led(prefix='MESH-100LE'):
-    """近くのLEDを永続スキャン。スキャン結果をログ出力します"""
-    while True:
-        devices = await BleakScanner.discover()
-        if devices:
-            print("スキャン結果:")
-            for d in devices:
-                name = d.name or "<Unnamed>"
-                print(f"  {name} [{d.address}]")
-        for d in devices:
-            if d.name and prefix in d.name:
-                return d
-        print(f"LEDデバイス({prefix})が見つかりません。再スキャンします...")
-        await asyncio.sleep(2)
+LED_QUEUE = asyncio.Queue()  # LED命令のキュー（LOOP 上で読み出す）
+
+from voice_tts import SpeechPipeline, TTSCache
+from voice_audio import ContinuousListener
+from voice_startup import Startup
+from mesh_ble import MeshConnection
+from mesh_led import ANIMATIONS, PRESETS, LedSequencer
+
+# LEDの書き込みの最小間隔（秒）。これより速く命令が来たら最新の命令だけを書き込む
+LED_MIN_INTERVAL = 0.1
+# 色や光り方を指定する命令（LED_RED, LED_FIREFLY など）。LED_ON / LED_OFF 以外に Gemini に使わせる
+LED_COLOR_COMMANDS = [f"LED_{name.upper()}" for name in PRESETS if name not in ('on', 'off')]
+
+# グローバルLED接続とシーケンサー（BLEスレッドだけが使う）。接続は切断されても自動で再接続する
+LED_CONNECTION = None
+LED_SEQUENCER  = None
 
 async def connect_led():
-    """LEDモジュールをスキャンして接続、初期化コマンド送信後クライアントを返す"""
-    print(f"LEDデバイスをスキャン中... (最大{DEVICE_SCAN_TIMEOUT}秒まで待機)")
+    """LEDモジュールへの接続を始め、初期化まで済むのを待つ
+
+    前回見つけたアドレスがあればスキャンせずに直接接続する。
+    DEVICE_SCAN_TIMEOUT 秒以内に接続できなくても、バックグラウンドで探し続ける。
+    """
+    global LED_CONNECTION
+    print(f"LEDデバイスに接続中... (最大{DEVICE_SCAN_TIMEOUT}秒まで待機)")
+    LED_CONNECTION = MeshConnection('MESH-100LE').start()
     try:
-        device = await asyncio.wait_for(scan_led(), timeout=DEVICE_SCAN_TIMEOUT)
+        await LED_CONNECTION.wait_ready(timeout=DEVICE_SCAN_TIMEOUT)
+        return True
     except asyncio.TimeoutError:
-        print(f"LEDデバイスが{DEVICE_SCAN_TIMEOUT}秒以内に見つかりません。LED操作は無効になります。")
-        return None
-    print(f"Found LED: {device.name} [{device.address}]")
-    client = BleakClient(device)
-    await client.connect()
-    await client.start_notify(CORE_NOTIFY_UUID, lambda s, d: None)
-    await client.start_notify(CORE_INDICATE_UUID, lambda s, d: None)
-    # 初期化コマンド: 制御モードへ
-    init_payload = pack('<BBBB', 0, 2, 1, 3)
-    try:
-        await client.write_gatt_char(CORE_WRITE_UUID, init_payload, response=True)
-        print("→ LED 初期化コマンド送信完了")
-    except Exception as e:
-        print(f"LED 初期化エラー: {e}")
-    return client
+        print(f"LEDデバイスが{DEVICE_SCAN_TIMEOUT}秒以内に見つかりません。見つかるまでLED操作は無効になります。")
+        return False
+
+
+def _run_ble_loop():
+    """BLEスレッド: イベントループを回し続ける"""
+    if os.name == 'nt':
+        # WinRT はスレッドごとに COM の MTA 初期化が必要
+        try:
+            ctypes.windll.ole32.CoInitializeEx(None, 0x0)
+        except Exception:
+            pass
+    asyncio.set_event_loop(LOOP)
+    LOOP.run_forever()
+
+
+def start_ble_loop(startup):
+    """BLEスレッドを開始し、LEDの接続と命令処理をバックグラウンドで始める"""
+    threading.Thread(target=_run_ble_loop, name='ble-loop', daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(led_worker(startup), LOOP)
+
+
+async def led_worker(startup):
+    """LEDに接続し、キューに届いたLED命令をシーケンサーに渡す（BLEスレッドで実行）
+
+    接続中に届いた命令は、接続が終わってから最新のものが書き込まれる。
+    """
+    global LED_SEQUENCER
+    print("→ LED デバイスに接続中…")
+    if await connect_led():
+        print("→ LED デバイス接続完了")
+    else:
+        print("LED デバイス未検出: 対話のみ行います。")
+    startup.mark("LED接続")
+    LED_SEQUENCER = LedSequencer(LED_CONNECTION, min_interval=LED_MIN_INTERVAL)
+    while True:
+        show_led(await LED_QUEUE.get())
 
 # ── Vosk/SampleRate 設定 ──
 BASE_DIR   = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(BASE_DIR, "vosk-model-small-ja-0.22")
 
-import sounddevice as sd
-
-# デフォルト入力デバイスのサンプルレートを自動取得し、失敗時は16000Hzをフォールバック
-try:
-    default_input_device = sd.default.device[0]
-    device_info = sd.query_devices(default_input_device, 'input')
-    SAMPLE_RATE = int(device_info['default_samplerate'])
-    print(f"使用マイク ({device_info['name']}) のデフォルトサンプルレート: {SAMPLE_RATE} Hz")
-except Exception:
-    print("入力デバイス情報の取得に失敗。16000Hz を使用します。")
-    SAMPLE_RATE = 16000
+# 決まり文句（起動時に合成してキャッシュしておく）
+BUSY_SPEECH = "すみません、システムが混雑しています。後ほどお試しください。"
 
 # ── 初期化: 音声認識 & ChatGPT ──
-model      = Model(MODEL_PATH)
-recognizer = KaldiRecognizer(model, SAMPLE_RATE)
-api_client = genai.Client()
-chat       = api_client.chats.create(
-    model="gemini-2.0-flash",
-    config=types.GenerateContentConfig(
-        system_instruction=(
-            "あなたは気ままな猫です。名前はキティです。"
-            "ユーザや周りの人が幸せになるような対話をして下さい。"
-            "世の中がよくなるような行動をユーザがとるように導いてください。"
-            "ユーザの発話に対して必ずJSONで返してください："
-            "{\"speech\":\"(テキスト)\",\"command\":\"(LED_ON,LED_OFF,GET_TEMPERATUREなど)または空文字列\"}"
-            "暗いときや明かりをつけたいときはLED_ON、消灯はLED_OFFを返してください。"
-        ),
-        max_output_tokens=80
+# Vosk モデル・マイク・API クライアントは import 時には用意せず、
+# main() の start_runtime() でバックグラウンドに並行して読み込む（LEDのスキャンとも並行）
+SAMPLE_RATE  = None
+recognizer   = None
+chat         = None
+tts_pipeline = None
+listener     = None
+
+
+def detect_sample_rate():
+    """デフォルト入力デバイスのサンプルレートを自動取得し、失敗時は16000Hzをフォールバック"""
+    import sounddevice as sd
+    try:
+        default_input_device = sd.default.device[0]
+        device_info = sd.query_devices(default_input_device, 'input')
+        sample_rate = int(device_info['default_samplerate'])
+        print(f"使用マイク ({device_info['name']}) のデフォルトサンプルレート: {sample_rate} Hz")
+        return sample_rate
+    except Exception:
+        print("入力デバイス情報の取得に失敗。16000Hz を使用します。")
+        return 16000
+
+
+def load_vosk_model():
+    from vosk import Model
+    return Model(MODEL_PATH)
+
+
+def create_chat():
+    from google import genai
+    from google.genai import types
+    api_client = genai.Client()
+    return api_client.chats.create(
+        model="gemini-2.0-flash",
+        config=types.GenerateContentConfig(
+            system_instruction=(
+                "あなたは気ままな猫です。名前はキティです。"
+                "ユーザや周りの人が幸せになるような対話をして下さい。"
+                "世の中がよくなるような行動をユーザがとるように導いてください。"
+                "ユーザの発話に対して必ずJSONで返してください："
+                "{\"speech\":\"(テキスト)\",\"command\":\"(LED_ON,LED_OFF,GET_TEMPERATUREなど)または空文字列\"}"
+                "暗いときや明かりをつけたいときはLED_ON、消灯はLED_OFFを返してください。"
+                f"明かりの色や光り方を変えたいときは{','.join(LED_COLOR_COMMANDS)}のいずれか、"
+                "楽しい気分のときはLED_RAINBOWを返してください。"
+            ),
+            max_output_tokens=80
+        )
     )
-)
+
+
+def create_tts_pipeline():
+    """文単位の並行音声合成・再生（合成済みの文は再利用）。決まり文句は前もって合成しておく"""
+    pipeline = SpeechPipeline(TTS_ENGINE, cache=TTSCache())
+    pipeline.warm([BUSY_SPEECH])
+    return pipeline
+
+
+def start_runtime():
+    """重い初期化をバックグラウンドで並行して開始し、Startup を返す"""
+    startup = Startup()
+    startup.add("マイク", detect_sample_rate)
+    startup.add("Voskモデル", load_vosk_model)
+    startup.add("Gemini", create_chat)
+    startup.add("音声合成", create_tts_pipeline)
+    return startup
+
+
+def on_user_speech_start():
+    """ユーザーが話し始めたら読み上げを打ち切る（割り込み）"""
+    if tts_pipeline.speaking:
+        print("\n⏹ 割り込みを検知: 読み上げを中止します")
+        tts_pipeline.cancel()
 
 def speak_gtts(text, lang="ja"):
     """
-    gTTSでテキストを音声合成し、一時ファイルを再生後に削除
+    TTS_ENGINE（既定はgTTS）でテキストを文単位に音声合成し、合成できた文から順に再生、完了を待つ
     """
-    tts = gTTS(text=text, lang=lang)
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as f:
-        tts.save(f.name)
-        path = f.name
-    playsound(path)
-    os.remove(path)
+    tts_pipeline.say(text, lang)
 
 
 def parse_and_dispatch(raw_text):
@@ -147,101 +201,98 @@ def parse_and_dispatch(raw_text):
         cmd    = obj.get("command", "")
     except:
         speech, cmd = raw_text, ""
-    if speech:
-        speak_gtts(speech)
+    # LED命令は先にBLEスレッドへ渡し、話し始めと同時にLEDが変わるようにする
     if cmd:
         handle_command(cmd)
+    if speech:
+        speak_gtts(speech)
 
 
 def handle_command(cmd: str):
     """
-    LED_ON/LED_OFFを受け取りBLE書き込み
+    LED命令をBLEスレッドのキューに入れてすぐ戻る（書き込みは読み上げと並行して進む）
     """
-    if LED_CLIENT is None:
-        print("LED操作不可: デバイスが未接続です。")
-        return
-    if cmd == "LED_ON":
-        mt = 1; red, green, blue = 2, 8, 32
-        duration, on_time, off_time, pattern = 5000, 1000, 500, 1
-    elif cmd == "LED_OFF":
-        mt = 1; red = green = blue = 0
-        duration = on_time = off_time = 0; pattern = 1
-    else:
+    LOOP.call_soon_threadsafe(LED_QUEUE.put_nowait, cmd)
+
+
+def show_led(cmd: str):
+    """
+    LED_ON/LED_OFF/LED_RED/LED_RAINBOW などを受け取り、シーケンサーに書き込ませる（BLEスレッドで実行）
+    """
+    name = cmd[len("LED_"):].lower() if cmd.startswith("LED_") else ""
+    if name not in PRESETS and name not in ANIMATIONS:
         print(f"Unknown command: {cmd}")
         return
-    payload = pack('<BBBBBBBHHHB', mt, 0,
-                   red, 0, green, 0, blue,
-                   duration, on_time, off_time, pattern)
-    checksum = sum(payload) & 0xFF
-    payload += pack('B', checksum)
-    try:
-        LOOP.run_until_complete(
-            LED_CLIENT.write_gatt_char(CORE_WRITE_UUID, payload, response=True)
-        )
-        print(f"→ 実行: {cmd}")
-    except Exception as e:
-        print("LED制御エラー:", e)
+    if not LED_CONNECTION.connected:
+        print("LED操作不可: デバイスが未接続です。")
+        return
+    LED_SEQUENCER.show(name)
+    print(f"→ 実行: {cmd}")
 
 
 def chat_gemini(prompt: str) -> str:
     """Gemini APIのチャット機能で対話を実行。例外時にフォールバック応答を返す"""
+    from google.genai.errors import ServerError
     try:
         response = chat.send_message(prompt)
         return response.text
     except ServerError as e:
         print(f"Gemini API error: {e}")
         return json.dumps({
-            "speech": "すみません、システムが混雑しています。後ほどお試しください。",
+            "speech": BUSY_SPEECH,
             "command": ""
         })
 
 
 def recognize_until_endpoint():
     """
-    発話開始～終了までマイク入力をストリーミング認識
+    常時録音しているリスナーから、次の発話の認識結果テキストを返す
+    （読み上げに割り込んだ発話も含む）
+    """
+    print("▶ 録音中…（話し始めてください）")
+    return listener.get_utterance()
+
+
+def start_listener(startup):
+    """
+    Vosk モデルの読み込みを待って、マイク入力の常時認識を開始
     ポートオーディオエラー発生時は再試行
     """
-    recognizer.Reset()
-    frame_size = int(SAMPLE_RATE * 0.125)
+    global SAMPLE_RATE, recognizer, listener
+    import sounddevice as sd
+    from vosk import KaldiRecognizer
+    SAMPLE_RATE = startup.get("マイク")
+    recognizer  = KaldiRecognizer(startup.get("Voskモデル"), SAMPLE_RATE)
+    # マイクは常時聞き続け、読み上げ中の発話も受け付ける
+    listener = ContinuousListener(recognizer, SAMPLE_RATE,
+                                  on_speech_start=on_user_speech_start if BARGE_IN else None,
+                                  is_speaking=lambda: tts_pipeline.speaking)
     while True:
         try:
-            with sd.RawInputStream(
-                samplerate=SAMPLE_RATE,
-                blocksize=frame_size,
-                dtype="int16", channels=1
-            ) as stream:
-                print("▶ 録音開始…（話し始めてください）")
-                while True:
-                    data, _ = stream.read(frame_size)
-                    audio_bytes = data if isinstance(data, (bytes, bytearray)) else bytes(data)
-                    if recognizer.AcceptWaveform(audio_bytes):
-                        result = json.loads(recognizer.Result())
-                        text = result.get("text", "")
-                        print(f"■ 発話終了検知 → {text}")
-                        return text
+            listener.start()
+            return
         except sd.PortAudioError as e:
             print(f"Audio Input Error: {e}. 再試行します...")
             time.sleep(1)
-        except Exception as e:
-            print(f"音声認識中の予期せぬエラー: {e}")
-            return ""
 
 
 def main():
     """
-    メインループ: LED接続→初期応答→対話ループ
+    メインループ: LED接続（バックグラウンド）→初期応答→対話ループ
     """
-    global LED_CLIENT
+    global chat, tts_pipeline
     print("=== 音声対話エージェント + LED制御 ===")
-    print("→ LED デバイスに接続中…")
-    LED_CLIENT = LOOP.run_until_complete(connect_led())
-    if LED_CLIENT is None:
-        print("LED デバイス未検出: 対話のみ行います。")
-    else:
-        print("→ LED デバイス接続完了")
+    startup = start_runtime()
+    start_ble_loop(startup)  # LED のスキャン・接続は読み込みや対話と並行して進める
+    chat = startup.get("Gemini")
+    tts_pipeline = startup.get("音声合成")
     initial_json = chat_gemini("")
     print(f"エージェント (raw): {initial_json}")
     parse_and_dispatch(initial_json)
+    startup.mark("最初の発話の終了")
+    start_listener(startup)
+    startup.mark("音声認識の開始")
+    startup.report()
     while True:
         user_text = recognize_until_endpoint()
         if not user_text:
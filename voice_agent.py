@@ -3,93 +3,118 @@
 # voice_agent.py
 # 音声対話エージェント: Vosk で発話のエンドポイント検知を行い、
 # Gemini API（チャット機能）に転送し、
-# gTTS+playsound で合成音声を再生します。
+# gTTS+playsound で合成音声を再生します（文単位で並行合成しながら順に再生）。
 
 import os
-import json
-import tempfile
-
-import sounddevice as sd
-from vosk import Model, KaldiRecognizer
-from google import genai
-from google.genai import types
-from gtts import gTTS
-try:
-    from playsound3 import playsound
-except ImportError:
-    from playsound import playsound  # playsound3 が入っていなければ従来版へフォールバック
+
+from voice_tts import SpeechPipeline, TTSCache
+from voice_audio import ContinuousListener
+from voice_startup import Startup
 
 # ── Vosk/SampleRate 設定 ──
 BASE_DIR   = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(BASE_DIR, "vosk-model-small-ja-0.22")
 # Vosk日本語モデルのパス：自分の環境に合わせて書き換え；smallモデルを使っていて、解凍後ファイル名を変えてなければこのままでOK
-import sounddevice as sd
-# デフォルト入力デバイスのサンプルレートを自動取得し、失敗時は16000Hzをフォールバック
-try:
-    default_input_device = sd.default.device[0]
-    device_info = sd.query_devices(default_input_device, 'input')
-    SAMPLE_RATE = int(device_info['default_samplerate'])
-    print(f"使用マイク ({device_info['name']}) のデフォルトサンプルレート: {SAMPLE_RATE} Hz")
-except Exception:
-    print("入力デバイス情報の取得に失敗。16000Hz を使用します。")
-    SAMPLE_RATE = 16000
+
+# 応答をストリーミングで受け取り、生成途中から話し始める（False で全文を待ってから話す）
+STREAM_RESPONSE = True
+# 音声合成エンジン: "gtts"（要ネットワーク）または "openjtalk"（オフライン、pyopenjtalk が必要）
+TTS_ENGINE = "gtts"
+# 読み上げ中にユーザーが話し始めたら読み上げを止める（割り込み）
+BARGE_IN = True
 
 # ── 初期化 ──
-model      = Model(MODEL_PATH)  # Vosk モデルロード
-recognizer = KaldiRecognizer(model, SAMPLE_RATE)
-client     = genai.Client()     # 環境変数から API Key 自動取得
-# チャット機能（対話履歴を保持したマルチターン会話）の初期設定
-# 参考: https://ai.google.dev/gemini-api/docs?hl=ja
-chat = client.chats.create(
-    model="gemini-2.0-flash",
-    config=types.GenerateContentConfig(
-        system_instruction="あなたは気ままな猫です。名前はキティです。短めの応答をしてください。",
-        # system_instruction="あなたは宮崎県庁の採用担当者です。第1次採用面接で応募者に質問をします。",
-        max_output_tokens=80,    # 最大出力トークン数（適宜、調整してください）
+# Vosk モデル・マイク・API クライアントは import 時には用意せず、
+# main() の start_runtime() でバックグラウンドに並行して読み込む
+SAMPLE_RATE  = None
+recognizer   = None
+chat         = None
+tts_pipeline = None
+listener     = None
+
+
+def detect_sample_rate():
+    """デフォルト入力デバイスのサンプルレートを自動取得し、失敗時は16000Hzをフォールバック"""
+    import sounddevice as sd
+    try:
+        default_input_device = sd.default.device[0]
+        device_info = sd.query_devices(default_input_device, 'input')
+        sample_rate = int(device_info['default_samplerate'])
+        print(f"使用マイク ({device_info['name']}) のデフォルトサンプルレート: {sample_rate} Hz")
+        return sample_rate
+    except Exception:
+        print("入力デバイス情報の取得に失敗。16000Hz を使用します。")
+        return 16000
+
+
+def load_vosk_model():
+    """Vosk モデルロード"""
+    from vosk import Model
+    return Model(MODEL_PATH)
+
+
+def create_chat():
+    """チャット機能（対話履歴を保持したマルチターン会話）の初期設定"""
+    from google import genai
+    from google.genai import types
+    client = genai.Client()     # 環境変数から API Key 自動取得
+    # 参考: https://ai.google.dev/gemini-api/docs?hl=ja
+    return client.chats.create(
+        model="gemini-2.0-flash",
+        config=types.GenerateContentConfig(
+            system_instruction="あなたは気ままな猫です。名前はキティです。短めの応答をしてください。",
+            # system_instruction="あなたは宮崎県庁の採用担当者です。第1次採用面接で応募者に質問をします。",
+            max_output_tokens=80,    # 最大出力トークン数（適宜、調整してください）
+        )
     )
-)
+
+
+def start_runtime():
+    """重い初期化をバックグラウンドで並行して開始し、Startup を返す"""
+    startup = Startup()
+    startup.add("マイク", detect_sample_rate)
+    startup.add("Voskモデル", load_vosk_model)
+    startup.add("Gemini", create_chat)
+    # 文単位の並行音声合成・再生（合成済みの文は再利用）
+    startup.add("音声合成", lambda: SpeechPipeline(TTS_ENGINE, cache=TTSCache()))
+    return startup
+
+
+def start_listener(startup):
+    """Vosk モデルの読み込みを待って、マイク入力の常時認識を開始"""
+    global SAMPLE_RATE, recognizer, listener
+    from vosk import KaldiRecognizer
+    SAMPLE_RATE = startup.get("マイク")
+    recognizer  = KaldiRecognizer(startup.get("Voskモデル"), SAMPLE_RATE)
+    # マイクは常時聞き続け、読み上げ中の発話も受け付ける
+    listener = ContinuousListener(recognizer, SAMPLE_RATE,
+                                  on_speech_start=on_user_speech_start if BARGE_IN else None,
+                                  is_speaking=lambda: tts_pipeline.speaking)
+    listener.start()
+
+
+def on_user_speech_start():
+    """ユーザーが話し始めたら、読み上げと残りの応答生成を打ち切る（割り込み）"""
+    if tts_pipeline.speaking:
+        print("\n⏹ 割り込みを検知: 読み上げを中止します")
+        tts_pipeline.cancel()
 
 
 def speak_gtts(text, lang="ja"):  # noqa: E501
     """
-    gTTS でテキストを音声合成し、一時ファイル経由で再生、完了を待つ
-    再生完了後にファイルを削除
+    TTS_ENGINE（既定は gTTS）でテキストを文単位に音声合成し、合成できた文から順に再生、完了を待つ
+    （2文目以降の合成は1文目の再生中に並行して進む）
     """
-    tts = gTTS(text=text, lang=lang)
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as f:
-        tts.save(f.name)
-        path = f.name
-    playsound(path)
-    os.remove(path)
+    tts_pipeline.say(text, lang)
 
 
 def recognize_until_endpoint():
     """
-    マイク入力を受け取り、発話開始から発話終了まで（Vosk の AcceptWaveform が True を返すまで）
-    ストリーミング認識を継続。発話終了時点で認識結果のテキストを返す。
+    常時録音しているリスナーから、次の発話（Vosk のエンドポイント検知で区切られたもの）の
+    認識結果テキストを返す。読み上げに割り込んだ発話もここで受け取る。
     """
-    recognizer.Reset()  # 前回のセッションをリセット
-    CHUNK_DURATION = 0.125  # 秒 (125ms)
-    FRAME_SIZE = int(SAMPLE_RATE * CHUNK_DURATION)
-
-    # RawInputStream で PCM 16bit モノラルデータを取得
-    with sd.RawInputStream(
-        samplerate=SAMPLE_RATE,
-        blocksize=FRAME_SIZE,
-        dtype="int16",
-        channels=1,
-    ) as stream:
-        print("▶ 録音開始…（話し始めてください）")
-        while True:
-            data, _ = stream.read(FRAME_SIZE)
-            # Vosk は bytes が必要 (_cffi_backend.buffer を bytes() で変換)
-            audio_bytes = data if isinstance(data, (bytes, bytearray)) else bytes(data)
-            # エンドポイント検知 (発話終了)
-            if recognizer.AcceptWaveform(audio_bytes):
-                result = json.loads(recognizer.Result())
-                text = result.get("text", "")
-                print("■ 発話終了検知 →", text)
-                return text
+    print("▶ 録音中…（話し始めてください）")
+    return listener.get_utterance()
 
 
 def chat_gemini(prompt):
@@ -102,17 +127,43 @@ def chat_gemini(prompt):
     return response.text
 
 
+def chat_gemini_stream(prompt):
+    """
+    Gemini API のストリーミング応答を受け取りながら、文がそろうたびに
+    音声合成・再生を始める。話し終えたら応答テキストの全文を返す。
+    """
+    print("エージェント: ", end="", flush=True)
+    stream = chat.send_message_stream(prompt)
+    reply = tts_pipeline.speak_stream((chunk.text for chunk in stream),
+                                      on_text=lambda t: print(t, end="", flush=True))
+    print()
+    tts_pipeline.wait()
+    return reply
+
+
 def main():
     """
     メインループ: 初回は system_instruction に基づく開始応答を取得、
     その後はユーザー音声→テキスト→LLM応答→音声合成 をループ
     """
+    global chat, tts_pipeline
     print("=== 音声対話エージェント ===")
+    startup = start_runtime()
+    chat = startup.get("Gemini")
+    tts_pipeline = startup.get("音声合成")
     # 初回システム発話: 空文字で system_instruction に応じた応答を取得
-    initial_response = chat.send_message("")  # 空文字送信によるトリガー
-    initial_text = initial_response.text
-    print("エージェント:", initial_text)
-    speak_gtts(initial_text)
+    # （その間も Vosk モデルの読み込みはバックグラウンドで続く）
+    if STREAM_RESPONSE:
+        chat_gemini_stream("")  # 空文字送信によるトリガー
+    else:
+        initial_response = chat.send_message("")  # 空文字送信によるトリガー
+        initial_text = initial_response.text
+        print("エージェント:", initial_text)
+        speak_gtts(initial_text)
+    startup.mark("最初の発話の終了")
+    start_listener(startup)  # 以降はマイク入力を常時認識
+    startup.mark("音声認識の開始")
+    startup.report()
 
     while True:
         # ユーザーの音声を認識 (発話終了まで待機)
@@ -126,6 +177,10 @@ def main():
 
         print("ユーザー:", user_text)
         # LLM へ問い合わせ
+        if STREAM_RESPONSE:
+            # 生成途中の応答を文ごとに音声合成して再生
+            chat_gemini_stream(user_text)
+            continue
         reply = chat_gemini(user_text)
         print("エージェント:", reply)
         # 応答を音声合成して再生
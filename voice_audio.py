@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# voice_audio.py
+# 音声対話エージェント共通のマイク入力:
+# 入力ストリームを開きっぱなしにしてバックグラウンドで Vosk に流し続け、
+# 認識できた発話をキューに積みます。エージェントが話している間も聞き続け、
+# ユーザーが話し始めたら（音量による発話検出）コールバックで知らせるので、
+# 応答の読み上げを途中で止める「割り込み（バージイン）」ができます。
+#
+# スピーカーの音をマイクが拾うと自分の声で割り込んでしまうため、
+# 読み上げ中は発話検出の閾値を上げ、割り込みなしで終わった発話は捨てます。
+# ヘッドセットを使うと割り込みの精度が上がります。
+#
+# 入力ストリームはコールバック方式で、届いた音声は確保済みのリングバッファに書き込むだけです。
+# 認識スレッドはリングバッファ上の memoryview を cffi の from_buffer で Vosk の C 関数に直接渡すので、
+# ブロックごとのコピーがありません（Vosk の内部に手が届かない版では bytes にコピーして渡します）。
+
+import json
+import queue
+import threading
+import time
+
+
+def _zero_copy_accept(recognizer):
+    """memoryview をコピーせずに Vosk へ渡す関数を返す（使えない版・認識器なら None）
+
+    KaldiRecognizer.AcceptWaveform は bytes しか受け付けないため、同じ C 関数を
+    ffi.from_buffer で包んだポインタで呼ぶ。
+    """
+    try:
+        import vosk
+        ffi, lib, handle = vosk._ffi, vosk._c, recognizer._handle
+    except (ImportError, AttributeError):
+        return None
+
+    def accept(block):
+        result = lib.vosk_recognizer_accept_waveform(handle, ffi.from_buffer(block), len(block))
+        if result < 0:
+            raise RuntimeError("Failed to process waveform")
+        return result
+    return accept
+
+
+class AudioRingBuffer:
+    """入力コールバックが書き込み、認識スレッドが読み出す単一生産者・単一消費者のリングバッファ
+
+    同じデータを前半と後半の2か所に書いておくことで、容量以下の任意の区間を
+    折り返しなしの連続した memoryview として読み出せる。
+    書き込み位置・読み出し位置はそれぞれ一方のスレッドだけが更新するので、ロックは使わない。
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._view = memoryview(bytearray(capacity * 2))
+        self.written = 0   # 書き込んだ総バイト数（入力コールバックだけが更新）
+        self.read_pos = 0  # 読み出した総バイト数（認識スレッドだけが更新）
+        self.overruns = 0  # 読み出しが追いつかず捨てた回数
+        self._ready = threading.Event()
+
+    def write(self, data):
+        """音声を書き込む（入力コールバックから呼ぶ。確保済みの領域へのコピーのみ）"""
+        src = memoryview(data).cast('B')
+        total = len(src)
+        if total > self.capacity:
+            src = src[-self.capacity:]
+        n = len(src)
+        cap = self.capacity
+        pos = (self.written + total - n) % cap
+        view = self._view
+        view[pos:pos + n] = src
+        lower_end = min(pos + n, cap)
+        view[pos + cap:lower_end + cap] = src[:lower_end - pos]  # 前半に入った部分の写し
+        if pos + n > cap:
+            k = pos + n - cap
+            view[0:k] = src[n - k:]  # 後半にはみ出した部分の写し
+        self.written += total
+        self._ready.set()
+
+    def view(self, start, n):
+        """総バイト数で数えた位置 start から n バイトの memoryview（上書き済みなら None）"""
+        if start < self.written - self.capacity or start + n > self.written:
+            return None
+        pos = start % self.capacity
+        return self._view[pos:pos + n]
+
+    def read(self, n, timeout=None):
+        """次の n バイトを memoryview で返す（timeout 秒以内にそろわなければ None）
+
+        返した領域は、書き込みが容量分先に進むまで有効。
+        """
+        while self.written - self.read_pos < n:
+            if not self._ready.wait(timeout):
+                return None
+            self._ready.clear()
+        if self.written - self.read_pos > self.capacity:
+            # 読み出しが追いつかなかった分は古い順に捨てる
+            self.overruns += 1
+            self.read_pos = self.written - self.capacity
+        block = self.view(self.read_pos, n)
+        self.read_pos += n
+        return block
+
+
+class ContinuousListener:
+    """マイク入力を常時認識し、発話ごとのテキストを返すリスナー
+
+    on_speech_start: 発話の開始を検出したときに呼ぶ関数（割り込み用）
+    is_speaking:     エージェントが読み上げ中かを返す関数
+    on_partial:      認識途中のテキストを受け取る関数
+    """
+
+    def __init__(self, recognizer, sample_rate, device=None, block_seconds=0.125,
+                 on_speech_start=None, is_speaking=None, on_partial=None,
+                 vad_threshold=500, barge_in_threshold=1500, speech_blocks=2,
+                 buffer_seconds=10.0):
+        self.recognizer = recognizer
+        self.sample_rate = sample_rate
+        self.device = device
+        self.block_size = int(sample_rate * block_seconds)
+        self.block_bytes = self.block_size * 2  # int16 モノラル
+        self.ring = AudioRingBuffer(int(sample_rate * buffer_seconds) * 2)
+        self.on_speech_start = on_speech_start
+        self.is_speaking = is_speaking or (lambda: False)
+        self.on_partial = on_partial
+        self.vad_threshold = vad_threshold            # 通常時の発話検出の閾値（RMS）
+        self.barge_in_threshold = barge_in_threshold  # 読み上げ中の閾値（スピーカーの音を除くため高め）
+        self.speech_blocks = speech_blocks            # 何ブロック続けて閾値を超えたら発話とみなすか
+        self._results = queue.Queue()
+        self._last_activity = time.monotonic()  # 最後に認識途中のテキストが得られた時刻
+        self._running = False
+        self._thread = None
+        self._accept_buffer = _zero_copy_accept(recognizer)  # None ならブロックごとに bytes へコピーする
+
+    def start(self):
+        """入力ストリームを開き、認識スレッドを開始（開けなければ例外）"""
+        if self._running:
+            return
+        import sounddevice as sd  # PortAudio の読み込みは実際に録音を始めるときまで遅らせる
+        params = {
+            'samplerate': self.sample_rate,
+            'blocksize': self.block_size,
+            'dtype': 'int16',
+            'channels': 1,
+            'callback': self._on_audio,
+        }
+        # デバイスが指定されている場合のみ追加
+        if self.device is not None:
+            params['device'] = self.device
+        self._stream = sd.RawInputStream(**params)
+        self._stream.start()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='voice-listener', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """認識スレッドを止めてストリームを閉じる"""
+        if not self._running:
+            return
+        self._running = False
+        self._thread.join(timeout=2.0)
+        self._stream.close()
+
+    def _on_audio(self, indata, frames, time_info, status):
+        """PortAudio の入力コールバック: リングバッファに書き込むだけ"""
+        self.ring.write(indata)
+
+    def _accept(self, block):
+        """Vosk に音声を渡す。コピーなしで渡せない場合は bytes にコピーして AcceptWaveform を呼ぶ"""
+        if self._accept_buffer is not None:
+            return self._accept_buffer(block)
+        return self.recognizer.AcceptWaveform(bytes(block))
+
+    def get_utterance(self, silence_timeout=None):
+        """次の発話のテキストを返す
+
+        silence_timeout 秒のあいだ何も話されなければ空文字列を返す（話している間は待ち続ける）。
+        """
+        if silence_timeout is None:
+            return self._results.get()
+        start = time.monotonic()
+        while True:
+            try:
+                return self._results.get(timeout=0.1)
+            except queue.Empty:
+                if time.monotonic() - max(start, self._last_activity) > silence_timeout:
+                    return ""
+
+    def _run(self):
+        import numpy as np
+        voiced = 0
+        in_speech = False
+        while self._running:
+            block = self.ring.read(self.block_bytes, timeout=0.5)
+            if block is None:
+                continue
+            block_start = self.ring.read_pos - self.block_bytes
+
+            speaking = self.is_speaking()
+            samples = np.frombuffer(block, dtype=np.int16).astype(np.float32)
+            rms = float(np.sqrt(np.mean(samples * samples))) if len(samples) else 0.0
+            threshold = self.barge_in_threshold if speaking else self.vad_threshold
+            voiced = voiced + 1 if rms > threshold else 0
+
+            if voiced >= self.speech_blocks and not in_speech:
+                in_speech = True
+                if speaking and self.on_speech_start:
+                    # 読み上げ中の割り込み: スピーカーの音を含む認識途中の状態を捨て、
+                    # 発話の頭のブロック（リングバッファに残っている）から認識し直す
+                    self.recognizer.Reset()
+                    head = (self.speech_blocks - 1) * self.block_bytes
+                    lead = self.ring.view(block_start - head, head)
+                    if lead is not None and head:
+                        self._accept(lead)
+                if self.on_speech_start:
+                    self.on_speech_start()
+
+            # エンドポイント検知 (発話終了)
+            if self._accept(block):
+                result = json.loads(self.recognizer.Result())
+                text = result.get("text", "").strip()
+                in_speech = False
+                # 割り込みなしで読み上げ中に終わった発話は、スピーカーの音を拾ったものとみなして捨てる
+                if text and not self.is_speaking():
+                    print("■ 発話終了検知 →", text)
+                    self._results.put(text)
+            else:
+                partial = json.loads(self.recognizer.PartialResult()).get("partial", "")
+                if partial:
+                    self._last_activity = time.monotonic()
+                    if self.on_partial:
+                        self.on_partial(partial)
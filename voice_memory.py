@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# voice_memory.py
+# 音声対話エージェントの会話履歴管理:
+# Gemini のチャットセッションは毎回、それまでの履歴をすべて送り直すため、
+# 会話が長くなるほど1回の問い合わせが遅く・高くなります。
+# ConversationMemory は直近の数往復だけをそのまま送り、それより古い往復は
+# バックグラウンドで短い要約にまとめて送るので、1回あたりの入力量がほぼ一定に保たれます。
+# chats.create() で作るチャットセッションと同じく send_message / send_message_stream で使えます。
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+SUMMARY_INSTRUCTION = (
+    "以下は音声対話エージェントとユーザーの会話の記録です。"
+    "これ以降の応答に必要な情報（ユーザーの関心・質問・迷っている点・すでに伝えた内容）を"
+    "落とさずに、{max_chars}字以内の日本語で要約してください。"
+)
+
+
+class ConversationMemory:
+    """直近 window_turns 往復の履歴と、それより古い会話の要約だけを送るチャットセッション
+
+    client:        genai.Client
+    model:         応答に使うモデル
+    summary_model: 古い会話の要約に使うモデル（省略時は model）
+    config:        GenerateContentConfig に渡す残りの設定（max_output_tokens など）
+    """
+
+    def __init__(self, client, model, system_instruction, window_turns=6,
+                 summary_model=None, summary_max_chars=300, **config):
+        self.client = client
+        self.model = model
+        self.summary_model = summary_model or model
+        self.system_instruction = system_instruction
+        self.window_turns = window_turns
+        self.summary_max_chars = summary_max_chars
+        self.config = config
+        self.summary = ""      # 古い会話の要約
+        self.turns = []        # 直近の往復 [(ユーザー, エージェント)]
+        self._pending = []     # 要約待ちの往復（要約ができるまではそのまま送る）
+        self._lock = threading.Lock()
+        self._summarizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='summarizer')
+        self.usage = []        # 問い合わせごとの (入力トークン数, 出力トークン数)
+
+    def _request(self, prompt):
+        """問い合わせの contents と config を組み立てる"""
+        from google.genai import types
+        with self._lock:
+            summary = self.summary
+            turns = self._pending + self.turns
+        system_instruction = self.system_instruction
+        if summary:
+            system_instruction += f"\n【これまでの会話の要約】\n{summary}\n"
+        contents = []
+        for user_text, model_text in turns:
+            contents.append(types.Content(role='user', parts=[types.Part(text=user_text)]))
+            contents.append(types.Content(role='model', parts=[types.Part(text=model_text)]))
+        contents.append(types.Content(role='user', parts=[types.Part(text=prompt)]))
+        config = types.GenerateContentConfig(system_instruction=system_instruction, **self.config)
+        return contents, config
+
+    def send_message(self, prompt):
+        """prompt を送り、応答を返す（chat.send_message と同じ）"""
+        contents, config = self._request(prompt)
+        response = self.client.models.generate_content(model=self.model, contents=contents, config=config)
+        self._record_usage(response.usage_metadata, len(contents))
+        self._add_turn(prompt, response.text or "")
+        return response
+
+    def send_message_stream(self, prompt):
+        """prompt を送り、応答の断片を順に返す（chat.send_message_stream と同じ）
+
+        途中で読むのをやめた場合（割り込み）は、そこまでの応答を履歴に残す。
+        応答が1文字も届かなかった場合（最初の断片の前のエラーなど）は履歴に残さない。
+        """
+        contents, config = self._request(prompt)
+        parts = []
+        usage = None
+        try:
+            for chunk in self.client.models.generate_content_stream(model=self.model, contents=contents, config=config):
+                if chunk.usage_metadata:
+                    usage = chunk.usage_metadata
+                parts.append(chunk.text or "")
+                yield chunk
+        finally:
+            self._record_usage(usage, len(contents))
+            self._add_turn(prompt, ''.join(parts))
+
+    def _record_usage(self, usage, n_contents):
+        if usage is None:
+            return
+        prompt_tokens = usage.prompt_token_count or 0
+        output_tokens = usage.candidates_token_count or 0
+        self.usage.append((prompt_tokens, output_tokens))
+        print(f"\n📊 トークン数: 入力 {prompt_tokens} / 出力 {output_tokens}"
+              f"（履歴 {n_contents // 2} 往復, 要約 {len(self.summary)} 字）")
+
+    def _add_turn(self, user_text, model_text):
+        """往復を履歴に加え、窓からあふれた古い往復を要約に回す（応答が空なら加えない）"""
+        if not model_text:
+            return
+        with self._lock:
+            self.turns.append((user_text, model_text))
+            overflow = len(self.turns) - self.window_turns
+            if overflow <= 0:
+                return
+            old, self.turns = self.turns[:overflow], self.turns[overflow:]
+            self._pending.extend(old)
+        self._summarizer.submit(self._summarize)
+
+    def _summarize(self):
+        """要約待ちの往復を今の要約に畳み込む（応答とは別スレッドで実行）"""
+        with self._lock:
+            pending = list(self._pending)
+            summary = self.summary
+        if not pending:
+            return
+        lines = []
+        if summary:
+            lines.append(f"（これまでの要約）{summary}")
+        for user_text, model_text in pending:
+            lines.append(f"ユーザー: {user_text}")
+            lines.append(f"エージェント: {model_text}")
+        prompt = SUMMARY_INSTRUCTION.format(max_chars=self.summary_max_chars) + "\n\n" + "\n".join(lines)
+        try:
+            response = self.client.models.generate_content(model=self.summary_model, contents=prompt)
+        except Exception as e:
+            # 失敗したら要約待ちのまま残し、次の機会にまとめて要約する
+            print(f"会話の要約に失敗: {e}")
+            return
+        if not response.text:
+            return
+        with self._lock:
+            self.summary = response.text.strip()
+            del self._pending[:len(pending)]
+
+    def report(self):
+        """問い合わせごとのトークン数を表示"""
+        if not self.usage:
+            return
+        print("📊 問い合わせごとの入力トークン数:", ", ".join(str(p) for p, _ in self.usage))
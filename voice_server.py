@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# voice_server.py
+# 複数キオスク向けの音声対話サーバ:
+# Vosk モデルを1回だけ読み込み、KaldiRecognizer をプールして使い回しながら、
+# 各キオスクからの音声を asyncio で同時にさばきます。会話ごとに Gemini のチャットを持ち、
+# 応答は文単位に音声合成してキオスクへ送り返します。
+# キオスク側は同じスクリプトのクライアントモードで、マイク音声の送信と応答の再生を行います。
+#
+# 使い方:
+#   python voice_server.py server --port 8765 --max-sessions 8
+#   python voice_server.py client --host 192.168.0.10 --port 8765
+#   python voice_server.py client --wav sample.wav   # マイクの代わりに WAV ファイルを流す
+#
+# 通信（TCP）: 各メッセージは 種別 uint8 / 長さ uint32（リトルエンディアン）/ 本体
+#   HELLO  クライアント→サーバ: {"sample_rate": …}
+#          サーバ→クライアント: {"engine": …, "format": 音声の形式 ("mp3" / "pcm16"), "sample_rate": PCM のレート}
+#   AUDIO  クライアント→サーバ: 16bit モノラル PCM
+#   TEXT   サーバ→クライアント: {"user": 認識結果} または {"agent": 応答の1文}
+#   SPEECH サーバ→クライアント: 応答の1文の合成音声（HELLO で知らせた形式）
+#   END    クライアント→サーバ: 音声の終わり（サーバは残りの音声を認識して応答してから {"final": true} を返す）
+#          サーバ→クライアント: 1回の応答の終わり {} または最後の応答の終わり {"final": true}
+
+import argparse
+import asyncio
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+from voice_tts import SentenceSegmenter, TTSCache, make_player, make_tts_backend
+
+BASE_DIR   = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BASE_DIR, "vosk-model-small-ja-0.22")
+
+SYSTEM_INSTRUCTION = "あなたは気ままな猫です。名前はキティです。短めの応答をしてください。"
+TTS_ENGINE = "gtts"
+
+MSG_HELLO, MSG_AUDIO, MSG_TEXT, MSG_SPEECH, MSG_END = range(5)
+_HEADER = struct.Struct('<BI')
+MAX_MESSAGE_BYTES = 4 * 1024 * 1024
+
+
+async def read_message(reader):
+    """1メッセージ読み込み (種別, 本体) を返す（接続が切れたら None）"""
+    try:
+        kind, length = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+        if length > MAX_MESSAGE_BYTES:
+            raise ValueError(f"メッセージが大きすぎます: {length} bytes")
+        return kind, await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        return None
+
+
+def write_message(writer, kind, payload):
+    if isinstance(payload, dict):
+        payload = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    writer.write(_HEADER.pack(kind, len(payload)) + payload)
+
+
+class RecognizerPool:
+    """共有の Vosk モデルから作った KaldiRecognizer を使い回すプール
+
+    サンプルレートごとに返却済みの認識器を保持し、作る数は合計 size 個までに抑える。
+    """
+
+    def __init__(self, model, size):
+        self.model = model
+        self.size = size
+        self.created = 0
+        self._idle = {}  # サンプルレート → 返却済みの認識器
+        self._available = asyncio.Condition()
+
+    async def acquire(self, sample_rate):
+        from vosk import KaldiRecognizer
+        async with self._available:
+            while True:
+                idle = self._idle.get(sample_rate)
+                if idle:
+                    return idle.pop()
+                if self.created < self.size:
+                    self.created += 1
+                    return KaldiRecognizer(self.model, sample_rate)
+                if any(self._idle.values()):
+                    # 別のサンプルレートの空きを捨てて作り直す
+                    rate = next(r for r, v in self._idle.items() if v)
+                    self._idle[rate].pop()
+                    return KaldiRecognizer(self.model, sample_rate)
+                await self._available.wait()
+
+    async def release(self, recognizer, sample_rate):
+        recognizer.Reset()
+        async with self._available:
+            self._idle.setdefault(sample_rate, []).append(recognizer)
+            self._available.notify()
+
+
+class VoiceServer:
+    """キオスクからの接続ごとに VoiceSession を動かすサーバ"""
+
+    def __init__(self, max_sessions=8, workers=4):
+        self.max_sessions = max_sessions
+        self._sessions = asyncio.Semaphore(max_sessions)
+        # 認識・音声合成（CPU）と LLM の応答待ち（ネットワーク）はブロッキングなので、
+        # イベントループの外のスレッドで動かす
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='voice-cpu')
+        self.llm_executor = ThreadPoolExecutor(max_workers=max_sessions, thread_name_prefix='voice-llm')
+        self.active = 0
+
+    def load(self):
+        """Vosk モデル・Gemini クライアント・合成エンジンを読み込む（各1回だけ）"""
+        from vosk import Model
+        from google import genai
+        t0 = time.perf_counter()
+        self.model = Model(MODEL_PATH)
+        self.client = genai.Client()
+        self.backend = make_tts_backend(TTS_ENGINE)
+        self.cache = TTSCache()
+        print(f"✓ モデル読み込み完了 ({time.perf_counter() - t0:.1f}秒)")
+
+    def create_chat(self):
+        from google.genai import types
+        return self.client.chats.create(
+            model="gemini-2.0-flash",
+            config=types.GenerateContentConfig(
+                system_instruction=SYSTEM_INSTRUCTION,
+                max_output_tokens=80,
+            )
+        )
+
+    def synthesize(self, sentence, lang="ja"):
+        audio = self.cache.get(sentence, lang, self.backend.name)
+        if audio is None:
+            audio = self.backend.synthesize(sentence, lang)
+            self.cache.put(sentence, lang, self.backend.name, audio)
+        return audio
+
+    async def serve(self, host, port):
+        self.pool = RecognizerPool(self.model, self.max_sessions)
+        server = await asyncio.start_server(self._handle, host, port)
+        print(f"🎙 音声対話サーバ起動: {host}:{port} (最大{self.max_sessions}セッション)")
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        async with self._sessions:
+            self.active += 1
+            print(f"→ 接続: {peer} (稼働中 {self.active}/{self.max_sessions})")
+            try:
+                await VoiceSession(self, reader, writer, str(peer)).run()
+            except Exception as e:
+                print(f"⚠️ セッションエラー ({peer}): {e}")
+            finally:
+                self.active -= 1
+                writer.close()
+                print(f"← 切断: {peer} (稼働中 {self.active}/{self.max_sessions})")
+
+
+class VoiceSession:
+    """1台のキオスクとの会話（認識器はプールから借り、チャットは会話ごとに持つ）"""
+
+    def __init__(self, server, reader, writer, name):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.name = name
+        self.chat = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        message = await read_message(self.reader)
+        if message is None or message[0] != MSG_HELLO:
+            return
+        sample_rate = int(json.loads(message[1]).get('sample_rate', 16000))
+        backend = self.server.backend
+        write_message(self.writer, MSG_HELLO, {'engine': backend.name, 'format': backend.audio_format,
+                                               'sample_rate': getattr(backend, 'sample_rate', None)})
+
+        self.chat = await loop.run_in_executor(self.server.llm_executor, self.server.create_chat)
+        recognizer = await self.server.pool.acquire(sample_rate)
+        try:
+            await self.respond("")  # 最初の挨拶
+            while True:
+                message = await read_message(self.reader)
+                if message is None:
+                    break
+                kind, payload = message
+                if kind == MSG_END:
+                    # 音声の終わり: 認識途中の発話を確定させて応答し、最後の応答の終わりを知らせる
+                    result = await loop.run_in_executor(self.server.executor, recognizer.FinalResult)
+                    await self.reply(json.loads(result).get("text", "").strip())
+                    write_message(self.writer, MSG_END, {'final': True})
+                    await self.writer.drain()
+                    continue
+                if kind != MSG_AUDIO:
+                    continue
+                if await loop.run_in_executor(self.server.executor, recognizer.AcceptWaveform, payload):
+                    await self.reply(json.loads(recognizer.Result()).get("text", "").strip())
+        finally:
+            await self.server.pool.release(recognizer, sample_rate)
+
+    async def reply(self, text):
+        """認識できた発話をクライアントに知らせて応答する（空なら何もしない）"""
+        if not text:
+            return
+        print(f"[{self.name}] ユーザー: {text}")
+        write_message(self.writer, MSG_TEXT, {'user': text})
+        await self.respond(text)
+
+    async def respond(self, prompt):
+        """Gemini の応答をストリーミングで受け取り、文ごとに合成して送る（最後に END を送る）"""
+        loop = asyncio.get_running_loop()
+        sentences = asyncio.Queue()
+        stopped = threading.Event()
+
+        def produce():
+            try:
+                segmenter = SentenceSegmenter()
+                for chunk in self.chat.send_message_stream(prompt):
+                    if stopped.is_set():
+                        return
+                    for sentence in segmenter.feed(chunk.text or ""):
+                        loop.call_soon_threadsafe(sentences.put_nowait, sentence)
+                rest = segmenter.flush()
+                if rest:
+                    loop.call_soon_threadsafe(sentences.put_nowait, rest)
+            finally:
+                loop.call_soon_threadsafe(sentences.put_nowait, None)
+
+        producer = loop.run_in_executor(self.server.llm_executor, produce)
+        try:
+            while True:
+                sentence = await sentences.get()
+                if sentence is None:
+                    break
+                print(f"[{self.name}] エージェント: {sentence}")
+                try:
+                    audio = await loop.run_in_executor(self.server.executor, self.server.synthesize, sentence)
+                except Exception as e:
+                    # 合成できなかった文だけ飛ばし、応答の残りは続ける
+                    print(f"[{self.name}] 音声合成エラー: {e} ({sentence})")
+                    continue
+                write_message(self.writer, MSG_TEXT, {'agent': sentence})
+                write_message(self.writer, MSG_SPEECH, audio)
+                await self.writer.drain()
+        finally:
+            # 送信に失敗して抜けたときも、Gemini の応答の読み込みを打ち切る
+            stopped.set()
+        try:
+            await producer
+        except Exception as e:
+            print(f"[{self.name}] Gemini API エラー: {e}")
+        write_message(self.writer, MSG_END, {})
+        await self.writer.drain()
+
+
+async def run_client(host, port, wav_path=None, block_seconds=0.125):
+    """キオスク側: マイク（または WAV ファイル）の音声を送り、返ってきた応答を再生する"""
+    loop = asyncio.get_running_loop()
+    reader, writer = await asyncio.open_connection(host, port)
+
+    if wav_path:
+        wav = wave.open(wav_path, 'rb')
+        sample_rate = wav.getframerate()
+    else:
+        import sounddevice as sd
+        sample_rate = int(sd.query_devices(sd.default.device[0], 'input')['default_samplerate'])
+    write_message(writer, MSG_HELLO, {'sample_rate': sample_rate})
+    kind, payload = await read_message(reader)
+    hello = json.loads(payload)
+    # 合成はサーバが行うので、キオスクには送られてくる音声の形式を再生できるプレーヤーだけを用意する
+    try:
+        backend = make_player(hello['format'], hello.get('sample_rate'))
+    except (ImportError, ValueError) as e:
+        writer.close()
+        raise SystemExit(f"❌ この端末ではサーバの音声（{hello['engine']}: {hello['format']}）を再生できません: {e}")
+
+    # 応答の再生は専用スレッドで順番に行い、再生中はマイク音声を送らない（自分の声を拾わないため）
+    playback = queue.Queue()
+    playing = threading.Event()
+
+    def player():
+        while True:
+            audio = playback.get()
+            playing.set()
+            try:
+                backend.play(audio)
+            except Exception as e:
+                print(f"再生エラー: {e}")
+            finally:
+                if playback.empty():
+                    playing.clear()
+                playback.task_done()
+    threading.Thread(target=player, name='kiosk-player', daemon=True).start()
+
+    async def receive():
+        """応答を受け取り続ける（最後の応答の終わりか、接続が切れたら戻る）"""
+        while True:
+            message = await read_message(reader)
+            if message is None:
+                print("サーバとの接続が切れました")
+                return
+            kind, payload = message
+            if kind == MSG_TEXT:
+                event = json.loads(payload)
+                if 'user' in event:
+                    print(f"ユーザー: {event['user']}")
+                else:
+                    print(f"エージェント: {event['agent']}")
+            elif kind == MSG_SPEECH:
+                playing.set()
+                playback.put(payload)
+            elif kind == MSG_END and json.loads(payload).get('final'):
+                return
+
+    async def send_wav():
+        block = int(sample_rate * block_seconds)
+        while True:
+            # 応答の再生中は読み進めずに待つ（マイクと違い、捨てると WAV の発話が欠ける）
+            while playing.is_set():
+                await asyncio.sleep(block_seconds)
+            frames = wav.readframes(block)
+            if not frames:
+                break
+            write_message(writer, MSG_AUDIO, frames)
+            await writer.drain()
+            await asyncio.sleep(block_seconds)
+
+    async def send_mic():
+        import sounddevice as sd
+        blocks = asyncio.Queue(maxsize=64)
+
+        def callback(indata, frames, time_info, status):
+            if not playing.is_set():
+                data = bytes(indata)
+                loop.call_soon_threadsafe(lambda: blocks.full() or blocks.put_nowait(data))
+
+        with sd.RawInputStream(samplerate=sample_rate, blocksize=int(sample_rate * block_seconds),
+                               dtype='int16', channels=1, callback=callback):
+            print("▶ 録音中…（話し始めてください）")
+            while True:
+                write_message(writer, MSG_AUDIO, await blocks.get())
+                await writer.drain()
+
+    receiver = asyncio.create_task(receive())
+    sender = asyncio.create_task(send_wav() if wav_path else send_mic())
+    done, pending = await asyncio.wait({receiver, sender}, return_when=asyncio.FIRST_COMPLETED)
+    if sender in done and wav_path:
+        # WAV を送り終えたら音声の終わりを知らせ、最後の応答を受け取って再生し終えるまで待つ
+        write_message(writer, MSG_END, {})
+        await writer.drain()
+        await receiver
+        await loop.run_in_executor(None, playback.join)
+    for task in pending:
+        task.cancel()
+    writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='複数キオスク向けの音声対話サーバ／クライアント')
+    parser.add_argument('mode', choices=['server', 'client'], help='server: サーバ起動, client: キオスクとして接続')
+    parser.add_argument('--host', default='127.0.0.1', help='待ち受け／接続先のホスト')
+    parser.add_argument('--port', type=int, default=8765, help='ポート番号')
+    parser.add_argument('--max-sessions', type=int, default=8, help='同時に受け付けるセッション数（認識器の最大数）')
+    parser.add_argument('--workers', type=int, default=4, help='認識・音声合成に使うスレッド数（LLM の応答待ちは別に --max-sessions 本のスレッドで行う）')
+    parser.add_argument('--wav', help='（client）マイクの代わりに流す WAV ファイル（16bit モノラル）')
+    args = parser.parse_args()
+
+    try:
+        if args.mode == 'server':
+            server = VoiceServer(args.max_sessions, args.workers)
+            server.load()
+            asyncio.run(server.serve(args.host, args.port))
+        else:
+            asyncio.run(run_client(args.host, args.port, args.wav))
+    except KeyboardInterrupt:
+        print("\n=== 終了します ===")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# voice_startup.py
+# 音声対話エージェントの起動処理:
+# Vosk モデル・マイク・API クライアントなどの重い初期化を import 時ではなく起動時に、
+# バックグラウンドで並行して行い、それぞれの所要時間を記録して表示します。
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Startup:
+    """初期化処理を並行に実行し、開始からの経過時間を記録する
+
+    add() した処理はすぐにバックグラウンドで始まり、get() で完了を待って結果を受け取る。
+    """
+
+    def __init__(self, workers=4):
+        self._t0 = time.perf_counter()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='startup')
+        self._futures = {}
+        self.timings = []  # (名前, 開始時刻, 終了時刻)  いずれも起動からの秒数
+
+    def add(self, name, factory):
+        """name の初期化処理 factory() をバックグラウンドで開始"""
+        self._futures[name] = self._executor.submit(self._timed, name, factory)
+
+    def _timed(self, name, factory):
+        start = time.perf_counter() - self._t0
+        try:
+            return factory()
+        finally:
+            self.timings.append((name, start, time.perf_counter() - self._t0))
+
+    def get(self, name):
+        """name の初期化の完了を待って結果を返す（失敗していればその例外を送出）"""
+        return self._futures[name].result()
+
+    def mark(self, name):
+        """起動からの経過時間を節目として記録（「最初の発話」など）"""
+        now = time.perf_counter() - self._t0
+        self.timings.append((name, now, now))
+
+    def report(self):
+        """各処理の所要時間を表示"""
+        print("⏱ 起動時間:")
+        for name, start, end in sorted(self.timings, key=lambda t: t[2]):
+            if start == end:
+                print(f"  {name:<16} {end:6.2f}秒 経過")
+            else:
+                print(f"  {name:<16} {end - start:6.2f}秒 ({start:.2f}〜{end:.2f})")
@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# voice_tts.py
+# 音声対話エージェント共通の音声合成パイプライン:
+# 応答を文単位に分け、複数の文をワーカースレッドで並行して合成しながら、
+# 合成済みの文から順に再生します。
+# 1文目の合成が終わった時点で話し始めるので、応答全体の合成を待つ必要がありません。
+# 合成した音声は (テキスト, 言語, エンジン) ごとにキャッシュし、同じ文はすぐに再生します。
+#
+# 合成エンジン（バックエンド）は差し替え可能:
+#   "gtts"      … gTTS（要ネットワーク、MP3 を playsound で再生）
+#   "openjtalk" … pyopenjtalk によるオフライン日本語合成（PCM を sounddevice で直接再生）
+# 再生だけが必要な端末（voice_server のキオスクなど）は make_player で音声の形式に合うプレーヤーを作る。
+
+import hashlib
+import io
+import os
+import queue
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tts_cache")
+
+# 文末とみなす記号（直後の閉じ括弧も同じ文に含める）
+_SENTENCE_RE = re.compile(r'[^。！？!?\n]+(?:[。！？!?]+[」』）)]*|\n|$)')
+_CLOSING = '」』）)'
+_COMPLETE_RE = re.compile(r'[。！？!?\n][」』）)]*$')
+
+
+def split_sentences(text):
+    """日本語の文末（。！？!? 改行）で区切った文のリストを返す（空の文は除く）"""
+    return [s.strip() for s in _SENTENCE_RE.findall(text) if s.strip()]
+
+
+class SentenceSegmenter:
+    """少しずつ届くテキストから、文末まで揃った文を順に取り出す"""
+
+    def __init__(self):
+        self._buffer = ''
+
+    def feed(self, text):
+        """text を追加し、新たに完成した文のリストを返す"""
+        # 前の文に付くはずだった閉じ括弧が次の断片の先頭に来た場合は読み捨てる
+        buffer = self._buffer + text if self._buffer else text.lstrip(_CLOSING)
+        sentences = []
+        start = 0
+        for m in _SENTENCE_RE.finditer(buffer):
+            if not _COMPLETE_RE.search(m.group()):
+                break  # 文の途中で途切れている
+            if m.group().strip():
+                sentences.append(m.group().strip())
+            start = m.end()
+        self._buffer = buffer[start:]
+        return sentences
+
+    def flush(self):
+        """残りのテキストを最後の文として返す（なければ None）"""
+        rest, self._buffer = self._buffer.strip(), ''
+        return rest or None
+
+
+def _never():
+    return False
+
+
+class MP3Player:
+    """MP3 のバイト列を playsound で再生する（playsound はファイルパスしか受け付けない）"""
+    audio_format = "mp3"
+
+    def __init__(self):
+        try:
+            from playsound3 import playsound
+            self._can_stop = True  # playsound3 は block=False で停止可能な再生を返す
+        except ImportError:
+            from playsound import playsound  # playsound3 が入っていなければ従来版へフォールバック
+            self._can_stop = False
+        self._playsound = playsound
+        self._current = None
+
+    def play(self, audio, cancelled=None):
+        """再生し、終わるまで待つ
+
+        cancelled: 再生中に呼んで確かめる関数。True を返したら再生を止めて戻る
+        （stop() が再生の始まる直前に呼ばれて空振りしても、ここで止められる）
+        """
+        cancelled = cancelled or _never
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as f:
+            f.write(audio)
+            path = f.name
+        try:
+            if self._can_stop:
+                self._current = sound = self._playsound(path, block=False)
+                while sound.is_alive():
+                    if cancelled():
+                        sound.stop()
+                        break
+                    time.sleep(0.02)
+            elif not cancelled():
+                self._playsound(path)
+        finally:
+            self._current = None
+            os.remove(path)
+
+    def stop(self):
+        """再生中の音声を止める（従来版 playsound では止められない）"""
+        sound = self._current
+        if sound is not None:
+            sound.stop()
+
+
+class PCMPlayer:
+    """16bit モノラル PCM のバイト列を sounddevice で直接再生する"""
+    audio_format = "pcm16"
+
+    def __init__(self, sample_rate):
+        import numpy as np
+        import sounddevice as sd
+        self._np = np
+        self._sd = sd
+        self.sample_rate = sample_rate
+
+    def play(self, audio, cancelled=None):
+        """再生し、終わるまで待つ（cancelled は MP3Player.play と同じ）"""
+        cancelled = cancelled or _never
+        self._sd.play(self._np.frombuffer(audio, dtype=self._np.int16), self.sample_rate)
+        while self._sd.get_stream().active:
+            if cancelled():
+                self._sd.stop()
+                break
+            time.sleep(0.02)
+
+    def stop(self):
+        """再生中の音声を止める"""
+        self._sd.stop()
+
+
+def make_player(audio_format, sample_rate=None):
+    """音声の形式（"mp3" / "pcm16"）に合うプレーヤーを作る
+
+    知らない形式なら ValueError、再生に必要なライブラリがなければ ImportError。
+    """
+    if audio_format == MP3Player.audio_format:
+        return MP3Player()
+    if audio_format == PCMPlayer.audio_format:
+        if not sample_rate:
+            raise ValueError("PCM のサンプリングレートが指定されていません")
+        return PCMPlayer(sample_rate)
+    raise ValueError(f"未対応の音声形式です: {audio_format}")
+
+
+class GTTSBackend:
+    """gTTS による合成（音声は MP3 のバイト列）"""
+    name = "gtts"
+    audio_format = MP3Player.audio_format
+
+    def __init__(self):
+        from gtts import gTTS
+        self._gtts = gTTS
+        self._player = MP3Player()
+
+    def synthesize(self, text, lang="ja"):
+        """1文を合成し、MP3 のバイト列を返す"""
+        buf = io.BytesIO()
+        self._gtts(text=text, lang=lang).write_to_fp(buf)
+        return buf.getvalue()
+
+    def play(self, audio, cancelled=None):
+        """MP3 を再生し、終わるまで待つ（cancelled は MP3Player.play と同じ）"""
+        self._player.play(audio, cancelled)
+
+    def stop(self):
+        self._player.stop()
+
+
+class OpenJTalkBackend:
+    """pyopenjtalk によるオフライン合成（音声は 16bit モノラル PCM のバイト列）
+
+    ネットワークにも一時ファイルにも依存せず、合成時間はローカルの CPU だけで決まる。
+    """
+    name = "openjtalk"
+    audio_format = PCMPlayer.audio_format
+    sample_rate = 48000  # pyopenjtalk.tts の出力レート
+
+    def __init__(self):
+        import numpy as np
+        import pyopenjtalk
+        self._np = np
+        self._pyopenjtalk = pyopenjtalk
+        self._player = PCMPlayer(self.sample_rate)
+        self._lock = threading.Lock()  # pyopenjtalk はスレッドセーフではない
+
+    def synthesize(self, text, lang="ja"):
+        """1文を合成し、PCM のバイト列を返す（日本語のみ対応のため lang は無視）"""
+        with self._lock:
+            wave, sample_rate = self._pyopenjtalk.tts(text)
+        if sample_rate != self.sample_rate:
+            raise ValueError(f"想定外のサンプリングレートです: {sample_rate}")
+        return self._np.clip(wave, -32768, 32767).astype(self._np.int16).tobytes()
+
+    def play(self, audio, cancelled=None):
+        """PCM を再生し、終わるまで待つ（cancelled は MP3Player.play と同じ）"""
+        self._player.play(audio, cancelled)
+
+    def stop(self):
+        self._player.stop()
+
+
+TTS_BACKENDS = {
+    GTTSBackend.name: GTTSBackend,
+    OpenJTalkBackend.name: OpenJTalkBackend,
+}
+
+
+def make_tts_backend(name="gtts"):
+    """名前から合成バックエンドを作る。必要なライブラリがなければ gTTS に切り替える"""
+    try:
+        return TTS_BACKENDS[name]()
+    except ImportError as e:
+        if name == GTTSBackend.name:
+            raise
+        print(f"⚠️ 音声合成エンジン {name} を使えません ({e})。gTTS を使用します。")
+        return GTTSBackend()
+
+
+class TTSCache:
+    """合成済み音声のキャッシュ（メモリとディスクの2段、どちらも容量上限つき LRU）
+
+    キーは (テキスト, 言語, エンジン名)。ディスク上のファイルは最終利用時刻（mtime）の古い順に消す。
+    ディスクの容量確認はディレクトリ全体を見るので、evict_interval 回の保存ごとに1スレッドだけが行う
+    （その間は上限を少し超えることがある）。キャッシュの読み書きの失敗で音声を失うことはない。
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_memory_bytes=8 * 1024 * 1024,
+                 max_disk_bytes=64 * 1024 * 1024, evict_interval=16):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.evict_interval = evict_interval
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self._puts = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(text, lang, engine):
+        return hashlib.sha256(f"{engine}\n{lang}\n{text}".encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".audio")
+
+    def get(self, text, lang, engine):
+        """キャッシュ済みの音声を返す（なければ None）"""
+        key = self.key(text, lang, engine)
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return audio
+        if self.directory:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    audio = f.read()
+                os.utime(path)  # 最終利用時刻を更新
+            except OSError:
+                audio = None
+        with self._lock:
+            if audio is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, audio)
+        return audio
+
+    def put(self, text, lang, engine, audio):
+        """音声をメモリとディスクに保存（ディスクへの書き込みに失敗しても例外は出さない）"""
+        key = self.key(text, lang, engine)
+        with self._lock:
+            self._remember(key, audio)
+            self._puts += 1
+            evict = self._puts % self.evict_interval == 0
+        if not self.directory:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"音声キャッシュの保存に失敗: {e}")
+            return
+        # 別のスレッドが容量を確認中なら任せる
+        if evict and self._evict_lock.acquire(blocking=False):
+            try:
+                self._evict_disk()
+            finally:
+                self._evict_lock.release()
+
+    def _remember(self, key, audio):
+        if len(audio) > self.max_memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _evict_disk(self):
+        entries = []
+        total = 0
+        try:
+            scanned = list(os.scandir(self.directory))
+        except OSError as e:
+            print(f"音声キャッシュの容量確認に失敗: {e}")
+            return
+        for entry in scanned:
+            if not entry.name.endswith(".audio"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # 一覧を取った後に消えたファイル
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+class SpeechPipeline:
+    """文単位の並行合成と順序どおりの再生を行うパイプライン
+
+    speak() は合成を依頼してすぐに戻り、say() は再生が終わるまで待つ。
+    再生キューには合成中の Future を積むので、後の文の合成が先に終わっても順序は崩れない。
+    backend には合成バックエンドかその名前を渡す（省略時は gTTS）。
+    cache (TTSCache) を渡すと、合成済みの文は合成せずに再生する。
+    cancel() は再生中の文を止め、まだ再生していない文と読み込み中のストリームを破棄する（割り込み用）。
+    """
+
+    def __init__(self, backend=None, workers=3, lang="ja", cache=None):
+        if backend is None or isinstance(backend, str):
+            backend = make_tts_backend(backend or GTTSBackend.name)
+        self.backend = backend
+        self.lang = lang
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tts')
+        self._queue = queue.Queue()
+        self._generation = 0  # cancel() のたびに増やし、それ以前に積んだ文を無効にする
+        self._player = threading.Thread(target=self._run, name='tts-player', daemon=True)
+        self._player.start()
+
+    @property
+    def speaking(self):
+        """再生中または再生待ちの文があるか"""
+        return self._queue.unfinished_tasks > 0
+
+    def speak(self, text, lang=None, generation=None):
+        """text を文に分けて合成を依頼し、再生キューに積む（即座に戻る）
+
+        generation: 呼び出し側が取っておいた世代。その後 cancel() されていれば何も積まない
+        """
+        if generation is None:
+            generation = self._generation
+        elif generation != self._generation:
+            return
+        for sentence in split_sentences(text):
+            future = self._executor.submit(self._synthesize, sentence, lang or self.lang)
+            self._queue.put((generation, sentence, future))
+
+    def cancel(self):
+        """再生を止め、再生待ちの文と speak_stream の読み込みを打ち切る"""
+        self._generation += 1
+        while True:
+            try:
+                _, _, future = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            future.cancel()
+            self._queue.task_done()
+        stop = getattr(self.backend, 'stop', None)
+        if stop:
+            stop()
+
+    def warm(self, texts, lang=None):
+        """決まり文句を前もって合成してキャッシュに入れておく（即座に戻る）"""
+        if self.cache is None:
+            return
+        for text in texts:
+            for sentence in split_sentences(text):
+                self._executor.submit(self._synthesize, sentence, lang or self.lang)
+
+    def _synthesize(self, sentence, lang):
+        if self.cache is None:
+            return self.backend.synthesize(sentence, lang)
+        audio = self.cache.get(sentence, lang, self.backend.name)
+        if audio is None:
+            audio = self.backend.synthesize(sentence, lang)
+            self.cache.put(sentence, lang, self.backend.name, audio)
+        return audio
+
+    def speak_stream(self, chunks, lang=None, on_text=None):
+        """ストリーミングで届くテキスト断片を、文がそろうたびに合成へ回す
+
+        chunks の読み取りと並行して再生が進む。on_text が与えられれば断片ごとに呼ぶ。
+        返り値は応答の全文（再生の完了は待たない）。途中で cancel() されたらそこまでの文を返す。
+        """
+        generation = self._generation
+        segmenter = SentenceSegmenter()
+        parts = []
+        for chunk in chunks:
+            if generation != self._generation:
+                # 割り込まれたので残りの生成は読まない
+                close = getattr(chunks, 'close', None)
+                if close:
+                    close()
+                return ''.join(parts)
+            if not chunk:
+                continue
+            parts.append(chunk)
+            if on_text:
+                on_text(chunk)
+            for sentence in segmenter.feed(chunk):
+                self.speak(sentence, lang, generation)
+        rest = segmenter.flush()
+        if rest:
+            self.speak(rest, lang, generation)
+        return ''.join(parts)
+
+    def wait(self):
+        """キューに積んだ文をすべて再生し終えるまで待つ"""
+        self._queue.join()
+
+    def say(self, text, lang=None):
+        """text を話し終えるまで待つ（speak_gtts の置き換え）"""
+        self.speak(text, lang)
+        self.wait()
+
+    def _run(self):
+        while True:
+            generation, sentence, future = self._queue.get()
+            try:
+                audio = future.result()
+                if generation == self._generation:
+                    # 確かめてから再生が始まるまでの間に cancel() されても、再生中に気づいて止める
+                    self.backend.play(audio, cancelled=lambda: generation != self._generation)
+            except Exception as e:
+                print(f"音声合成エラー: {e} ({sentence})")
+            finally:
+                self._queue.task_done()